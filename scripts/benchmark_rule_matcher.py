@@ -0,0 +1,67 @@
+"""
+Benchmark for the compiled plan rule matcher against a per-rule keyword scan.
+Generates a synthetic rulebook, so the graph files are not needed.
+
+    python scripts/benchmark_rule_matcher.py --rules 100,1000,5000 --words 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "webapp"))
+
+from rule_matcher import RuleMatcher, keywords, words
+
+
+def synthetic_rulebook(count, vocabulary, rng):
+    concepts = [{"id": f"C_{i}", "name": " ".join(rng.sample(vocabulary, 3)),
+                 "description": " ".join(rng.sample(vocabulary, 12))} for i in range(count // 2)]
+    rules = [{"id": f"R_{i}", "rule": " ".join(rng.sample(vocabulary, 10)),
+              "applies_to": f"C_{rng.randrange(max(1, count // 2))}"} for i in range(count - count // 2)]
+    return concepts, rules
+
+
+def naive_match(concepts, rules, text):
+    # one substring scan per keyword per rule, as check_plan used to do
+    text = " ".join(words(text))
+    hits = 0
+    for item in concepts + rules:
+        found = [k for k in keywords(item.get("name", item.get("rule", ""))) if k in text]
+        hits += len(found) >= 2
+    return hits
+
+
+def timed(label, fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", default="100,1000,5000", help="comma-separated rulebook sizes")
+    parser.add_argument("--words", type=int, default=2000, help="length of the checked text")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = [f"term{i}" for i in range(args.vocabulary)]
+    text = " ".join(rng.choice(vocabulary) for _ in range(args.words))
+
+    for count in [int(n) for n in args.rules.split(",")]:
+        concepts, rules = synthetic_rulebook(count, vocabulary, rng)
+        start = time.perf_counter()
+        matcher = RuleMatcher(concepts, rules, feedback=[])
+        print(f"\n{count} rules/concepts (compiled in {time.perf_counter() - start:.3f}s)")
+        timed("compiled matcher", lambda: matcher.match(text), args.repeat)
+        timed("per-rule keyword scan", lambda: naive_match(concepts, rules, text), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
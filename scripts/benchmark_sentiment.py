@@ -0,0 +1,56 @@
+"""
+Offline benchmark for the sentiment cache, single-flight coalescing and batch mode.
+Uses the local stand-in backend, so no network access or API key is needed.
+
+    python scripts/benchmark_sentiment.py --pairs 20 --latency 0.5
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "webapp"))
+
+from sentiment_agent import LocalBackend, get_live_sentiment, get_live_sentiment_batch, set_backend
+
+PAIRS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "NZDUSD", "USDCAD", "USDCHF", "EURGBP",
+         "EURJPY", "GBPJPY", "AUDJPY", "EURAUD", "EURCHF", "GBPCHF", "CADJPY", "CHFJPY",
+         "AUDNZD", "NZDJPY", "GBPAUD", "EURCAD", "AUDCAD", "GBPCAD", "EURNZD", "GBPNZD"]
+
+
+def timed(label, backend, fn):
+    calls_before = backend.calls
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.3f}s  backend calls: {backend.calls - calls_before}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated model latency in seconds")
+    parser.add_argument("--viewers", type=int, default=8, help="concurrent views of the same pair")
+    args = parser.parse_args()
+
+    pairs = PAIRS[:args.pairs]
+    backend = LocalBackend(latency=args.latency)
+
+    set_backend(backend)
+    timed(f"sequential, cold ({len(pairs)} pairs)", backend, lambda: [get_live_sentiment(p) for p in pairs])
+    timed(f"sequential, warm ({len(pairs)} pairs)", backend, lambda: [get_live_sentiment(p) for p in pairs])
+
+    set_backend(backend)
+    with ThreadPoolExecutor(max_workers=args.viewers) as pool:
+        timed(f"{args.viewers} concurrent views of one pair", backend,
+              lambda: list(pool.map(get_live_sentiment, ["EURUSD"] * args.viewers)))
+
+    set_backend(backend)
+    timed(f"batch, cold ({len(pairs)} pairs)", backend, lambda: get_live_sentiment_batch(pairs))
+    timed(f"batch, warm ({len(pairs)} pairs)", backend, lambda: get_live_sentiment_batch(pairs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Stand-in for the Client Portal websocket, for running the market data stream
+without a gateway. Speaks just enough of the protocol: 'smd+<conid>+{...}' and
+'umd+<conid>+{}' subscriptions, 'sor+{}' order updates and 'tic' heartbeats,
+answering with random-walk quotes and order status changes. Standard library only.
+
+    python scripts/ws_standin_server.py --port 8765 --rate 5
+    MARKET_STREAM_URL=ws://localhost:8765/v1/api/ws python3 -m flask run
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import struct
+import time
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+ORDER_STATUSES = ["PreSubmitted", "Submitted", "Filled", "Cancelled"]
+
+
+async def read_frame(reader):
+    """
+    Read one client frame. Returns (opcode, payload).
+    """
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b"\0\0\0\0"
+    payload = bytearray(await reader.readexactly(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def frame(payload, opcode=0x1):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class Session:
+    def __init__(self, writer, rate):
+        self.writer = writer
+        self.rate = rate
+        self.conids = {}
+        self.orders = False
+        self.order_state = {}
+
+    def send(self, message):
+        self.writer.write(frame(json.dumps(message)))
+
+    def handle(self, text):
+        if text.startswith("smd+"):
+            conid = text.split("+")[1]
+            self.conids.setdefault(conid, random.uniform(20, 500))
+        elif text.startswith("umd+"):
+            self.conids.pop(text.split("+")[1], None)
+        elif text.startswith("sor+"):
+            self.orders = True
+            self.order_state = {str(1000 + i): 0 for i in range(3)}
+        elif text == "tic":
+            self.send({"topic": "system", "hb": int(time.time() * 1000)})
+
+    async def publish(self):
+        while True:
+            await asyncio.sleep(1.0 / self.rate)
+            now = int(time.time() * 1000)
+            for conid, price in list(self.conids.items()):
+                price = max(0.01, price * (1 + random.gauss(0, 0.001)))
+                self.conids[conid] = price
+                spread = price * 0.0002
+                self.send({"topic": f"smd+{conid}", "conid": int(conid), "_updated": now,
+                           "31": f"{price:.2f}", "84": f"{price - spread:.2f}", "86": f"{price + spread:.2f}",
+                           "88": str(random.randint(1, 50) * 100), "85": str(random.randint(1, 50) * 100),
+                           "7059": str(random.randint(1, 20) * 100)})
+            if self.orders and self.order_state and random.random() < 0.2:
+                order_id = random.choice(list(self.order_state))
+                self.order_state[order_id] = min(self.order_state[order_id] + 1, len(ORDER_STATUSES) - 1)
+                self.send({"topic": "sor", "args": [{"orderId": int(order_id),
+                                                     "status": ORDER_STATUSES[self.order_state[order_id]]}]})
+            await self.writer.drain()
+
+
+async def handle_client(reader, writer, rate):
+    request = await reader.readuntil(b"\r\n\r\n")
+    headers = {}
+    for line in request.decode(errors="replace").split("\r\n")[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest())
+    writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+    await writer.drain()
+
+    session = Session(writer, rate)
+    session.send({"topic": "system", "success": "standin"})
+    publisher = asyncio.ensure_future(session.publish())
+    try:
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == 0x8:
+                writer.write(frame(b"", 0x8))
+                break
+            if opcode == 0x9:
+                writer.write(frame(payload, 0xA))
+            elif opcode == 0x1:
+                session.handle(payload.decode(errors="replace"))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        publisher.cancel()
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=5, help="quote updates per second per conid")
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(lambda r, w: handle_client(r, w, args.rate), args.host, args.port)
+    print(f"Stand-in websocket listening on ws://{args.host}:{args.port}/v1/api/ws")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,11 +6,21 @@ cd gateway && sh bin/run.sh root/conf.yaml &
 # Wait for Gateway to start
 sleep 5
 
-# Start Flask application
 cd /app/webapp
-export FLASK_APP=app.py
-export FLASK_DEBUG=1
 export FLASK_PORT=5056
 
-# Start Flask application
-python3 -m flask run --host=0.0.0.0 --port=${FLASK_PORT}
\ No newline at end of file
+# SERVE_MODE=asgi (default) runs the async routes under uvicorn;
+# SERVE_MODE=flask runs the Flask development server with the debugger
+SERVE_MODE=${SERVE_MODE:-asgi}
+
+if [ "${SERVE_MODE}" = "flask" ]; then
+    export FLASK_APP=app.py
+    export FLASK_DEBUG=1
+    python3 -m flask run --host=0.0.0.0 --port=${FLASK_PORT}
+else
+    # A single process on purpose: the IB connection (one client id), the order
+    # handle registry, the bar and drawdown files, the market data websocket and
+    # the metrics registry all live in module-level singletons. Concurrency comes
+    # from the event loop and the Flask thread pool, not from extra processes.
+    python3 -m uvicorn asgi:app --host 0.0.0.0 --port ${FLASK_PORT} --workers 1
+fi
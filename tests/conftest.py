@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# the webapp modules import each other by bare name, as when run from webapp/
+sys.path.insert(0, str(ROOT / "webapp"))
+sys.path.insert(0, str(ROOT / "scripts"))
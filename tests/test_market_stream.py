@@ -0,0 +1,156 @@
+"""
+Market data stream against the stand-in websocket server in scripts/.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import market_stream
+import ws_standin_server as standin
+from market_stream import MarketStream
+
+
+class FakeGateway:
+    """
+    Answers the /tickle the stream sends on connect.
+    """
+
+    class Response:
+        def json(self):
+            return {"session": "test-session"}
+
+    def post(self, path, **kwargs):
+        return self.Response()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """
+    Stand-in server on a free port, run on its own event loop thread.
+    Yields (url, sessions) where sessions fills with every client connection.
+    """
+    sessions = []
+
+    class RecordingSession(standin.Session):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            sessions.append(self)
+
+    monkeypatch.setattr(standin, "Session", RecordingSession)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def serve():
+        state["server"] = await asyncio.start_server(lambda r, w: standin.handle_client(r, w, 100),
+                                                     "127.0.0.1", 0)
+        started.set()
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    assert started.wait(5)
+    port = state["server"].sockets[0].getsockname()[1]
+    yield f"ws://127.0.0.1:{port}/v1/api/ws", sessions
+
+    async def shutdown():
+        state["server"].close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture
+def stream(server, monkeypatch):
+    monkeypatch.setattr(market_stream, "SSE_KEEPALIVE", 0.2)
+    url, _ = server
+    stream = MarketStream(url=url, ring_size=16, client=FakeGateway())
+    yield stream
+    stream.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def tick_conids(events, count):
+    """
+    conids of the next ``count`` tick events, skipping keep-alives.
+    """
+    conids = []
+    deadline = time.monotonic() + 5
+    while len(conids) < count and time.monotonic() < deadline:
+        event = next(events)
+        if event.startswith("event: tick"):
+            conids.append(market_stream.json.loads(event.split("data: ", 1)[1])["conid"])
+    return conids
+
+
+def test_tick_ring_keeps_the_latest_ticks_in_order():
+    ring = market_stream.TickRing(size=4)
+    for t in range(10):
+        ring.append({"t": t, "last": float(t)})
+    assert list(ring.last()["t"]) == [6, 7, 8, 9]
+    assert list(ring.last(2)["last"]) == [8.0, 9.0]
+
+
+def test_ticks_fan_out_to_every_subscriber_and_fill_the_ring(stream):
+    first = stream.events(["1001"])
+    second = stream.events(["1001", "1002"])
+
+    assert set(tick_conids(first, 10)) == {"1001"}
+    assert set(tick_conids(second, 20)) == {"1001", "1002"}
+
+    ticks = stream.ticks("1001")
+    assert 0 < len(ticks) <= 16
+    assert ticks[-1]["last"] is not None
+    assert [tick["t"] for tick in ticks] == sorted(tick["t"] for tick in ticks)
+    first.close()
+    second.close()
+
+
+def test_last_subscriber_leaving_unsubscribes_the_conid(stream, server):
+    _, sessions = server
+    first = stream.events(["1001"])
+    second = stream.events(["1001"])
+    tick_conids(first, 1)
+    tick_conids(second, 1)
+    assert wait_for(lambda: sessions and "1001" in sessions[-1].conids)
+
+    first.close()
+    time.sleep(0.2)
+    assert "1001" in sessions[-1].conids
+
+    second.close()
+    assert wait_for(lambda: "1001" not in sessions[-1].conids)
+    assert stream.latest("1001") is None
+
+
+def heartbeat_threads():
+    return {t for t in threading.enumerate() if t.name == "market-stream-heartbeat"}
+
+
+def test_restarting_the_stream_keeps_one_heartbeat(stream):
+    # streams stopped by earlier tests may still have a heartbeat asleep
+    before = heartbeat_threads()
+    stream.start()
+    assert wait_for(stream.is_connected)
+    stream.stop()
+    assert wait_for(lambda: not stream._thread.is_alive())
+    stream.start()
+    stream.start()
+    assert len(heartbeat_threads() - before) == 1
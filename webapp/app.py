@@ -1,27 +1,42 @@
-import requests, time, os, random
-from flask import Flask, render_template, request, redirect
-from graph_loader import load_graph_data
-from broker_data import get_total_exposure_by_asset, get_drawdown
+import time, os, random
+from flask import Flask, render_template, stream_template, request, redirect, jsonify, Response, stream_with_context
+from gateway_client import gateway
+from gateway_session import gateway_session
+from symbol_resolver import resolver
+from scanner_params import scanner_params
+from graph_loader import load_graph_data, get_graph
+from broker_data import get_positions, get_drawdown, get_fx_rates
+from risk_engine import assess
+from rule_matcher import get_matcher
+from bar_store import bar_store
+from indicators import indicator_engine
+from market_stream import market_stream
+from market_snapshot import snapshots
+from position_loader import position_loader
+from pagination import paginate, page_args, page_info
 from dotenv import load_dotenv
 from pair_context import get_pair_context
+from sentiment_agent import get_live_sentiment_batch
+from drawdown_store import drawdown_store, parse_window, HISTORY_MAX_POINTS
+from order_status import order_registry
+from gateway_orders import place_orders_batch
+import metrics
+import page_data
 
 # Load environment variables
 load_dotenv()
 
-# disable warnings until you install a certificate
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-
 # Get configuration from environment variables
 ACCOUNT_ID = os.getenv('IBKR_ACCOUNT_ID', 'DU123456')  # Default value as fallback
-GATEWAY_PORT = os.getenv('GATEWAY_PORT', '5055')  # IB Gateway port
 FLASK_PORT = os.getenv('FLASK_PORT', '5056')  # Flask server port
 
-BASE_API_URL = f"https://localhost:{GATEWAY_PORT}/v1/api"
-
 os.environ['PYTHONHTTPSVERIFY'] = '0'
 
 app = Flask(__name__)
+metrics.instrument_flask(app)
+
+# Keep the gateway session alive and watch its auth status in the background
+gateway_session.start()
 
 @app.template_filter('ctime')
 def timectime(s):
@@ -31,18 +46,31 @@ def timectime(s):
 @app.route("/")
 def dashboard():
     try:
-        r = requests.get(f"{BASE_API_URL}/portfolio/accounts", verify=False)
-        accounts = r.json()
+        accounts = gateway.get_json("/portfolio/accounts")
+        account_id = page_data.primary_account_id(accounts)
     except Exception as e:
-        return 'Make sure you authenticate first then visit this page. <a href="https://localhost:5055">Log in</a>'
+        # let the session manager notice the lapsed session right away
+        gateway_session.check_now()
+        return page_data.LOGIN_PROMPT
 
-    account = accounts[0]
+    summary = gateway.get_json(f"/portfolio/{account_id}/summary")
+
+    return render_template("dashboard.html", **page_data.dashboard_context(accounts, summary))
+
+
+@app.route("/session/status")
+def session_status():
+    return jsonify(gateway_session.status())
 
-    account_id = accounts[0]["id"]
-    r = requests.get(f"{BASE_API_URL}/portfolio/{account_id}/summary", verify=False)
-    summary = r.json()
-    
-    return render_template("dashboard.html", account=account, summary=summary)
+
+@app.route("/pacing/status")
+def pacing_status():
+    return jsonify(gateway.pacer.stats())
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/lookup")
@@ -51,10 +79,7 @@ def lookup():
     stocks = []
 
     if symbol is not None:
-        r = requests.get(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true", verify=False)
-
-        response = r.json()
-        stocks = response
+        stocks = resolver.search(symbol)
 
     return render_template("lookup.html", stocks=stocks)
 
@@ -67,38 +92,74 @@ def contract(contract_id, period='5d', bar='1d'):
         ]
     }
     
-    r = requests.post(f"{BASE_API_URL}/trsrv/secdef", data=data, verify=False)
-    contract = r.json()['secdef'][0]
+    contract = gateway.post_json("/trsrv/secdef", data=data)['secdef'][0]
+
+    # Served from the local bar store, which only fetches bars it doesn't have yet;
+    # only the requested page of bars is copied out of it
+    page, per_page = page_args()
+    price_history = bar_store.get_history(contract_id, period, bar, newest_first=True,
+                                          offset=(page - 1) * per_page, limit=per_page)
+    pagination = page_info(price_history["total"], page, per_page)
+    try:
+        indicators = indicator_engine.compute(contract_id, period, bar, last=1)["latest"]
+    except Exception as e:
+        print(f"Error computing indicators for {contract_id}: {str(e)}")
+        indicators = {}
 
-    r = requests.get(f"{BASE_API_URL}/iserver/marketdata/history?conid={contract_id}&period={period}&bar={bar}", verify=False)
-    price_history = r.json()
+    return Response(stream_with_context(stream_template("contract.html", price_history=price_history, contract=contract,
+                                                        indicators=indicators, pagination=pagination)))
 
-    return render_template("contract.html", price_history=price_history, contract=contract)
+
+@app.route("/indicators/<contract_id>")
+def indicators(contract_id):
+    period = request.args.get("period", "365d")
+    bar = request.args.get("bar", "1d")
+    last = request.args.get("last", type=int)
+    try:
+        return jsonify(indicator_engine.compute(contract_id, period, bar, last=last))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error computing indicators for {contract_id}: {str(e)}")
+        return jsonify({"error": "Failed to load price history"}), 502
+
+
+@app.route("/indicators")
+def indicator_screen():
+    conids = [c for c in request.args.get("conids", "").split(",") if c.strip()]
+    if not conids:
+        return jsonify({"error": "conids is required"}), 400
+    period = request.args.get("period", "365d")
+    bar = request.args.get("bar", "1d")
+    return jsonify(indicator_engine.screen([c.strip() for c in conids], period, bar))
+
+
+@app.route("/stream")
+def stream():
+    # One upstream websocket, fanned out to every open page as Server-Sent Events
+    conids = [c.strip() for c in request.args.get("conids", "").split(",") if c.strip()]
+    orders = request.args.get("orders") == "1"
+    return Response(stream_with_context(market_stream.events(conids, orders=orders)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/stream/ticks/<contract_id>")
+def stream_ticks(contract_id):
+    n = request.args.get("n", type=int)
+    return jsonify(market_stream.ticks(contract_id, n))
 
 
 @app.route("/orders")
 def orders():
     try:
-        r = requests.get(f"{BASE_API_URL}/iserver/account/orders", verify=False)
-        
-        # If there are no orders, IB Gateway returns an empty response
-        if not r.content:
-            return render_template("orders.html", orders=[])
-            
-        # If we have content, try to parse it
-        try:
-            data = r.json()
-            # IB Gateway might return an empty array for no orders
-            if isinstance(data, list):
-                return render_template("orders.html", orders=data)
-            # Or it might return an object with orders key
-            return render_template("orders.html", orders=data.get("orders", []))
-        except:
-            # If JSON parsing fails, assume no orders
-            return render_template("orders.html", orders=[])
+        orders = page_data.parse_orders(gateway.get("/iserver/account/orders"))
     except Exception as e:
         print(f"Error fetching orders: {str(e)}")
-        return render_template("orders.html", orders=[], error="Failed to fetch orders. Please ensure you are logged in to IB Gateway")
+        return render_template("orders.html", orders=[], error=page_data.ORDERS_ERROR)
+
+    orders, pagination = paginate(orders)
+    return Response(stream_with_context(stream_template("orders.html", orders=orders, pagination=pagination)))
 
 
 @app.route("/order", methods=['POST'])
@@ -118,54 +179,71 @@ def place_order():
         ]
     }
 
-    r = requests.post(f"{BASE_API_URL}/iserver/account/{ACCOUNT_ID}/orders", json=data, verify=False)
+    r = gateway.post(f"/iserver/account/{ACCOUNT_ID}/orders", json=data)
+    gateway.invalidate("/portfolio/")
 
     return redirect("/orders")
 
+@app.route("/orders/batch", methods=['POST'])
+def place_orders():
+    # JSON body: {"orders": [{conid, side, quantity, orderType, price, auxPrice, tif, bracket}, ...]}
+    specs = (request.get_json(silent=True) or {}).get("orders", [])
+    if not specs:
+        return jsonify({"error": "No orders supplied"}), 400
+
+    submitted, results = place_orders_batch(ACCOUNT_ID, specs)
+    return jsonify({"submitted": submitted, "results": results}), (200 if submitted else 400)
+
 @app.route("/orders/<order_id>/cancel")
 def cancel_order(order_id):
-    cancel_url = f"{BASE_API_URL}/iserver/account/{ACCOUNT_ID}/order/{order_id}" 
-    r = requests.delete(cancel_url, verify=False)
+    r = gateway.delete(f"/iserver/account/{ACCOUNT_ID}/order/{order_id}")
+    gateway.invalidate("/portfolio/")
 
     return r.json()
 
 
+@app.route("/orders/status/<handle>")
+def order_status(handle):
+    # ?version=N long-polls until the handle changes past version N (up to ?wait seconds)
+    since = request.args.get("version", type=int)
+    if since is None:
+        status = order_registry.get(handle)
+    else:
+        status = order_registry.wait(handle, since, timeout=min(request.args.get("wait", 25, type=float), 60))
+    if status is None:
+        return jsonify({"error": f"Unknown order handle {handle}"}), 404
+    return jsonify(status)
+
+
 @app.route("/portfolio")
 def portfolio():
-    r = requests.get(f"{BASE_API_URL}/portfolio/{ACCOUNT_ID}/positions/0", verify=False)
+    positions, pagination = paginate(position_loader.load(ACCOUNT_ID))
+    # one batched snapshot for every row on the page instead of a request per position
+    quotes = snapshots.get([item.get('conid') for item in positions], fields=("last",))
 
-    if r.content:
-        positions = r.json()
-    else:
-        positions = []
-
-    # return my positions, how much cash i have in this account
-    return render_template("portfolio.html", positions=positions)
+    # return my positions, how much cash i have in this account; rows are sent as they render
+    return Response(stream_with_context(stream_template("portfolio.html", positions=positions, quotes=quotes,
+                                                        pagination=pagination)))
 
 @app.route("/watchlists")
 def watchlists():
-    r = requests.get(f"{BASE_API_URL}/iserver/watchlists", verify=False)
+    watchlist_data = gateway.get_json("/iserver/watchlists")
 
-    watchlist_data = r.json()["data"]
-    watchlists = []
-    if "user_lists" in watchlist_data:
-        watchlists = watchlist_data["user_lists"]
-        
-    return render_template("watchlists.html", watchlists=watchlists)
+    return render_template("watchlists.html", **page_data.watchlists_context(watchlist_data))
 
 
 @app.route("/watchlists/<int:id>")
 def watchlist_detail(id):
-    r = requests.get(f"{BASE_API_URL}/iserver/watchlist?id={id}", verify=False)
-
-    watchlist = r.json()
+    watchlist = gateway.get_json("/iserver/watchlist", default={}, params={"id": id})
+    quotes = snapshots.get(page_data.watchlist_conids(watchlist))
 
-    return render_template("watchlist.html", watchlist=watchlist)
+    return render_template("watchlist.html", **page_data.watchlist_context(watchlist, quotes))
 
 
 @app.route("/watchlists/<int:id>/delete")
 def watchlist_delete(id):
-    r = requests.delete(f"{BASE_API_URL}/iserver/watchlist?id={id}", verify=False)
+    r = gateway.delete("/iserver/watchlist", params={"id": id})
+    gateway.invalidate("/iserver/watchlist")
 
     return redirect("/watchlists")
 
@@ -174,14 +252,11 @@ def create_watchlist():
     data = request.get_json()
     name = data['name']
 
-    rows = []
-    symbols = data['symbols'].split(",")
-    for symbol in symbols:
-        symbol = symbol.strip()
-        if symbol:
-            r = requests.get(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true&secType=STK", verify=False)
-            contract_id = r.json()[0]['conid']
-            rows.append({"C": contract_id})
+    resolved, failed = resolver.resolve(data['symbols'].split(","), sec_type="STK")
+    if not resolved:
+        return jsonify({"error": "None of the symbols could be resolved", "failed": failed}), 400
+
+    rows = [{"C": contract_id} for contract_id in resolved.values()]
 
     data = {
         "id": int(time.time()),
@@ -189,17 +264,20 @@ def create_watchlist():
         "rows": rows
     }
 
-    r = requests.post(f"{BASE_API_URL}/iserver/watchlist", json=data, verify=False)
-    
+    r = gateway.post("/iserver/watchlist", json=data)
+    gateway.invalidate("/iserver/watchlist")
+
+    if failed:
+        return jsonify({"id": data["id"], "resolved": resolved, "failed": failed})
+
     return redirect("/watchlists")
 
 @app.route("/scanner")
 def scanner():
     try:
-        r = requests.get(f"{BASE_API_URL}/iserver/scanner/params", verify=False)
-        params = r.json()
-        
-        if 'error' in params:
+        try:
+            index = scanner_params.get()
+        except RuntimeError:
             return render_template("scanner.html", 
                                 error="Scanner not available. Please ensure you are connected to TWS or IB Gateway.",
                                 params={}, 
@@ -207,40 +285,6 @@ def scanner():
                                 filter_map={}, 
                                 scan_results=[])
 
-        scanner_map = {}
-        filter_map = {}
-
-        # Only process these if they exist in the response
-        if 'instrument_list' in params:
-            for item in params['instrument_list']:
-                scanner_map[item['type']] = {
-                    "display_name": item['display_name'],
-                    "filters": item['filters'],
-                    "sorts": []
-                }
-
-        if 'filter_list' in params:
-            for item in params['filter_list']:
-                filter_map[item['group']] = {
-                    "display_name": item['display_name'],
-                    "type": item['type'],
-                    "code": item['code']
-                }
-
-        if 'scan_type_list' in params:
-            for item in params['scan_type_list']:
-                for instrument in item['instruments']:
-                    if instrument in scanner_map:
-                        scanner_map[instrument]['sorts'].append({
-                            "name": item['display_name'],
-                            "code": item['code']
-                        })
-
-        if 'location_tree' in params:
-            for item in params['location_tree']:
-                if item['type'] in scanner_map:
-                    scanner_map[item['type']]['locations'] = item['locations']
-
         submitted = request.args.get("submitted", "")
         selected_instrument = request.args.get("instrument", "")
         location = request.args.get("location", "")
@@ -262,10 +306,15 @@ def scanner():
                 ]
             }
                 
-            r = requests.post(f"{BASE_API_URL}/iserver/scanner/run", json=data, verify=False)
-            scan_results = r.json()
-
-        return render_template("scanner.html", params=params, scanner_map=scanner_map, filter_map=filter_map, scan_results=scan_results)
+            # page links repeat the same parameters and are served from the cached scan
+            scan_results = gateway.post_json("/iserver/scanner/run", json=data, default={})
+
+        contracts = scan_results.get('contracts', []) if isinstance(scan_results, dict) else []
+        contracts, pagination = paginate(contracts, default_size=25)
+        return Response(stream_with_context(stream_template(
+            "scanner.html", params=index.params, scanner_map=index.scanner_map,
+            filter_map=index.filter_map, scan_results={"contracts": contracts}, pagination=pagination,
+            scanner_map_json=index.scanner_map_json, filter_map_json=index.filter_map_json)))
     
     except Exception as e:
         return render_template("scanner.html", 
@@ -287,58 +336,16 @@ def check_plan():
         trade_idea = request.form.get('plan', '').lower()
         try:
             # Get portfolio data for context
-            r = requests.get(f"{BASE_API_URL}/portfolio/{ACCOUNT_ID}/positions/0", verify=False)
-            positions = r.json() if r.content else []
-            
-            # Initialize feedback lists
-            assistant_feedback = []
-            matched_rules = []
-            matched_concepts = []
-
-            # Strategy logic: feedback rules
-            if "structure" not in trade_idea:
-                assistant_feedback.append("⚠️ No mention of structure. Are you entering before the break?")
-            if "confirmation" not in trade_idea and "bias" in trade_idea:
-                assistant_feedback.append("💡 Bias mentioned — consider waiting for confirmation.")
-            if "hedge" in trade_idea:
-                assistant_feedback.append("✅ Hedge logic detected — check confluence or invalidation levels.")
-            if "damage control" in trade_idea or "dct" in trade_idea:
-                assistant_feedback.append("✅ DCT logic mentioned — ensure it aligns with portfolio risk.")
-
-            # Add basic trading concepts
-            if any(word in trade_idea for word in ["risk", "stop", "sl"]):
-                matched_concepts.append({
-                    "name": "Risk Management",
-                    "description": "Proper position sizing and stop loss placement"
-                })
-            
-            if any(word in trade_idea for word in ["trend", "support", "resistance", "level"]):
-                matched_concepts.append({
-                    "name": "Technical Analysis",
-                    "description": "Using price levels and market structure"
-                })
-
-            # Add trading rules based on content
-            if "risk" in trade_idea:
-                matched_rules.append({
-                    "rule": "Position size should not exceed 2% of portfolio value"
-                })
+            positions = position_loader.load(ACCOUNT_ID)
             
-            if "stop" in trade_idea or "sl" in trade_idea:
-                matched_rules.append({
-                    "rule": "Always set a stop loss before entering a trade"
-                })
-
-            if "target" in trade_idea or "tp" in trade_idea:
-                matched_rules.append({
-                    "rule": "Define take profit levels based on market structure"
-                })
+            # One pass over the plan against the built-in checks and the graph rulebook
+            matches = get_matcher().match(trade_idea)
 
             result = {
                 "trade_idea": trade_idea,
-                "rules": matched_rules,
-                "concepts": matched_concepts,
-                "feedback": assistant_feedback
+                "rules": matches["rules"],
+                "concepts": matches["concepts"],
+                "feedback": matches["feedback"]
             }
             
         except Exception as e:
@@ -379,41 +386,41 @@ def log_trade():
 @app.route("/risk")
 def risk_monitor():
     # Load strategy and portfolio data
-    graph = load_graph_data()
-    exposure = get_total_exposure_by_asset()
+    graph = get_graph()
+    positions = get_positions()
     drawdown = get_drawdown()
 
-    alerts = []
-    flags = []
-
-    # Check if there was an error loading graph data
-    if 'error' in graph:
-        alerts.append(f"⚠️ Warning: Could not load strategy data - {graph['error']}")
-        return render_template("risk_monitor.html", drawdown=drawdown, exposure=exposure, alerts=alerts, flags=flags)
+    # Every check runs over the whole book at once; see risk_engine
+    risk = assess(positions, drawdown, graph=None if graph.error else graph, fx_rates=get_fx_rates())
+    if graph.error:
+        risk["alerts"].insert(0, f"⚠️ Warning: Could not load strategy data - {graph.error}")
 
-    for symbol, size in exposure.items():
-        symbol_lower = symbol.lower()
+    return render_template("risk_monitor.html", drawdown=drawdown, exposure=risk["exposure"],
+                           alerts=risk["alerts"], flags=risk["flags"], risk=risk)
 
-        # Example rule: exposure threshold
-        if size > 2.0:
-            alerts.append(f"⚠️ High exposure on {symbol}: {size} lots")
-
-        # Strategy match: hedge-only zone awareness
-        if "concepts" in graph:  # Add check for concepts key
-            for concept in graph["concepts"]:
-                if "hedge-only" in concept["name"].lower() and symbol_lower in concept["description"].lower():
-                    flags.append(f"🔒 {symbol} is in a hedge-only zone — review your open trade.")
-
-        # Risk concept: drawdown sensitivity
-        if drawdown > 3.0:
-            flags.append(f"🚨 Portfolio drawdown at {drawdown}% — check if {symbol} position needs DCT adjustment")
-
-    return render_template("risk_monitor.html", drawdown=drawdown, exposure=exposure, alerts=alerts, flags=flags)
+@app.route("/risk/drawdown")
+def drawdown_history():
+    window = request.args.get("window")
+    try:
+        seconds = parse_window(window) if window else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # ?points=N caps how many samples come back; long windows are downsampled
+    points = max(1, min(request.args.get("points", HISTORY_MAX_POINTS, type=int) or HISTORY_MAX_POINTS,
+                        HISTORY_MAX_POINTS))
+    stats = drawdown_store.stats()
+    stats["history"] = drawdown_store.history(seconds, max_points=points)
+    return jsonify(stats)
 
 @app.route("/context/<pair>")
 def show_pair_context(pair):
     context = get_pair_context(pair)
     return render_template("pair_context.html", context=context)
 
+@app.route("/sentiment")
+def sentiment_batch():
+    pairs = [p.strip() for p in request.args.get("pairs", "").split(",") if p.strip()]
+    return jsonify(get_live_sentiment_batch(pairs))
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=int(FLASK_PORT))
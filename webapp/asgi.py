@@ -0,0 +1,216 @@
+"""
+ASGI entry point: ``uvicorn asgi:app``, always with a single worker process,
+since the IB connection, order handles, on-disk stores and market stream are
+per-process singletons.
+
+The routes that mostly wait on the gateway run here as async handlers on
+``async_gateway``, so hundreds of open dashboard requests cost coroutines rather
+than threads. The ``/stream`` SSE feed is served here too, since an open page
+would otherwise hold a WSGI thread for as long as it stays open. Every other
+route falls through to the Flask app in ``app.py``, which is mounted as WSGI on
+a pool of ``FLASK_THREADS`` threads and keeps working unchanged. Pages are rendered with
+the Flask app's Jinja environment, so the same templates, filters and
+``request.args`` work in both modes.
+"""
+
+import asyncio
+import contextlib
+import os
+import time
+from typing import Any, Iterator, List
+
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import app as flask_app
+from async_gateway import async_gateway
+from gateway_session import gateway_session
+from graph_loader import get_graph
+from market_snapshot import snapshots
+from market_stream import market_stream
+import metrics
+import page_data
+from pagination import paginate
+from scanner_params import scanner_params
+from sentiment_agent import get_live_sentiment_batch
+
+# Threads serving the mounted Flask routes
+FLASK_THREADS = int(os.getenv('FLASK_THREADS', '32'))
+
+
+@contextlib.contextmanager
+def flask_context(request: Request) -> Iterator[None]:
+    """
+    A Flask request context for ``request``, for template rendering and
+    helpers such as ``paginate`` that read ``flask.request``.
+    """
+    with flask_app.test_request_context(request.url.path, method=request.method,
+                                        query_string=request.url.query):
+        yield
+
+
+def render(request: Request, template_name: str, **context: Any) -> HTMLResponse:
+    with flask_context(request):
+        return HTMLResponse(render_template(template_name, **context))
+
+
+async def dashboard(request: Request) -> Response:
+    try:
+        accounts = await async_gateway.get_json("/portfolio/accounts")
+        account_id = page_data.primary_account_id(accounts)
+    except Exception as e:
+        # let the session manager notice the lapsed session right away
+        gateway_session.check_now()
+        return HTMLResponse(page_data.LOGIN_PROMPT)
+
+    summary = await async_gateway.get_json(f"/portfolio/{account_id}/summary")
+
+    return render(request, "dashboard.html", **page_data.dashboard_context(accounts, summary))
+
+
+async def session_status(request: Request) -> Response:
+    return JSONResponse(gateway_session.status())
+
+
+async def pacing_status(request: Request) -> Response:
+    return JSONResponse(async_gateway.pacer.stats())
+
+
+async def orders(request: Request) -> Response:
+    try:
+        orders = page_data.parse_orders(await async_gateway.get("/iserver/account/orders"))
+    except Exception as e:
+        print(f"Error fetching orders: {str(e)}")
+        return render(request, "orders.html", orders=[], error=page_data.ORDERS_ERROR)
+
+    with flask_context(request):
+        orders, pagination = paginate(orders)
+        return HTMLResponse(render_template("orders.html", orders=orders, pagination=pagination))
+
+
+async def watchlists(request: Request) -> Response:
+    watchlist_data = await async_gateway.get_json("/iserver/watchlists")
+
+    return render(request, "watchlists.html", **page_data.watchlists_context(watchlist_data))
+
+
+async def watchlist_detail(request: Request) -> Response:
+    watchlist = await async_gateway.get_json("/iserver/watchlist", default={}, params={"id": request.path_params["id"]})
+    # the snapshot service is shared with the Flask routes and blocks while priming
+    quotes = await asyncio.to_thread(snapshots.get, page_data.watchlist_conids(watchlist))
+
+    return render(request, "watchlist.html", **page_data.watchlist_context(watchlist, quotes))
+
+
+async def sentiment_batch(request: Request) -> Response:
+    pairs = [p.strip() for p in request.query_params.get("pairs", "").split(",") if p.strip()]
+    # the LLM client is synchronous; keep it off the event loop
+    return JSONResponse(await asyncio.to_thread(get_live_sentiment_batch, pairs))
+
+
+async def stream(request: Request) -> Response:
+    # One upstream websocket, fanned out to every open page as Server-Sent Events
+    conids = [c.strip() for c in request.query_params.get("conids", "").split(",") if c.strip()]
+    orders = request.query_params.get("orders") == "1"
+    return StreamingResponse(market_stream.async_events(conids, orders=orders),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def stream_ticks(request: Request) -> Response:
+    n = request.query_params.get("n")
+    try:
+        n = int(n) if n is not None else None
+    except ValueError:
+        n = None
+    return JSONResponse(market_stream.ticks(request.path_params["contract_id"], n))
+
+
+async def warm_up() -> None:
+    """
+    Fill the caches the first requests would otherwise pay for.
+    """
+    get_graph()
+    try:
+        await async_gateway.get_json("/portfolio/accounts")
+    except Exception as e:
+        print(f"Warm-up: gateway accounts not available yet: {e}")
+    # scanner params can take tens of seconds to download; don't hold up startup
+    asyncio.get_running_loop().run_in_executor(None, _warm_scanner_params)
+
+
+def _warm_scanner_params() -> None:
+    try:
+        scanner_params.get()
+    except Exception as e:
+        print(f"Warm-up: scanner params not available yet: {e}")
+
+
+class RouteMetricsMiddleware:
+    """
+    Latency and error metrics for the async routes, labelled with the route path.
+    Requests that fall through to Flask are recorded by its own hooks.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[Route]):
+        self.app = app
+        self.routes = [route for route in routes if isinstance(route, Route)]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = None
+        if scope["type"] == "http":
+            route = next((route.path for route in self.routes if route.matches(scope)[0] == Match.FULL), None)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        error = True
+        try:
+            await self.app(scope, receive, send_with_status)
+            error = status >= 500
+        finally:
+            metrics.observe_request(route, scope["method"], time.perf_counter() - start, error)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    await async_gateway.start()
+    await warm_up()
+    yield
+    await async_gateway.aclose()
+
+
+routes = [
+    Route("/", dashboard),
+    Route("/session/status", session_status),
+    Route("/pacing/status", pacing_status),
+    Route("/orders", orders),
+    Route("/watchlists", watchlists),
+    Route("/watchlists/{id:int}", watchlist_detail),
+    Route("/sentiment", sentiment_batch),
+    Route("/stream", stream),
+    Route("/stream/ticks/{contract_id}", stream_ticks),
+    # everything else is served by the Flask app, on its own thread pool
+    Mount("/", app=WSGIMiddleware(flask_app, workers=FLASK_THREADS)),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(RouteMetricsMiddleware, routes=routes)],
+    lifespan=lifespan,
+)
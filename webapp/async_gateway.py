@@ -0,0 +1,206 @@
+"""
+Async client for the IB Client Portal gateway, used by the ASGI app.
+
+``AsyncGatewayClient`` mirrors ``GatewayClient`` on a pooled ``httpx.AsyncClient``,
+so a slow gateway call parks a coroutine instead of a worker thread. It
+shares the sync client's response cache, stale copies, circuit breaker and
+request pacer, so the async routes and the Flask routes mounted next to them
+see the same state and together stay within IB's rate limits.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import httpx
+import requests
+
+from gateway_client import (BREAKER_FAILURE_STATUSES, POOL_SIZE, RATE_LIMIT_RETRIES, READ_RETRIES,
+                            GatewayClient, GatewayUnavailable, gateway)
+from request_pacer import EndpointClass, PacingTimeout
+
+_MISSING = object()
+
+# Errors after which a cached read falls back to its stale copy
+UNAVAILABLE_ERRORS = (httpx.TransportError, requests.ConnectionError, requests.Timeout)
+RETRY_STATUSES = (502, 503, 504)
+RETRY_BACKOFF = 0.2
+
+
+class AsyncGatewayClient:
+    """
+    Async counterpart of ``GatewayClient``. Call ``start`` from inside the
+    event loop before the first request and ``aclose`` on shutdown.
+    """
+
+    def __init__(self, sync_client: GatewayClient = gateway, pool_size: int = POOL_SIZE,
+                 read_retries: int = READ_RETRIES):
+        self.sync_client = sync_client
+        self.cache = sync_client.cache
+        self.stale = sync_client.stale
+        self.breaker = sync_client.breaker
+        self.pacer = sync_client.pacer
+        self.pool_size = pool_size
+        self.read_retries = read_retries
+        self.client: Optional[httpx.AsyncClient] = None
+        # in-flight reads by key, so identical concurrent reads share one request
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        if self.client is not None:
+            return
+        self.client = httpx.AsyncClient(
+            base_url=self.sync_client.base_url,
+            # self-signed gateway certificate
+            verify=False,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _acquire(self, method: str, path: str) -> EndpointClass:
+        try:
+            return self.pacer.acquire(method, path, max_wait=0)
+        except PacingTimeout:
+            # rate limited: wait for the slot on a thread, not on the event loop
+            return await asyncio.to_thread(self.pacer.acquire, method, path)
+
+    async def request(self, method: str, path: str, timeout: Optional[Tuple[float, float]] = None,
+                      use_breaker: bool = True, **kwargs) -> httpx.Response:
+        """
+        Send a request through the pooled async client.
+
+        Raises:
+            GatewayUnavailable: The circuit is open
+        """
+        path = "/" + path.lstrip("/")
+        if timeout is None:
+            timeout = self.sync_client.timeout_for(path)
+        if method not in ("GET", "HEAD"):
+            return await self._send(method, path, timeout, use_breaker, **kwargs)
+
+        key = (method, path, json.dumps(kwargs, sort_keys=True, default=str), use_breaker)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._send(method, path, timeout, use_breaker, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # one caller disconnecting must not cancel the request for the others
+        return await asyncio.shield(future)
+
+    async def _send(self, method: str, path: str, timeout: Tuple[float, float], use_breaker: bool,
+                    **kwargs) -> httpx.Response:
+        if self.client is None:
+            await self.start()
+        allowed, probe = self.breaker.admit() if use_breaker else (True, False)
+        if not allowed:
+            raise GatewayUnavailable(f"Gateway unavailable, not sending {method} {path}")
+
+        recorded = False
+        try:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                endpoint = await self._acquire(method, path)
+                start = time.perf_counter()
+                try:
+                    r = await self._attempt(method, path, timeout, **kwargs)
+                except httpx.TransportError:
+                    self.pacer.release(endpoint)
+                    self.breaker.record_failure()
+                    recorded = True
+                    self.sync_client._observe(method, path, start, error=True)
+                    raise
+                except BaseException:
+                    self.pacer.release(endpoint)
+                    self.sync_client._observe(method, path, start, error=True)
+                    raise
+                self.sync_client._observe(method, path, start, error=r.status_code >= 500 or r.status_code == 429)
+                # a 429 was not processed by IB, so even writes are safe to resend
+                backoff = self.pacer.release(endpoint, r)
+                if backoff is None or attempt == RATE_LIMIT_RETRIES:
+                    break
+                print(f"Gateway rate limit hit on {method} {path}, retrying in {backoff:.1f}s")
+
+            if r.status_code in BREAKER_FAILURE_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            recorded = True
+            return r
+        finally:
+            # a probe that ended without an outcome must not hold the circuit half-open
+            if probe and not recorded:
+                self.breaker.abort_probe()
+
+    async def _attempt(self, method: str, path: str, timeout: Tuple[float, float], **kwargs) -> httpx.Response:
+        # reads are retried within their pacing slot like the sync client's
+        # urllib3 Retry; writes never are
+        retries = self.read_retries if method in ("GET", "HEAD") else 0
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                r = await self.client.request(method, path, timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+                                              **kwargs)
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                continue
+            if r.status_code not in RETRY_STATUSES or attempt == retries:
+                return r
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, **kwargs)
+
+    async def request_json(self, method: str, path: str, default: Any = None, **kwargs) -> Any:
+        """
+        Send a request and return the decoded JSON body, served from the
+        shared read-through cache when the endpoint has a TTL in ``CACHE_TTLS``.
+        """
+        path = "/" + path.lstrip("/")
+        ttl = self.sync_client.cache_ttl(method, path)
+        if ttl is None:
+            r = await self.request(method, path, **kwargs)
+            return r.json() if r.content else default
+
+        # same key as GatewayClient.request_json so both clients share entries
+        key = (method, path, json.dumps(kwargs, sort_keys=True, default=str))
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        try:
+            r = await self.request(method, path, **kwargs)
+        except UNAVAILABLE_ERRORS:
+            # gateway down or restarting: serve the last good response if there is one
+            value = self.stale.get(key, _MISSING)
+            if value is _MISSING:
+                raise
+            return value
+        value = r.json() if r.content else default
+        # never cache gateway errors
+        if r.is_success:
+            self.cache.set(key, value, ttl)
+            self.stale.set(key, value)
+        return value
+
+    async def get_json(self, path: str, default: Any = None, **kwargs) -> Any:
+        return await self.request_json("GET", path, default=default, **kwargs)
+
+    async def post_json(self, path: str, default: Any = None, **kwargs) -> Any:
+        return await self.request_json("POST", path, default=default, **kwargs)
+
+    def invalidate(self, *prefixes: str) -> int:
+        return self.sync_client.invalidate(*prefixes)
+
+
+# Shared async client used by the ASGI routes
+async_gateway = AsyncGatewayClient()
@@ -0,0 +1,244 @@
+"""
+Local columnar store for historical bars.
+
+Bars for each (conid, bar size) live under ``bars/<conid>/<bar>/`` as one raw
+little-endian column file per field (t, o, h, l, c, v), read back with
+``numpy.memmap``. A contract page fetches only the bars after the last stored
+timestamp, replaces the still-forming tail bar and appends the rest, then
+slices the requested period out of the local columns.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from gateway_client import GatewayClient, gateway
+
+BAR_DATA_DIR = Path(os.getenv('BAR_DATA_DIR', Path(__file__).resolve().parent / "bars"))
+# Never ask the gateway for new bars more often than this, in seconds
+BAR_REFRESH_INTERVAL = float(os.getenv('BAR_REFRESH_INTERVAL', '60'))
+
+# t is epoch milliseconds, as the gateway returns it
+COLUMNS = {"t": np.dtype('<i8'), "o": np.dtype('<f8'), "h": np.dtype('<f8'),
+           "l": np.dtype('<f8'), "c": np.dtype('<f8'), "v": np.dtype('<f8')}
+# Client Portal period/bar units in seconds; months and years are approximate
+SPAN_UNITS = {"min": 60, "h": 3600, "d": 86400, "w": 604800, "m": 2592000, "y": 31536000}
+
+
+def parse_span(span: str) -> int:
+    """
+    Convert a Client Portal period or bar size such as '5min', '1h', '365d', '6m' or '1y' to seconds.
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*(min|h|d|w|m|y)\s*", str(span).lower())
+    if not match:
+        raise ValueError(f"Invalid period or bar size: {span}")
+    return int(match.group(1)) * SPAN_UNITS[match.group(2)]
+
+
+def gap_period(seconds: float) -> str:
+    """
+    Smallest Client Portal period that covers ``seconds``.
+    """
+    if seconds <= 30 * 60:
+        return f"{max(1, math.ceil(seconds / 60))}min"
+    if seconds <= 8 * 3600:
+        return f"{math.ceil(seconds / 3600)}h"
+    return f"{min(1000, math.ceil(seconds / 86400))}d"
+
+
+class BarSeries:
+    """
+    Column files and metadata for one conid and bar size.
+    """
+
+    def __init__(self, root: Path, conid: str, bar: str):
+        self.conid = str(conid)
+        self.bar = bar
+        self.path = Path(root) / self.conid / bar
+        self.meta_file = self.path / "meta.json"
+        # held while the column files are rewritten or read
+        self.lock = threading.Lock()
+        self.meta = self._read_meta()
+        # bumped by every merge, with the first row that merge rewrote
+        self.generation = 0
+        self.changed_from = 0
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self.meta_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error reading bar metadata for {self.conid}/{self.bar}: {e}")
+            return {}
+
+    def _write_meta(self) -> None:
+        tmp_path = self.meta_file.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_file)
+
+    def __len__(self) -> int:
+        # a write interrupted part way can leave columns of different lengths
+        try:
+            return min(os.path.getsize(self.path / name) // dtype.itemsize for name, dtype in COLUMNS.items())
+        except OSError:
+            return 0
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        Read-only memory-mapped columns (empty arrays when nothing is stored).
+        Hold ``lock`` while using them, since a merge truncates the files.
+        """
+        n = len(self)
+        if n == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.memmap(self.path / name, dtype=dtype, mode='r', shape=(n,))
+                for name, dtype in COLUMNS.items()}
+
+    def merge(self, bars: List[Dict[str, Any]], replace: bool = False) -> int:
+        """
+        Merge gateway bars into the columns. Stored bars at or after the first new
+        timestamp are dropped and the new bars appended; with ``replace`` the
+        columns are rewritten from scratch.
+
+        Returns:
+            int: Index of the first row that changed
+        """
+        new = {name: np.array([bar.get(name, 0) or 0 for bar in bars], dtype=dtype)
+               for name, dtype in COLUMNS.items()}
+        order = np.argsort(new["t"], kind="stable")
+        new = {name: values[order] for name, values in new.items()}
+        if len(new["t"]):
+            # the gateway can repeat a timestamp; keep the last copy
+            last = np.r_[new["t"][1:] != new["t"][:-1], True]
+            new = {name: values[last] for name, values in new.items()}
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        keep = 0
+        if not replace and len(new["t"]):
+            keep = int(np.searchsorted(self.columns()["t"], new["t"][0], side='left'))
+        elif not replace:
+            keep = len(self)
+
+        for name, dtype in COLUMNS.items():
+            with open(self.path / name, 'r+b' if (self.path / name).exists() else 'wb') as f:
+                f.truncate(keep * dtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(new[name].tobytes())
+        self.generation += 1
+        self.changed_from = keep
+        return keep
+
+
+class BarStore:
+    """
+    Series by (conid, bar size), filled incrementally from the gateway.
+    """
+
+    def __init__(self, root: Path = BAR_DATA_DIR, client: GatewayClient = gateway,
+                 refresh_interval: float = BAR_REFRESH_INTERVAL):
+        self.root = Path(root)
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self._series: Dict[tuple, BarSeries] = {}
+        self._lock = threading.Lock()
+
+    def series(self, conid: str, bar: str) -> BarSeries:
+        key = (str(conid), bar)
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = BarSeries(self.root, conid, bar)
+            return self._series[key]
+
+    def _fetch(self, conid: str, period: str, bar: str) -> Dict[str, Any]:
+        r = self.client.get("/iserver/marketdata/history", params={"conid": conid, "period": period, "bar": bar})
+        r.raise_for_status()
+        return r.json()
+
+    def refresh(self, conid: str, period: str, bar: str) -> BarSeries:
+        """
+        Bring the local series up to date for ``period``, fetching as little as possible.
+        Falls back to the stored bars if the gateway can't be reached.
+        """
+        series = self.series(conid, bar)
+        span_ms = parse_span(period) * 1000
+        now = time.time()
+        with series.lock:
+            meta = series.meta
+            stored = len(series)
+            covered_from = meta.get("covered_from")
+            wanted_from = int(now * 1000) - span_ms
+            try:
+                if not stored or covered_from is None or wanted_from < covered_from:
+                    # nothing stored yet, or the period reaches further back than we have
+                    history = self._fetch(conid, period, bar)
+                    series.merge(history.get("data", []), replace=True)
+                    meta["covered_from"] = wanted_from
+                elif now - meta.get("fetched_at", 0) >= self.refresh_interval:
+                    last_t = int(series.columns()["t"][-1])
+                    gap = max(0.0, now - last_t / 1000) + parse_span(bar)
+                    history = self._fetch(conid, gap_period(gap), bar)
+                    series.merge(history.get("data", []))
+                else:
+                    return series
+            except Exception as e:
+                if not stored:
+                    raise
+                print(f"Error fetching bars for {conid}/{bar}, serving stored bars: {e}")
+                return series
+
+            for field in ("symbol", "text", "priceFactor"):
+                if field in history:
+                    meta[field] = history[field]
+            meta["fetched_at"] = now
+            series._write_meta()
+            return series
+
+    def get_history(self, conid: str, period: str = '5d', bar: str = '1d', newest_first: bool = False,
+                    offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Price history for a period in the gateway's response shape, served from the local store.
+
+        Args:
+            conid: Contract id
+            period: Client Portal period, e.g. '5d' or '365d'
+            bar: Client Portal bar size, e.g. '1d' or '5min'
+            newest_first: Return the most recent bar first
+            offset: Bars to skip, counted in the returned order
+            limit: Maximum number of bars to return; only these are copied out of the store
+
+        Returns:
+            Dict[str, Any]: {'symbol', 'text', 'total', 'data': [{'t', 'o', 'h', 'l', 'c', 'v'}, ...]}
+            where 'total' is the number of bars in the whole period
+        """
+        series = self.refresh(conid, period, bar)
+        with series.lock:
+            cols = series.columns()
+            end = len(cols["t"])
+            start = 0
+            if end:
+                start = int(np.searchsorted(cols["t"], cols["t"][-1] - parse_span(period) * 1000, side='right'))
+            total = end - start
+            count = max(0, total - offset) if limit is None else max(0, min(limit, total - offset))
+            if newest_first:
+                rows = slice(end - offset - 1, end - offset - count - 1 if end - offset - count > 0 else None, -1)
+            else:
+                rows = slice(start + offset, start + offset + count)
+            window = {name: values[rows].tolist() if count else [] for name, values in cols.items()}
+            del cols
+        data = [dict(zip(window, row)) for row in zip(*window.values())]
+        result = {field: series.meta[field] for field in ("symbol", "text", "priceFactor") if field in series.meta}
+        result["total"] = total
+        result["data"] = data
+        return result
+
+bar_store = BarStore()
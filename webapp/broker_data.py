@@ -10,38 +10,35 @@ from ib_insync import IB, util, Contract, Order, Trade
 import threading
 from datetime import datetime, timedelta
 from decimal import Decimal
+from symbol_resolver import symbol_cache
+from trade_journal import journal
+from drawdown_store import drawdown_store
+from broker_service import broker
+from order_status import order_registry
+from singleflight import SingleFlight, coalesced
 
-# Global IB connection instance
-ib = IB()
-connection_lock = threading.Lock()
+# Background IB connection; request threads only read its snapshot
+ORDER_CONNECT_TIMEOUT = 5  # seconds an order path may wait for a fresh connection
+
+# Concurrent page loads asking for the same broker data share one call
+_in_flight = SingleFlight()
 
 def ensure_ib_connection() -> bool:
     """
-    Ensures there is an active connection to Interactive Brokers TWS/Gateway.
-    Uses a lock to prevent multiple simultaneous connection attempts.
+    Ensures the background IB connection is running and reports whether it is up.
+    Never blocks: the broker service connects (and reconnects) on its own thread.
     
     Returns:
         bool: True if connection is established, False otherwise
     """
-    with connection_lock:
-        try:
-            if not ib.isConnected():
-                ib.connect('127.0.0.1', 7497, clientId=1)
-                # Wait for connection to be established
-                timeout = 5  # seconds
-                start_time = datetime.now()
-                while not ib.isConnected() and (datetime.now() - start_time).seconds < timeout:
-                    ib.sleep(0.1)
-                
-                if not ib.isConnected():
-                    print("Failed to connect to IB after timeout")
-                    return False
-                
-            return True
-        except Exception as e:
-            print(f"Error connecting to IB: {e}")
-            return False
+    try:
+        broker.start()
+        return broker.is_connected()
+    except Exception as e:
+        print(f"Error connecting to IB: {e}")
+        return False
 
+@coalesced(_in_flight)
 def get_total_exposure_by_asset() -> Dict[str, float]:
     """
     Get the total exposure for each asset/symbol in lots from IB.
@@ -55,8 +52,8 @@ def get_total_exposure_by_asset() -> Dict[str, float]:
             print("Warning: Using mock data due to IB connection failure")
             return get_mock_data()
 
-        # Get portfolio data from IB
-        portfolio = ib.portfolio()
+        # Get portfolio data from the live snapshot
+        portfolio = broker.portfolio()
         
         # Calculate exposure in lots (assuming standard lot sizes)
         exposure = {}
@@ -76,6 +73,72 @@ def get_total_exposure_by_asset() -> Dict[str, float]:
         print("Falling back to mock data")
         return get_mock_data()
 
+@coalesced(_in_flight)
+def get_positions() -> List[Dict[str, Any]]:
+    """
+    Get open positions from the IB snapshot for the risk engine.
+    FX positions are keyed by the pair (e.g. 'EURUSD'). Falls back to mock data
+    if IB connection fails.
+
+    Returns:
+        List[Dict[str, Any]]: Positions with symbol, sec_type, currency, signed
+        quantity, market_value (in ``currency``) and market_price
+    """
+    try:
+        if not ensure_ib_connection():
+            print("Warning: Using mock positions due to IB connection failure")
+            return get_mock_positions()
+
+        positions = []
+        for item in broker.portfolio():
+            contract = item.contract
+            symbol = contract.symbol + contract.currency if contract.secType == 'CASH' else contract.symbol
+            positions.append({
+                "symbol": symbol,
+                "sec_type": contract.secType,
+                "currency": contract.currency,
+                "quantity": float(item.position),
+                "market_value": float(item.marketValue or 0.0),
+                "market_price": float(item.marketPrice or 0.0),
+            })
+        return positions
+
+    except Exception as e:
+        print(f"Error getting positions from IB: {e}")
+        print("Falling back to mock positions")
+        return get_mock_positions()
+
+def get_mock_positions() -> List[Dict[str, Any]]:
+    """
+    Mock positions matching get_mock_data, valued at one unit per unit of base currency.
+    """
+    return [
+        {"symbol": symbol, "sec_type": "CASH", "currency": symbol[3:],
+         "quantity": lots * 100000, "market_value": lots * 100000, "market_price": 1.0}
+        for symbol, lots in get_mock_data().items()
+    ]
+
+def get_fx_rates() -> Dict[str, float]:
+    """
+    Exchange rates from each currency to the account's base currency, as
+    reported in the 'ExchangeRate' account values. Empty if IB is not connected.
+
+    Returns:
+        Dict[str, float]: Currency -> value of one unit in the base currency
+    """
+    if not ensure_ib_connection():
+        return {}
+    rates = {}
+    for currency, value in broker.account_values('ExchangeRate').items():
+        try:
+            rates[currency] = float(value)
+        except ValueError:
+            continue
+    # IB also reports the base currency itself under the pseudo-currency 'BASE'
+    rates.pop('BASE', None)
+    return rates
+
+@coalesced(_in_flight)
 def get_drawdown() -> float:
     """
     Calculate current drawdown percentage using IB account data.
@@ -89,21 +152,14 @@ def get_drawdown() -> float:
             print("Warning: Using mock drawdown due to IB connection failure")
             return 3.5
 
-        # Get account summary
-        account_values = ib.accountSummary()
-        
-        # Get current Net Liquidation Value
-        nlv = float(next((v.value for v in account_values if v.tag == 'NetLiquidation'), 0))
+        # Get current Net Liquidation Value from the live snapshot
+        nlv = broker.net_liquidation()
+        if nlv is None:
+            print("Warning: Using mock drawdown until account values arrive")
+            return 3.5
         
-        # Get high water mark from stored data or calculate it
-        high_water_mark = get_high_water_mark(nlv)
-        
-        if high_water_mark == 0:
-            return 0.0
-            
-        # Calculate drawdown
-        drawdown = ((high_water_mark - nlv) / high_water_mark) * 100
-        return round(drawdown, 2)
+        # Record the sample; the store updates the high water mark in memory
+        return drawdown_store.record(nlv)
         
     except Exception as e:
         print(f"Error calculating drawdown from IB: {e}")
@@ -120,23 +176,9 @@ def get_high_water_mark(current_nlv: float) -> float:
     Returns:
         float: The current high water mark
     """
-    hwm_file = "high_water_mark.json"
     try:
-        if os.path.exists(hwm_file):
-            with open(hwm_file, 'r') as f:
-                data = json.load(f)
-                stored_hwm = float(data.get('high_water_mark', 0))
-        else:
-            stored_hwm = 0
-
-        # Update high water mark if current NLV is higher
-        if current_nlv > stored_hwm:
-            with open(hwm_file, 'w') as f:
-                json.dump({'high_water_mark': current_nlv}, f)
-            return current_nlv
-            
-        return stored_hwm
-        
+        drawdown_store.record(current_nlv)
+        return drawdown_store.high_water_mark
     except Exception as e:
         print(f"Error managing high water mark: {e}")
         return current_nlv
@@ -172,6 +214,14 @@ def create_contract(symbol: str) -> Contract:
     else:
         # Stock or other instrument
         contract = Contract(secType='STK', symbol=symbol, currency='USD', exchange='SMART')
+
+    # Reuse a conid resolved earlier through the gateway so IB can skip contract
+    # matching. The conid alone identifies the contract, so the guessed currency is
+    # dropped (a resolved stock may well trade in EUR); only the routing exchange,
+    # which orders still need, is kept.
+    conid = symbol_cache.get(symbol, contract.secType)
+    if conid:
+        contract = Contract(conId=conid, exchange=contract.exchange)
     
     return contract
 
@@ -398,11 +448,11 @@ def modify_order(order_id: int, modifications: Dict[str, Any]) -> bool:
         bool: True if modification was successful
     """
     try:
-        if not ensure_ib_connection():
+        if not broker.wait_connected(ORDER_CONNECT_TIMEOUT):
             raise ConnectionError("Not connected to IB")
             
         # Find the order
-        trades = ib.trades()
+        trades = broker.trades()
         trade = next((t for t in trades if t.order.orderId == order_id), None)
         
         if not trade:
@@ -422,8 +472,8 @@ def modify_order(order_id: int, modifications: Dict[str, Any]) -> bool:
         if 'tif' in modifications:
             order.tif = modifications['tif']
             
-        # Submit the modified order
-        ib.placeOrder(trade.contract, order)
+        # Submit the modified order on the IB thread
+        broker.call(broker.ib.placeOrder, trade.contract, order)
         
         return True
         
@@ -431,9 +481,142 @@ def modify_order(order_id: int, modifications: Dict[str, Any]) -> bool:
         print(f"Error modifying order: {e}")
         return False
 
-def save_trade_log(trade_data: Dict[str, Union[str, float]]) -> None:
+BRACKET_LEGS = ['ENTRY', 'TAKE_PROFIT', 'STOP_LOSS']
+
+def submit_orders(
+    contract: Contract,
+    orders: List[Order],
+    legs: Optional[List[str]] = None,
+    on_change: Optional[Any] = None
+) -> str:
     """
-    Save trade data to a JSON file and create actual IB trade if connected.
+    Submit one order or a bracket without waiting for IB.
+
+    The orders are placed on the IB thread and their statuses are tracked in
+    ``order_registry`` from ib_insync status events.
+    
+    Args:
+        contract: Contract to trade
+        orders: Orders to place in sequence; for a bracket the first one is the parent
+        legs: Optional leg names, one per order (defaults to ORDER_1, ORDER_2, ...)
+        on_change: Optional callback receiving the handle snapshot after every status change
+        
+    Returns:
+        str: Handle id to poll with ``order_registry.get`` or the /orders/status route
+    """
+    legs = legs or [f"ORDER_{i + 1}" for i in range(len(orders))]
+    handle_id = order_registry.create(legs)
+
+    def place():
+        try:
+            if len(orders) > 1 and any(o.parentId == 0 for o in orders[1:]):
+                # children need the parent's id, which is only known once assigned
+                orders[0].orderId = broker.ib.client.getReqId()
+                for child in orders[1:]:
+                    child.parentId = orders[0].orderId
+            trades = [broker.ib.placeOrder(contract, o) for o in orders]
+            order_registry.track(handle_id, trades, on_change)
+        except Exception as e:
+            print(f"Error placing order(s) with IB: {e}")
+            order_registry.fail(handle_id, str(e), on_change)
+
+    broker.submit(place)
+    return handle_id
+
+def _build_trade(trade_data: Dict[str, Any]) -> Tuple[Contract, Union[Order, List[Order]]]:
+    """
+    Build (and validate) the contract and order(s) described by a trade log entry.
+    Raises ValueError for invalid order parameters.
+    """
+    contract = create_contract(trade_data['symbol'])
+    order = create_order(
+        direction=trade_data['direction'],
+        size=float(trade_data['size']),
+        order_type=trade_data.get('order_type', 'MKT'),
+        limit_price=trade_data.get('limit_price'),
+        stop_price=trade_data.get('stop_price'),
+        trailing_amount=trade_data.get('trailing_amount'),
+        trailing_percent=trade_data.get('trailing_percent'),
+        tif=trade_data.get('tif', 'DAY'),
+        outside_rth=trade_data.get('outside_rth', False),
+        bracket_params=trade_data.get('bracket_params')
+    )
+    return contract, order
+
+def _journal_updater(trade_id: Optional[str]):
+    def journal_update(**fields):
+        if trade_id is None:
+            return
+        try:
+            journal.update(trade_id, **fields)
+        except Exception as e:
+            print(f"Error updating local log: {e}")
+    return journal_update
+
+def _log_trade(trade_data: Dict[str, Any]) -> Optional[str]:
+    # Add timestamp to trade data and save to local log
+    trade_data['timestamp'] = datetime.now().isoformat()
+    try:
+        return journal.log_trade(trade_data)
+    except Exception as e:
+        print(f"Error saving to local log: {e}")
+        return None
+
+def _submit_trade(trade_data: Dict[str, Any], contract: Contract, order: Union[Order, List[Order]],
+                  journal_update) -> str:
+    # Handle both single orders and bracket orders
+    if isinstance(order, list):
+        def on_change(snapshot):
+            # Log all orders
+            fields = {'bracket_orders': [{
+                'order_type': o['leg'],
+                'order_id': o['order_id'],
+                'status': o['status'],
+                'filled': o['filled'],
+                'remaining': o['remaining'],
+                'avg_fill_price': o['avg_fill_price']
+            } for o in snapshot['orders']]}
+            if snapshot['error']:
+                fields['ib_error'] = snapshot['error']
+            journal_update(**fields)
+
+        handle_id = submit_orders(contract, order, BRACKET_LEGS, on_change)
+    else:
+        def on_change(snapshot):
+            status = snapshot['orders'][0]
+            fields = {
+                'ib_order_id': status['order_id'],
+                'ib_status': status['status'],
+                'ib_filled': status['filled'],
+                'ib_remaining': status['remaining'],
+                'ib_avg_fill_price': status['avg_fill_price']
+            }
+            if snapshot['error']:
+                fields['ib_error'] = snapshot['error']
+            journal_update(**fields)
+
+        handle_id = submit_orders(contract, [order], ['ORDER'], on_change)
+
+        # Add static IB order details to trade log
+        details = {'ib_order_type': order.orderType, 'ib_tif': order.tif}
+        if hasattr(order, 'lmtPrice'):
+            details['ib_limit_price'] = order.lmtPrice
+        if hasattr(order, 'auxPrice'):
+            details['ib_stop_price'] = order.auxPrice
+        if hasattr(order, 'trailingPercent'):
+            details['ib_trailing_percent'] = order.trailingPercent
+        journal_update(**details)
+
+    journal_update(ib_handle=handle_id)
+    print(f"Trade(s) submitted to IB - Order type: {trade_data.get('order_type', 'MKT')}")
+    return handle_id
+
+def save_trade_log(trade_data: Dict[str, Union[str, float]]) -> Optional[str]:
+    """
+    Append trade data to the trade journal and submit the IB trade, waiting up to
+    ORDER_CONNECT_TIMEOUT seconds for the IB connection if it is still coming up.
+    Returns as soon as the order is queued; IB order statuses (or the placement
+    error) are journaled as follow-up updates when they arrive.
     
     Args:
         trade_data: Dictionary containing trade details including:
@@ -449,117 +632,67 @@ def save_trade_log(trade_data: Dict[str, Union[str, float]]) -> None:
             - tif: Time in force ('DAY', 'GTC', 'IOC', 'GTD')
             - outside_rth: Allow trades outside regular trading hours
             - max_drawdown: Maximum allowed drawdown
+
+    Returns:
+        Optional[str]: Order handle id, or None if nothing was submitted to IB
     """
     try:
-        # Add timestamp to trade data
-        trade_data['timestamp'] = datetime.now().isoformat()
-        
-        # Save to local log first
-        log_file = "trade_log.json"
+        journal_update = _journal_updater(_log_trade(trade_data))
+
+        # Orders may wait briefly for a connection that is still coming up
+        if not broker.wait_connected(ORDER_CONNECT_TIMEOUT):
+            journal_update(ib_error="Not connected to IB")
+            return None
+
         try:
-            if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-            
-            logs.append(trade_data)
-            
-            with open(log_file, 'w') as f:
-                json.dump(logs, f, indent=2)
+            contract, order = _build_trade(trade_data)
         except Exception as e:
-            print(f"Error saving to local log: {e}")
-
-        # If connected to IB, create and place the trade
-        if ensure_ib_connection():
-            try:
-                # Create contract
-                contract = create_contract(trade_data['symbol'])
-                
-                # Create order(s)
-                order = create_order(
-                    direction=trade_data['direction'],
-                    size=float(trade_data['size']),
-                    order_type=trade_data.get('order_type', 'MKT'),
-                    limit_price=trade_data.get('limit_price'),
-                    stop_price=trade_data.get('stop_price'),
-                    trailing_amount=trade_data.get('trailing_amount'),
-                    trailing_percent=trade_data.get('trailing_percent'),
-                    tif=trade_data.get('tif', 'DAY'),
-                    outside_rth=trade_data.get('outside_rth', False),
-                    bracket_params=trade_data.get('bracket_params')
-                )
-                
-                # Handle both single orders and bracket orders
-                if isinstance(order, list):
-                    # Bracket orders
-                    trades = []
-                    for o in order:
-                        trades.append(ib.placeOrder(contract, o))
-                    
-                    # Wait for main order status
-                    main_trade = trades[0]
-                    timeout = 10
-                    start_time = datetime.now()
-                    while not main_trade.orderStatus.status and (datetime.now() - start_time).seconds < timeout:
-                        ib.sleep(0.1)
-                    
-                    # Log all orders
-                    trade_data['bracket_orders'] = []
-                    for i, trade in enumerate(trades):
-                        order_type = 'ENTRY' if i == 0 else 'TAKE_PROFIT' if i == 1 else 'STOP_LOSS'
-                        trade_data['bracket_orders'].append({
-                            'order_type': order_type,
-                            'order_id': trade.order.orderId,
-                            'status': trade.orderStatus.status,
-                            'filled': trade.orderStatus.filled,
-                            'remaining': trade.orderStatus.remaining,
-                            'avg_fill_price': trade.orderStatus.avgFillPrice
-                        })
-                else:
-                    # Single order
-                    trade = ib.placeOrder(contract, order)
-                    
-                    # Wait for order status
-                    timeout = 10
-                    start_time = datetime.now()
-                    while not trade.orderStatus.status and (datetime.now() - start_time).seconds < timeout:
-                        ib.sleep(0.1)
-                    
-                    # Add IB order details to trade log
-                    trade_data['ib_order_id'] = trade.order.orderId
-                    trade_data['ib_status'] = trade.orderStatus.status
-                    trade_data['ib_filled'] = trade.orderStatus.filled
-                    trade_data['ib_remaining'] = trade.orderStatus.remaining
-                    trade_data['ib_avg_fill_price'] = trade.orderStatus.avgFillPrice
-                    trade_data['ib_order_type'] = order.orderType
-                    trade_data['ib_tif'] = order.tif
-                    
-                    if hasattr(order, 'lmtPrice'):
-                        trade_data['ib_limit_price'] = order.lmtPrice
-                    if hasattr(order, 'auxPrice'):
-                        trade_data['ib_stop_price'] = order.auxPrice
-                    if hasattr(order, 'trailingPercent'):
-                        trade_data['ib_trailing_percent'] = order.trailingPercent
-                
-                # Update the log file with IB details
-                logs[-1] = trade_data
-                with open(log_file, 'w') as f:
-                    json.dump(logs, f, indent=2)
-                
-                print(f"Trade(s) placed with IB - Order type: {trade_data.get('order_type', 'MKT')}")
-                
-            except Exception as e:
-                print(f"Error placing trade with IB: {e}")
-                trade_data['ib_error'] = str(e)
-                
-                # Update log with error
-                logs[-1] = trade_data
-                with open(log_file, 'w') as f:
-                    json.dump(logs, f, indent=2)
+            print(f"Error placing trade with IB: {e}")
+            journal_update(ib_error=str(e))
+            return None
+
+        return _submit_trade(trade_data, contract, order, journal_update)
             
     except Exception as e:
         print(f"Error in trade logging: {e}")
+        return None
+
+def place_trades_batch(trades: List[Dict[str, Any]]) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Validate a list of trades (single orders or brackets, any symbols) and submit
+    them all to IB back to back without waiting for any of them.
+
+    Nothing is journaled or submitted unless every trade passes validation.
+    
+    Args:
+        trades: Trade dictionaries in the same format as ``save_trade_log``
+        
+    Returns:
+        Tuple[bool, List[Dict[str, Any]]]: (whether the batch was submitted, one
+        result per trade with its index and either its order handle or an error)
+    """
+    built = []
+    errors = []
+    for index, trade_data in enumerate(trades):
+        try:
+            built.append(_build_trade(trade_data))
+        except (ValueError, TypeError, KeyError) as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        return False, errors
+
+    if not broker.wait_connected(ORDER_CONNECT_TIMEOUT):
+        return False, [{"index": index, "error": "Not connected to IB"} for index in range(len(trades))]
+
+    results = []
+    for index, (trade_data, (contract, order)) in enumerate(zip(trades, built)):
+        journal_update = _journal_updater(_log_trade(trade_data))
+        try:
+            results.append({"index": index, "handle": _submit_trade(trade_data, contract, order, journal_update)})
+        except Exception as e:
+            journal_update(ib_error=str(e))
+            results.append({"index": index, "error": str(e)})
+    return True, results
 
 # Cleanup function to properly disconnect from IB
 def cleanup():
@@ -567,5 +700,4 @@ def cleanup():
     Cleanup function to properly disconnect from IB.
     Should be called when the application shuts down.
     """
-    if ib.isConnected():
-        ib.disconnect() 
\ No newline at end of file
+    broker.stop()
\ No newline at end of file
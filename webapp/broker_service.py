@@ -0,0 +1,225 @@
+"""
+Background ib_insync connection with a live, in-memory account snapshot.
+
+The IB socket is owned by a dedicated thread running its own asyncio event loop.
+Portfolio, account-value and order events keep a snapshot up to date, and Flask
+request threads read that snapshot without ever waiting on the socket. Anything
+that has to talk to IB (placing or modifying orders) is handed to the loop
+thread with ``call``/``submit``.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from ib_insync import IB, PortfolioItem, Trade, AccountValue
+
+import metrics
+
+IB_HOST = os.getenv('IB_HOST', '127.0.0.1')
+IB_PORT = int(os.getenv('IB_PORT', '7497'))
+IB_CLIENT_ID = int(os.getenv('IB_CLIENT_ID', '1'))
+IB_RECONNECT_INTERVAL = float(os.getenv('IB_RECONNECT_INTERVAL', '5'))
+
+
+def _copy_outcome(task: asyncio.Future, future: Future) -> None:
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+class BrokerService:
+    """
+    Owns the IB connection and the snapshot built from its events.
+    """
+
+    def __init__(self, host: str = IB_HOST, port: int = IB_PORT, client_id: int = IB_CLIENT_ID,
+                 reconnect_interval: float = IB_RECONNECT_INTERVAL):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.reconnect_interval = reconnect_interval
+
+        self.ib: Optional[IB] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self._connected = threading.Event()
+
+        # snapshot, guarded by _lock
+        self._lock = threading.Lock()
+        self._portfolio: Dict[int, PortfolioItem] = {}
+        self._account_values: Dict[tuple, AccountValue] = {}
+        self._trades: Dict[int, Trade] = {}
+        self.updated_at: Optional[float] = None
+
+    # --- lifecycle ---------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start the loop thread if it isn't running yet. Returns immediately.
+        """
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="ib-broker", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self.loop is not None and self.ib is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.ib.disconnect)
+            except RuntimeError:
+                pass
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ib = IB()
+        self.ib.updatePortfolioEvent += self._on_portfolio
+        self.ib.accountValueEvent += self._on_account_value
+        self.ib.accountSummaryEvent += self._on_account_value
+        self.ib.orderStatusEvent += self._on_order_status
+        self.ib.newOrderEvent += self._on_order_status
+        self.ib.disconnectedEvent += self._on_disconnected
+        ready.set()
+        self.loop.run_until_complete(self._maintain_connection())
+
+    async def _maintain_connection(self) -> None:
+        while not self._stopping:
+            if not self.ib.isConnected():
+                try:
+                    with metrics.track_upstream("ib", "connectAsync"):
+                        await self.ib.connectAsync(self.host, self.port, clientId=self.client_id)
+                    self._load_initial_snapshot()
+                    self._connected.set()
+                except Exception as e:
+                    print(f"Error connecting to IB: {e}")
+            await asyncio.sleep(self.reconnect_interval)
+
+    def _load_initial_snapshot(self) -> None:
+        with self._lock:
+            self._portfolio = {item.contract.conId: item for item in self.ib.portfolio()}
+            self._account_values = {(v.tag, v.currency, v.account): v for v in self.ib.accountValues()}
+            self._trades = {t.order.orderId: t for t in self.ib.trades()}
+            self.updated_at = time.time()
+
+    # --- event handlers (loop thread) ---------------------------------------
+
+    def _on_portfolio(self, item: PortfolioItem) -> None:
+        with self._lock:
+            if item.position:
+                self._portfolio[item.contract.conId] = item
+            else:
+                self._portfolio.pop(item.contract.conId, None)
+            self.updated_at = time.time()
+
+    def _on_account_value(self, value: AccountValue) -> None:
+        with self._lock:
+            self._account_values[(value.tag, value.currency, value.account)] = value
+            self.updated_at = time.time()
+
+    def _on_order_status(self, trade: Trade) -> None:
+        with self._lock:
+            self._trades[trade.order.orderId] = trade
+            self.updated_at = time.time()
+
+    def _on_disconnected(self) -> None:
+        self._connected.clear()
+        print("Disconnected from IB, will retry")
+
+    # --- snapshot reads (any thread, never block) ---------------------------
+
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout: float) -> bool:
+        """
+        Start the service if needed and wait up to ``timeout`` seconds for a connection.
+        Only for write paths; page reads should use ``is_connected``.
+        """
+        self.start()
+        return self._connected.wait(timeout)
+
+    def portfolio(self) -> List[PortfolioItem]:
+        with self._lock:
+            return list(self._portfolio.values())
+
+    def account_value(self, tag: str, currency: Optional[str] = None) -> Optional[str]:
+        """
+        Latest value for an account tag such as 'NetLiquidation', optionally for one currency.
+        """
+        with self._lock:
+            for (value_tag, value_currency, _), value in self._account_values.items():
+                if value_tag == tag and (currency is None or value_currency == currency):
+                    return value.value
+        return None
+
+    def account_values(self, tag: str) -> Dict[str, str]:
+        """
+        Latest values for an account tag by currency, e.g. 'ExchangeRate' -> {'EUR': '1.08', ...}.
+        """
+        with self._lock:
+            return {value_currency: value.value
+                    for (value_tag, value_currency, _), value in self._account_values.items() if value_tag == tag}
+
+    def net_liquidation(self) -> Optional[float]:
+        value = self.account_value('NetLiquidation')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def trades(self) -> List[Trade]:
+        with self._lock:
+            return list(self._trades.values())
+
+    # --- work on the loop thread ---------------------------------------------
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Run ``fn(*args)`` (or await it, if it returns a coroutine) on the IB loop thread.
+
+        Returns:
+            Future: Resolves with the result without blocking the caller
+        """
+        self.start()
+        future: Future = Future()
+
+        def run():
+            try:
+                result = fn(*args)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result).add_done_callback(lambda task: _copy_outcome(task, future))
+                else:
+                    future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+
+        # latency as seen by the caller, including the wait for the loop thread
+        start = time.perf_counter()
+        name = getattr(fn, "__name__", "call")
+        future.add_done_callback(lambda f: metrics.observe_upstream(
+            "ib", name, time.perf_counter() - start, error=f.cancelled() or f.exception() is not None))
+        self.loop.call_soon_threadsafe(run)
+        return future
+
+    def call(self, fn: Callable[..., Any], *args: Any, timeout: float = 5.0) -> Any:
+        """
+        Run ``fn(*args)`` on the IB loop thread and wait up to ``timeout`` seconds for its result.
+        """
+        return self.submit(fn, *args).result(timeout=timeout)
+
+
+broker = BrokerService()
@@ -0,0 +1,280 @@
+"""
+High-water mark and NLV history for drawdown calculations.
+
+The high-water mark lives in memory and is written to ``high_water_mark.json``
+by a background thread, so request threads never touch the disk. NLV samples
+are appended to ``nlv_history.bin`` as fixed 16-byte records (timestamp, NLV)
+and kept in memory for current, max and rolling drawdown queries. The running
+peak and all-time max drawdown are updated as samples arrive; windowed queries
+scan the window with NumPy.
+"""
+
+import atexit
+import json
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DRAWDOWN_DATA_DIR = Path(os.getenv('DRAWDOWN_DATA_DIR', Path(__file__).resolve().parent))
+# Minimum spacing between stored NLV samples, in seconds
+NLV_SAMPLE_INTERVAL = float(os.getenv('NLV_SAMPLE_INTERVAL', '60'))
+# Windows reported by stats(), e.g. "1h,1d,7d,30d"
+DRAWDOWN_WINDOWS = os.getenv('DRAWDOWN_WINDOWS', '1h,1d,7d,30d')
+# Most samples history() returns; longer windows are downsampled
+HISTORY_MAX_POINTS = int(os.getenv('DRAWDOWN_HISTORY_MAX_POINTS', '1000'))
+
+SAMPLE_FORMAT = struct.Struct('<dd')
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_window(window: str) -> float:
+    """
+    Convert a window like '90s', '15m', '4h', '7d' or '2w' to seconds.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", str(window))
+    if not match:
+        raise ValueError(f"Invalid window: {window}. Use a number with an optional s/m/h/d/w suffix")
+    return float(match.group(1)) * WINDOW_UNITS[match.group(2) or 's']
+
+
+def _drawdown_pct(peak: float, value: float) -> float:
+    if peak <= 0:
+        return 0.0
+    return round((peak - value) / peak * 100, 2)
+
+
+class DrawdownStore:
+    """
+    In-memory high-water mark plus an append-only NLV time series.
+    """
+
+    def __init__(self, data_dir: Path = DRAWDOWN_DATA_DIR, sample_interval: float = NLV_SAMPLE_INTERVAL):
+        self.data_dir = Path(data_dir)
+        self.hwm_file = self.data_dir / "high_water_mark.json"
+        self.history_file = self.data_dir / "nlv_history.bin"
+        self.sample_interval = sample_interval
+
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._loaded = False
+        self._hwm = 0.0
+        self._hwm_dirty = False
+        self._times = array('d')
+        self._values = array('d')
+        # running peak of the stored samples and the largest drawdown from it so far
+        self._peak = 0.0
+        self._max_drawdown = 0.0
+        self._pending: List[Tuple[float, float]] = []
+
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    def _load(self) -> None:
+        # called with the lock held
+        if self._loaded:
+            return
+        self._loaded = True
+        hwm_file = self.hwm_file
+        if not hwm_file.exists() and Path("high_water_mark.json").exists():
+            # older versions kept the file in the working directory
+            hwm_file = Path("high_water_mark.json")
+        try:
+            if hwm_file.exists():
+                with open(hwm_file, 'r') as f:
+                    self._hwm = float(json.load(f).get('high_water_mark', 0))
+        except Exception as e:
+            print(f"Error reading high water mark: {e}")
+
+        try:
+            if self.history_file.exists():
+                raw = self.history_file.read_bytes()
+                usable = len(raw) - len(raw) % SAMPLE_FORMAT.size  # ignore a torn last record
+                for ts, nlv in SAMPLE_FORMAT.iter_unpack(raw[:usable]):
+                    self._append(ts, nlv)
+        except Exception as e:
+            print(f"Error reading NLV history: {e}")
+
+    def _append(self, timestamp: float, nlv: float) -> None:
+        # called with the lock held
+        self._times.append(timestamp)
+        self._values.append(nlv)
+        if nlv > self._peak:
+            self._peak = nlv
+        elif self._peak > 0:
+            self._max_drawdown = max(self._max_drawdown, (self._peak - nlv) / self._peak * 100)
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="drawdown-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Persist the high-water mark and any pending NLV samples now.
+        """
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                hwm = self._hwm if self._hwm_dirty else None
+                self._hwm_dirty = False
+            self._persist(pending, hwm)
+
+    def _persist(self, pending: List[Tuple[float, float]], hwm: Optional[float]) -> None:
+        try:
+            if pending:
+                self.data_dir.mkdir(parents=True, exist_ok=True)
+                with open(self.history_file, 'ab') as f:
+                    f.write(b"".join(SAMPLE_FORMAT.pack(ts, nlv) for ts, nlv in pending))
+            if hwm is not None:
+                tmp_path = self.hwm_file.with_suffix(".json.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump({'high_water_mark': hwm}, f)
+                os.replace(tmp_path, self.hwm_file)
+        except Exception as e:
+            print(f"Error persisting drawdown data: {e}")
+
+    def record(self, nlv: float, timestamp: Optional[float] = None) -> float:
+        """
+        Record a Net Liquidation Value observation.
+
+        Args:
+            nlv: Current Net Liquidation Value
+            timestamp: Epoch seconds of the observation, defaults to now
+
+        Returns:
+            float: Current drawdown as a percentage of the high-water mark
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._load()
+            if nlv > self._hwm:
+                self._hwm = nlv
+                self._hwm_dirty = True
+            if nlv > 0 and (not self._times or timestamp - self._times[-1] >= self.sample_interval):
+                self._append(timestamp, nlv)
+                self._pending.append((timestamp, nlv))
+            dirty = self._hwm_dirty or bool(self._pending)
+            drawdown = _drawdown_pct(self._hwm, nlv)
+
+        if dirty:
+            self._start_writer()
+            self._wakeup.set()
+        return drawdown
+
+    @property
+    def high_water_mark(self) -> float:
+        with self._lock:
+            self._load()
+            return self._hwm
+
+    def _window(self, window: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+        # called with the lock held; returns copies so the arrays can keep growing
+        start = 0
+        if window is not None and self._times:
+            start = bisect_left(self._times, self._times[-1] - window)
+        return (np.frombuffer(self._times[start:], dtype=np.float64),
+                np.frombuffer(self._values[start:], dtype=np.float64))
+
+    @staticmethod
+    def _drawdowns(values: np.ndarray) -> np.ndarray:
+        # percent drawdown of every sample from the running peak before it
+        peaks = np.maximum.accumulate(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdowns = np.where(peaks > 0, (peaks - values) / peaks * 100, 0.0)
+        return drawdowns
+
+    def current_drawdown(self) -> float:
+        """
+        Drawdown of the latest sample from the all-time high-water mark.
+        """
+        with self._lock:
+            self._load()
+            if not self._values:
+                return 0.0
+            return _drawdown_pct(self._hwm, self._values[-1])
+
+    def _window_stats(self, window: float) -> Tuple[float, float]:
+        # (max drawdown, rolling drawdown) over the trailing window in one pass
+        with self._lock:
+            self._load()
+            _, values = self._window(window)
+        if not len(values):
+            return 0.0, 0.0
+        drawdowns = self._drawdowns(values)
+        return round(float(drawdowns.max()), 2), _drawdown_pct(float(values.max()), float(values[-1]))
+
+    def max_drawdown(self, window: Optional[float] = None) -> float:
+        """
+        Largest peak-to-trough drawdown within the trailing ``window`` seconds
+        (all history when None).
+        """
+        if window is None:
+            with self._lock:
+                self._load()
+                return round(self._max_drawdown, 2)
+        return self._window_stats(window)[0]
+
+    def rolling_drawdown(self, window: float) -> float:
+        """
+        Drawdown of the latest sample from the highest sample in the trailing ``window`` seconds.
+        """
+        return self._window_stats(window)[1]
+
+    def history(self, window: Optional[float] = None, max_points: int = HISTORY_MAX_POINTS) -> List[Dict[str, float]]:
+        """
+        NLV samples in the trailing window, each with its drawdown from the running peak.
+        Longer windows are downsampled to at most ``max_points`` evenly spaced samples,
+        always keeping the latest one and the deepest drawdown.
+        """
+        with self._lock:
+            self._load()
+            times, values = self._window(window)
+        if not len(values):
+            return []
+        drawdowns = self._drawdowns(values)
+        indices = np.arange(len(values))
+        if max_points > 0 and len(values) > max_points:
+            last = len(values) - 1
+            # the latest sample always fits; the deepest drawdown needs a second slot
+            picks = [np.linspace(0, last, max(0, max_points - 2)).astype(np.int64), [last]]
+            if max_points > 1:
+                picks.append([int(drawdowns.argmax())])
+            indices = np.unique(np.concatenate(picks))
+        return [{"t": float(times[i]), "nlv": float(values[i]), "drawdown": round(float(drawdowns[i]), 2)}
+                for i in indices]
+
+    def stats(self, windows: str = DRAWDOWN_WINDOWS) -> Dict[str, object]:
+        """
+        Current drawdown plus max and rolling drawdown for each configured window.
+        """
+        result = {
+            "high_water_mark": self.high_water_mark,
+            "current": self.current_drawdown(),
+            "max": self.max_drawdown(),
+            "windows": {}
+        }
+        for window in [w.strip() for w in windows.split(",") if w.strip()]:
+            worst, rolling = self._window_stats(parse_window(window))
+            result["windows"][window] = {
+                "max": worst,
+                "rolling": rolling
+            }
+        return result
+
+
+drawdown_store = DrawdownStore()
@@ -0,0 +1,361 @@
+"""
+Shared HTTP client for the IB Client Portal gateway.
+
+Every route talks to the gateway through the module-level ``gateway`` instance so
+that requests reuse pooled keep-alive connections instead of paying a fresh
+TCP+TLS handshake per call.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from request_pacer import RequestPacer
+from singleflight import SingleFlight
+from ttl_cache import TTLCache
+
+# disable warnings until you install a certificate
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+GATEWAY_PORT = os.getenv('GATEWAY_PORT', '5055')  # IB Gateway port
+BASE_API_URL = f"https://localhost:{GATEWAY_PORT}/v1/api"
+
+_MISSING = object()
+
+POOL_SIZE = int(os.getenv('GATEWAY_POOL_SIZE', '20'))
+READ_RETRIES = int(os.getenv('GATEWAY_READ_RETRIES', '2'))
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (
+    float(os.getenv('GATEWAY_CONNECT_TIMEOUT', '3.05')),
+    float(os.getenv('GATEWAY_READ_TIMEOUT', '10')),
+)
+
+# Endpoints known to answer slowly get a longer read timeout.
+# Matched by path prefix, longest prefix wins.
+ENDPOINT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "/iserver/scanner/params": (DEFAULT_TIMEOUT[0], 30),
+    "/iserver/scanner/run": (DEFAULT_TIMEOUT[0], 20),
+    "/iserver/marketdata/history": (DEFAULT_TIMEOUT[0], 20),
+    "/iserver/account/": (DEFAULT_TIMEOUT[0], 15),
+}
+
+# Read-through cache TTLs in seconds for (method, path pattern).
+# Endpoints that are not listed here are never cached.
+CACHE_TTLS: List[Tuple[str, Pattern, float]] = [
+    ("GET", re.compile(r"^/portfolio/accounts$"), 60),
+    ("GET", re.compile(r"^/portfolio/[^/]+/summary$"), 5),
+    ("GET", re.compile(r"^/portfolio/[^/]+/positions/\d+$"), 5),
+    ("GET", re.compile(r"^/iserver/watchlists$"), 30),
+    ("GET", re.compile(r"^/iserver/secdef/search$"), 300),
+    ("POST", re.compile(r"^/trsrv/secdef$"), 3600),
+    # keyed by the scan parameters, so paging through results reuses one scan
+    ("POST", re.compile(r"^/iserver/scanner/run$"), float(os.getenv('SCANNER_RESULTS_TTL', '120'))),
+]
+CACHE_SIZE = int(os.getenv('GATEWAY_CACHE_SIZE', '512'))
+# How long a cached response may still be served while the gateway is unreachable
+STALE_TTL = float(os.getenv('GATEWAY_STALE_TTL', '3600'))
+
+# Consecutive failures that open the circuit, and seconds before it lets a probe through
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('GATEWAY_BREAKER_THRESHOLD', '3'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('GATEWAY_BREAKER_RESET', '10'))
+BREAKER_FAILURE_STATUSES = (502, 503, 504)
+
+# Times a request answered with 429 is re-queued behind the pacer's backoff
+RATE_LIMIT_RETRIES = int(os.getenv('GATEWAY_RATE_LIMIT_RETRIES', '2'))
+
+
+class GatewayUnavailable(requests.ConnectionError):
+    """
+    Raised without touching the network while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a gateway that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests fail immediately. Once ``reset_timeout`` seconds have passed a
+    single probe request is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        return self.admit()[0]
+
+    def admit(self) -> Tuple[bool, bool]:
+        """
+        Returns:
+            Tuple[bool, bool]: (whether the request may go out, whether it is
+            the half-open probe, which must end in ``record_success``,
+            ``record_failure`` or ``abort_probe``)
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True, False
+            if not self._probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._probing = True
+                return True, True
+            return False, False
+
+    def abort_probe(self) -> None:
+        """
+        Give up the probe slot without an outcome, e.g. when the probe never got
+        a pacing slot, so the next request can probe instead.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Gateway unreachable after {self.failures} failures, failing fast for {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class GatewayClient:
+    """
+    Thin wrapper around a pooled ``requests.Session`` for the Client Portal API.
+
+    Idempotent reads (GET/HEAD) are retried on connection errors and gateway
+    5xx responses; writes are never retried once the request has been sent.
+    A circuit breaker fails requests fast while the gateway is down, and cached
+    reads fall back to their last good response in the meantime. Identical
+    concurrent reads share a single in-flight request, and every request
+    that does go out is paced by ``request_pacer`` to stay within IB's rate limits.
+    """
+
+    def __init__(self, base_url: str = BASE_API_URL, pool_size: int = POOL_SIZE,
+                 read_retries: int = READ_RETRIES, cache_size: int = CACHE_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.cache = TTLCache(maxsize=cache_size)
+        # last good response per cache key, kept after the fresh entry expires
+        self.stale = TTLCache(maxsize=cache_size, default_ttl=STALE_TTL)
+        self.breaker = CircuitBreaker()
+        self.in_flight = SingleFlight()
+        self.pacer = RequestPacer()
+        self.session = requests.Session()
+        # self-signed gateway certificate
+        self.session.verify = False
+
+        retry = Retry(
+            total=read_retries,
+            connect=read_retries,
+            read=read_retries,
+            status=read_retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @staticmethod
+    def timeout_for(path: str) -> Tuple[float, float]:
+        """
+        Look up the (connect, read) timeout for an endpoint path.
+        """
+        path = "/" + path.lstrip("/")
+        best = None
+        for prefix in ENDPOINT_TIMEOUTS:
+            if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return ENDPOINT_TIMEOUTS[best] if best else DEFAULT_TIMEOUT
+
+    def request(self, method: str, path: str, timeout: Optional[Tuple[float, float]] = None,
+                use_breaker: bool = True, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session.
+
+        Args:
+            use_breaker: Set to False for health checks that must reach the
+                gateway even while the circuit is open; their outcome still
+                updates the breaker
+
+        Raises:
+            GatewayUnavailable: The circuit is open
+        """
+        if timeout is None:
+            timeout = self.timeout_for(path)
+        if method in ("GET", "HEAD"):
+            # identical concurrent reads share one request and its response
+            key = (method, "/" + path.lstrip("/"), json.dumps(kwargs, sort_keys=True, default=str), use_breaker)
+            return self.in_flight.do(key, lambda: self._send(method, path, timeout, use_breaker, **kwargs))
+        return self._send(method, path, timeout, use_breaker, **kwargs)
+
+    def _send(self, method: str, path: str, timeout: Tuple[float, float], use_breaker: bool,
+              **kwargs) -> requests.Response:
+        allowed, probe = self.breaker.admit() if use_breaker else (True, False)
+        if not allowed:
+            raise GatewayUnavailable(f"Gateway unavailable, not sending {method} {path}")
+        recorded = False
+        try:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                # waits for a rate-limit slot; may raise PacingTimeout
+                endpoint = self.pacer.acquire(method, path)
+                start = time.perf_counter()
+                try:
+                    r = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    self.pacer.release(endpoint)
+                    self.breaker.record_failure()
+                    recorded = True
+                    self._observe(method, path, start, error=True)
+                    raise
+                except Exception:
+                    self.pacer.release(endpoint)
+                    self._observe(method, path, start, error=True)
+                    raise
+                self._observe(method, path, start, error=r.status_code >= 500 or r.status_code == 429)
+                # a 429 was not processed by IB, so even writes are safe to resend
+                backoff = self.pacer.release(endpoint, r)
+                if backoff is None or attempt == RATE_LIMIT_RETRIES:
+                    break
+                print(f"Gateway rate limit hit on {method} {path}, retrying in {backoff:.1f}s")
+            if r.status_code in BREAKER_FAILURE_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            recorded = True
+            return r
+        finally:
+            # a probe that ended without an outcome must not hold the circuit half-open
+            if probe and not recorded:
+                self.breaker.abort_probe()
+
+    @staticmethod
+    def _observe(method: str, path: str, start: float, error: bool) -> None:
+        metrics.observe_upstream("gateway", f"{method} {metrics.path_template(path)}",
+                                 time.perf_counter() - start, error)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    @staticmethod
+    def cache_ttl(method: str, path: str) -> Optional[float]:
+        path = "/" + path.lstrip("/")
+        for cached_method, pattern, ttl in CACHE_TTLS:
+            if cached_method == method and pattern.match(path):
+                return ttl
+        return None
+
+    def request_json(self, method: str, path: str, default: Any = None, **kwargs) -> Any:
+        """
+        Send a request and return the decoded JSON body, served from the
+        read-through cache when the endpoint has a TTL in ``CACHE_TTLS``.
+
+        Args:
+            method: HTTP method
+            path: Endpoint path relative to the API root, e.g. '/portfolio/accounts'
+            default: Value returned when the gateway answers with an empty body
+            **kwargs: Passed through to ``requests`` (params, data, json, ...)
+
+        Returns:
+            Any: Decoded JSON response
+        """
+        path = "/" + path.lstrip("/")
+        ttl = self.cache_ttl(method, path)
+        if ttl is None:
+            r = self.request(method, path, **kwargs)
+            return r.json() if r.content else default
+
+        key = (method, path, json.dumps(kwargs, sort_keys=True, default=str))
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        # concurrent misses for the same key share one fetch
+        return self.in_flight.do(("json",) + key, lambda: self._fetch_json(key, ttl, default, **kwargs))
+
+    def _fetch_json(self, key: Tuple[str, str, str], ttl: float, default: Any, **kwargs) -> Any:
+        method, path, _ = key
+        try:
+            r = self.request(method, path, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            # gateway down or restarting: serve the last good response if there is one
+            value = self.stale.get(key, _MISSING)
+            if value is _MISSING:
+                raise
+            return value
+        value = r.json() if r.content else default
+        # never cache gateway errors
+        if r.ok:
+            self.cache.set(key, value, ttl)
+            self.stale.set(key, value)
+        return value
+
+    def get_json(self, path: str, default: Any = None, **kwargs) -> Any:
+        return self.request_json("GET", path, default=default, **kwargs)
+
+    def post_json(self, path: str, default: Any = None, **kwargs) -> Any:
+        return self.request_json("POST", path, default=default, **kwargs)
+
+    def invalidate(self, *prefixes: str) -> int:
+        """
+        Drop cached responses whose path starts with any of ``prefixes``.
+        Call this after any request that mutates gateway state.
+
+        Returns:
+            int: Number of cache entries removed
+        """
+        return self.cache.invalidate(lambda key: key[1].startswith(prefixes))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# Shared client used by every route
+gateway = GatewayClient()
+
+metrics.register_cache("gateway", gateway.cache)
+metrics.register_cache("gateway_stale", gateway.stale)
+metrics.register_gauge("webapp_gateway_queued_requests", "Gateway requests waiting for a pacing slot.", ("lane",),
+                       lambda: {(lane,): stats["queued"] for lane, stats in gateway.pacer.stats()["lanes"].items()})
+metrics.register_gauge("webapp_gateway_circuit_open", "1 while the gateway circuit breaker is not closed.", (),
+                       lambda: {(): int(gateway.breaker.state != "closed")})
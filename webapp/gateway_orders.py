@@ -0,0 +1,145 @@
+"""
+Batch order placement through the Client Portal gateway.
+
+Every order in a batch is validated with ``validate_order_parameters`` before
+anything is sent. Brackets go out as a single gateway call (parent plus children
+linked by cOID); independent orders and brackets are then submitted
+concurrently over the pooled gateway session.
+"""
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from broker_data import validate_order_parameters
+from gateway_client import GatewayClient, gateway
+
+BATCH_WORKERS = 8
+
+# Order types as named by validate_order_parameters -> Client Portal names
+GATEWAY_ORDER_TYPES = {
+    'MKT': 'MKT',
+    'LMT': 'LMT',
+    'STP': 'STP',
+    'STP LMT': 'STOP_LIMIT',
+    'TRAIL': 'TRAIL',
+    'TRAIL LIMIT': 'TRAILLMT',
+}
+
+
+def _validate(spec: Dict[str, Any]) -> None:
+    if 'conid' not in spec:
+        raise ValueError("conid is required")
+    validate_order_parameters(
+        direction=spec.get('side', ''),
+        size=float(spec.get('quantity', 0)),
+        order_type=spec.get('orderType', 'LMT'),
+        limit_price=spec.get('price'),
+        stop_price=spec.get('auxPrice'),
+        trailing_amount=spec.get('trailingAmt'),
+        trailing_percent=spec.get('trailingPercent'),
+        tif=spec.get('tif', 'GTC'),
+        bracket_params=spec.get('bracket')
+    )
+
+
+def _gateway_order(spec: Dict[str, Any]) -> Dict[str, Any]:
+    order_type = spec.get('orderType', 'LMT').upper()
+    order = {
+        "conid": int(spec['conid']),
+        "orderType": GATEWAY_ORDER_TYPES[order_type],
+        "quantity": float(spec['quantity']),
+        "side": spec['side'].upper(),
+        "tif": spec.get('tif', 'GTC').upper(),
+    }
+    if order_type == 'STP':
+        # the gateway takes a plain stop order's trigger in 'price'
+        order["price"] = float(spec['auxPrice'])
+    else:
+        if spec.get('price') is not None:
+            order["price"] = float(spec['price'])
+        if spec.get('auxPrice') is not None:
+            order["auxPrice"] = float(spec['auxPrice'])
+    if spec.get('trailingAmt') is not None:
+        order["trailingAmt"] = float(spec['trailingAmt'])
+        order["trailingType"] = "amt"
+    elif spec.get('trailingPercent') is not None:
+        order["trailingAmt"] = float(spec['trailingPercent'])
+        order["trailingType"] = "%"
+    return order
+
+
+def build_order_group(spec: Dict[str, Any], index: int, batch_id: str) -> List[Dict[str, Any]]:
+    """
+    Turn one order spec into the gateway order list: a single order, or a
+    bracket of entry, take profit and stop loss linked by cOID/parentId.
+    """
+    entry = _gateway_order(spec)
+    bracket = spec.get('bracket')
+    if not bracket:
+        return [entry]
+
+    parent_id = f"{batch_id}-{index}"
+    entry["cOID"] = parent_id
+    exit_side = 'SELL' if entry["side"] == 'BUY' else 'BUY'
+    take_profit = {
+        "conid": entry["conid"], "orderType": "LMT", "price": float(bracket['take_profit']),
+        "quantity": entry["quantity"], "side": exit_side, "tif": entry["tif"], "parentId": parent_id,
+    }
+    stop_loss = {
+        "conid": entry["conid"], "orderType": "STP", "price": float(bracket['stop_loss']),
+        "quantity": entry["quantity"], "side": exit_side, "tif": entry["tif"], "parentId": parent_id,
+    }
+    if bracket.get('trailing_stop'):
+        stop_loss.update(orderType="TRAIL", trailingAmt=float(bracket['trailing_stop']), trailingType="amt")
+    return [entry, take_profit, stop_loss]
+
+
+def place_orders_batch(account_id: str, specs: List[Dict[str, Any]],
+                       client: GatewayClient = gateway) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Validate and place a list of orders and brackets.
+
+    Args:
+        account_id: IB account to place the orders in
+        specs: Order specs with conid, side, quantity, orderType, price, auxPrice,
+            trailingAmt/trailingPercent, tif and an optional
+            bracket {'take_profit', 'stop_loss', 'trailing_stop'}
+        client: Gateway client to send the orders with
+
+    Returns:
+        Tuple[bool, List[Dict[str, Any]]]: (whether the batch was submitted, one
+        result per spec with its index and either the gateway response or an error)
+    """
+    # cOIDs must be unique per account, even for batches placed in the same millisecond
+    batch_id = f"batch-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    groups = []
+    errors = []
+    for index, spec in enumerate(specs):
+        # building the group coerces every field, so a bad value is reported
+        # against its order instead of failing the whole request
+        try:
+            _validate(spec)
+            groups.append(build_order_group(spec, index, batch_id))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            errors.append({"index": index, "error": str(e)})
+    if errors:
+        # nothing is sent unless every order is valid
+        return False, errors
+
+    def submit(group):
+        r = client.post(f"/iserver/account/{account_id}/orders", json={"orders": group})
+        return r.json() if r.content else None
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(groups)))) as pool:
+        futures = [pool.submit(submit, group) for group in groups]
+        for index, future in enumerate(futures):
+            try:
+                results.append({"index": index, "response": future.result()})
+            except Exception as e:
+                results.append({"index": index, "error": str(e)})
+
+    client.invalidate("/portfolio/")
+    return True, results
@@ -0,0 +1,137 @@
+"""
+Keeps the Client Portal session alive and tracks whether it is usable.
+
+A background thread tickles the gateway on a schedule and checks
+``/iserver/auth/status``. If the brokerage session has lapsed while the
+gateway is still up, it asks for re-authentication, backing off between
+attempts and never while another login (``competing``) holds the brokerage
+session, which re-authenticating would kick out. When the session becomes
+authenticated again, it pre-warms ``/iserver/accounts``, which the gateway
+requires before most ``/iserver`` calls, along with the cached account list.
+These calls bypass the circuit breaker, so they also act as its recovery probe.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from gateway_client import GatewayClient, gateway
+
+TICKLE_INTERVAL = float(os.getenv('GATEWAY_TICKLE_INTERVAL', '60'))
+# Poll faster while the gateway is down or unauthenticated
+TICKLE_RETRY_INTERVAL = float(os.getenv('GATEWAY_TICKLE_RETRY_INTERVAL', '5'))
+# Re-authentication attempts back off from TICKLE_RETRY_INTERVAL, doubling up to this
+REAUTH_BACKOFF_MAX = float(os.getenv('GATEWAY_REAUTH_BACKOFF_MAX', '300'))
+
+
+class GatewaySession:
+    """
+    Background keepalive plus the latest known session status.
+    """
+
+    def __init__(self, client: GatewayClient = gateway, interval: float = TICKLE_INTERVAL,
+                 retry_interval: float = TICKLE_RETRY_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.retry_interval = retry_interval
+
+        self.reachable = False
+        self.authenticated = False
+        self.connected = False
+        self.competing = False
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reauth_attempts = 0
+        self._next_reauth = 0.0
+
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def start(self) -> None:
+        """
+        Start the keepalive thread if it isn't running yet. Returns immediately.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="gateway-session", daemon=True)
+            self._thread.start()
+
+    def check_now(self) -> None:
+        """
+        Wake the keepalive thread for an immediate check.
+        """
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self.check()
+            self._wakeup.wait(self.interval if self.authenticated else self.retry_interval)
+            self._wakeup.clear()
+
+    def check(self) -> Dict[str, Any]:
+        """
+        Tickle the gateway, refresh the auth status and react to changes.
+
+        Returns:
+            Dict[str, Any]: The new status
+        """
+        was_authenticated = self.authenticated
+        try:
+            self.client.request("POST", "/tickle", use_breaker=False)
+            r = self.client.request("POST", "/iserver/auth/status", use_breaker=False)
+            status = r.json() if r.content else {}
+            self.reachable = True
+            self.authenticated = bool(status.get("authenticated"))
+            self.connected = bool(status.get("connected"))
+            self.competing = bool(status.get("competing"))
+            self.last_error = None
+        except Exception as e:
+            self.reachable = self.authenticated = self.connected = False
+            self.last_error = str(e)
+        self.last_check = time.time()
+
+        if self.authenticated:
+            self.reauth_attempts = 0
+            self._next_reauth = 0.0
+            if not was_authenticated:
+                self._prewarm()
+        elif (self.reachable and self.connected and not self.competing
+              and time.monotonic() >= self._next_reauth):
+            self._reauthenticate()
+        return self.status()
+
+    def _reauthenticate(self) -> None:
+        self._next_reauth = time.monotonic() + min(REAUTH_BACKOFF_MAX,
+                                                   self.retry_interval * 2 ** self.reauth_attempts)
+        self.reauth_attempts += 1
+        try:
+            self.client.request("POST", "/iserver/reauthenticate", use_breaker=False)
+        except Exception as e:
+            print(f"Error requesting gateway re-authentication: {e}")
+
+    def _prewarm(self) -> None:
+        print("Gateway session authenticated, pre-warming accounts")
+        try:
+            self.client.request("GET", "/iserver/accounts")
+            self.client.invalidate("/portfolio/accounts")
+            self.client.get_json("/portfolio/accounts")
+        except Exception as e:
+            print(f"Error pre-warming gateway accounts: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "reachable": self.reachable,
+            "authenticated": self.authenticated,
+            "connected": self.connected,
+            "competing": self.competing,
+            "reauth_attempts": self.reauth_attempts,
+            "breaker": self.client.breaker.state,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+gateway_session = GatewaySession()
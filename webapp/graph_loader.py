@@ -1,55 +1,202 @@
 import json
+import re
+import threading
+from collections import defaultdict
 from pathlib import Path
 import os
 
 GRAPH_DIR = Path(__file__).resolve().parent.parent / "graph"
+GRAPH_FILES = {
+    "concepts": "concepts.json",
+    "rules": "rules.json",
+    "examples": "examples.json",
+    "edges": "edges.json"
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def tokenize(text):
+    """
+    Split text into lowercase tokens. Hyphenated words are kept whole and also
+    split into their parts, so "Hedge-Only Zone" yields hedge-only, hedge, only, zone.
+    """
+    tokens = set()
+    for token in TOKEN_RE.findall(str(text).lower()):
+        tokens.add(token)
+        if "-" in token:
+            tokens.update(token.split("-"))
+    return tokens
+
+
+class KnowledgeGraph:
+    """
+    Parsed graph files plus lookup indexes built once per load.
+    """
+
+    def __init__(self, data, version=None):
+        self.data = data
+        self.version = version
+        self.error = data.get("error")
+        self.concepts = data["concepts"]
+        self.rules = data["rules"]
+        self.examples = data["examples"]
+        self.edges = data["edges"]
+
+        self.concepts_by_id = {c["id"]: c for c in self.concepts if "id" in c}
+        self.rules_by_id = {r["id"]: r for r in self.rules if "id" in r}
+
+        # Adjacency lists: node id -> edges leaving / entering it
+        self.outgoing = defaultdict(list)
+        self.incoming = defaultdict(list)
+        # token -> edge targets containing it, for fuzzy target lookups
+        self.target_tokens = defaultdict(set)
+        for edge in self.edges:
+            self.outgoing[edge.get("from", "")].append(edge)
+            self.incoming[edge.get("to", "")].append(edge)
+            for token in tokenize(edge.get("to", "")):
+                self.target_tokens[token].add(edge.get("to", ""))
+
+        # token -> concept ids, separately for names and descriptions
+        self.name_tokens = defaultdict(set)
+        self.description_tokens = defaultdict(set)
+        for concept in self.concepts:
+            concept_id = concept.get("id", concept.get("name"))
+            for token in tokenize(concept.get("name", "")):
+                self.name_tokens[token].add(concept_id)
+            for token in tokenize(concept.get("description", "")):
+                self.description_tokens[token].add(concept_id)
+
+        # token -> rule ids
+        self.rule_tokens = defaultdict(set)
+        for rule in self.rules:
+            for token in tokenize(rule.get("rule", "")):
+                self.rule_tokens[token].add(rule.get("id"))
+
+    def find_concepts(self, name_token=None, description_token=None):
+        """
+        Return concepts whose name contains ``name_token`` and whose description
+        contains ``description_token`` (either may be omitted).
+        """
+        ids = None
+        if name_token is not None:
+            ids = set(self.name_tokens.get(name_token.lower(), ()))
+        if description_token is not None:
+            matches = self.description_tokens.get(description_token.lower(), set())
+            ids = set(matches) if ids is None else ids & matches
+        if ids is None:
+            return list(self.concepts)
+        return [c for c in self.concepts if c.get("id", c.get("name")) in ids]
+
+    def targets_matching(self, token):
+        """
+        Return edge targets that contain ``token``.
+        """
+        return sorted(self.target_tokens.get(token.lower(), ()))
+
+    def neighbours(self, node_id):
+        """
+        Return (outgoing, incoming) edges for a node id.
+        """
+        return self.outgoing.get(node_id, []), self.incoming.get(node_id, [])
+
+
+_cache_lock = threading.Lock()
+_cached_graph = None
+
+
+def _read_graph_files():
+    def load_file(filename):
+        file_path = GRAPH_DIR / filename
+        if not file_path.exists():
+            raise FileNotFoundError(f"File not found: {filename}")
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            return data
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in {filename}: {str(e)}")
+
+    # Ensure graph directory exists
+    if not GRAPH_DIR.exists():
+        raise FileNotFoundError(f"Graph directory not found at {GRAPH_DIR}")
+
+    # Load all required files
+    data = {key: load_file(filename) for key, filename in GRAPH_FILES.items()}
+
+    # Validate data structure
+    if not isinstance(data["concepts"], list):
+        raise ValueError("concepts.json must contain a list of concepts")
+    if not isinstance(data["rules"], list):
+        raise ValueError("rules.json must contain a list of rules")
+    if not isinstance(data["edges"], list):
+        raise ValueError("edges.json must contain a list of edges")
+
+    return data
+
+
+def _graph_version():
+    """
+    Modification times of the graph files; a missing file yields None.
+    """
+    version = []
+    for filename in GRAPH_FILES.values():
+        try:
+            version.append(os.stat(GRAPH_DIR / filename).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def get_graph():
+    """
+    Return the cached KnowledgeGraph, reloading it only when a graph file's
+    modification time has changed since the last load.
+    """
+    global _cached_graph
+    version = _graph_version()
+    graph = _cached_graph
+    if graph is not None and graph.version == version:
+        return graph
+
+    with _cache_lock:
+        graph = _cached_graph
+        if graph is not None and graph.version == version:
+            return graph
+        try:
+            graph = KnowledgeGraph(_read_graph_files(), version)
+        except Exception as e:
+            error_msg = f"Error loading graph data: {str(e)}"
+            print(error_msg)
+            # Don't cache failures so a fixed file is picked up on the next call
+            return _empty_graph(error_msg)
+        _cached_graph = graph
+        return graph
+
+
+def _empty_graph(error_msg):
+    return KnowledgeGraph({
+        'error': error_msg,
+        'concepts': [],  # Provide empty defaults
+        'rules': [],
+        'edges': [],
+        'examples': []
+    })
+
+
+def get_cached_graph():
+    """
+    Return the last successfully loaded KnowledgeGraph without touching the disk,
+    or an empty graph carrying an error if nothing has been loaded yet.
+    """
+    graph = _cached_graph
+    return graph if graph is not None else _empty_graph("Graph data not loaded yet")
+
 
 def load_graph_data():
     """
     Load graph data from JSON files in the graph directory
-    Returns a dictionary containing concepts, rules, examples, and their relationships
-    """
-    try:
-        def load_file(filename):
-            file_path = GRAPH_DIR / filename
-            if not file_path.exists():
-                raise FileNotFoundError(f"File not found: {filename}")
-            try:
-                with open(file_path, "r") as f:
-                    data = json.load(f)
-                return data
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSON in {filename}: {str(e)}")
-
-        # Ensure graph directory exists
-        if not GRAPH_DIR.exists():
-            raise FileNotFoundError(f"Graph directory not found at {GRAPH_DIR}")
-
-        # Load all required files
-        data = {
-            "concepts": load_file("concepts.json"),
-            "rules": load_file("rules.json"),
-            "examples": load_file("examples.json"),
-            "edges": load_file("edges.json")
-        }
-
-        # Validate data structure
-        if not isinstance(data["concepts"], list):
-            raise ValueError("concepts.json must contain a list of concepts")
-        if not isinstance(data["rules"], list):
-            raise ValueError("rules.json must contain a list of rules")
-        if not isinstance(data["edges"], list):
-            raise ValueError("edges.json must contain a list of edges")
-
-        return data
-
-    except Exception as e:
-        error_msg = f"Error loading graph data: {str(e)}"
-        print(error_msg)
-        return {
-            'error': error_msg,
-            'concepts': [],  # Provide empty defaults
-            'rules': [],
-            'edges': [],
-            'examples': []
-        }
\ No newline at end of file
+    Returns a dictionary containing concepts, rules, examples, and their relationships.
+    The dictionary is shared by all callers until the files change, so don't modify it.
+    """
+    return get_graph().data
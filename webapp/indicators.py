@@ -0,0 +1,255 @@
+"""
+Vectorised technical indicators over the local bar store.
+
+Every indicator is computed over whole NumPy arrays. Results are kept per
+(conid, bar size); when the bar store appends bars or rewrites the forming
+tail bar, only the rows from the first changed bar onward are recomputed,
+seeded from the values already held for the rows before it.
+"""
+
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bar_store import BarSeries, BarStore, bar_store
+
+# Indicator periods; the rolling drawdown window is in bars
+SMA_PERIODS = (20, 50, 200)
+EMA_PERIODS = (12, 26)
+ATR_PERIOD = 14
+RSI_PERIOD = 14
+BOLLINGER_PERIOD = 20
+BOLLINGER_STDDEV = 2.0
+DRAWDOWN_WINDOW = 252
+# Contracts refreshed in parallel when screening
+SCREEN_WORKERS = 8
+
+# Largest growth factor allowed inside one closed-form EMA block
+_EMA_BLOCK_SCALE = 30.0
+
+
+def ema_recursive(x: np.ndarray, alpha: float, prev: float = math.nan) -> np.ndarray:
+    """
+    y[i] = alpha * x[i] + (1 - alpha) * y[i-1], evaluated in closed form block by block.
+    With ``prev`` NaN the series starts at x[0].
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    if not len(x):
+        return out
+    decay = 1.0 - alpha
+    if decay <= 0:
+        out[:] = x
+        return out
+    block = max(1, int(_EMA_BLOCK_SCALE / -math.log(decay)))
+    start = 0
+    if math.isnan(prev):
+        prev = x[0]
+        out[0] = prev
+        start = 1
+    while start < len(x):
+        chunk = x[start:start + block]
+        powers = decay ** np.arange(len(chunk))
+        # y[j] = decay^(j+1) * prev + alpha * decay^j * sum_i x[i] / decay^i
+        out[start:start + len(chunk)] = decay * powers * prev + alpha * powers * np.cumsum(chunk / powers)
+        prev = out[start + len(chunk) - 1]
+        start += len(chunk)
+    return out
+
+
+def rolling_mean(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        csum = np.cumsum(np.r_[0.0, x])
+        out[n - 1:] = (csum[n:] - csum[:-n]) / n
+    return out
+
+
+def rolling_std(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        out[n - 1:] = sliding_window_view(x, n).std(axis=1)
+    return out
+
+
+def rolling_max(x: np.ndarray, n: int) -> np.ndarray:
+    # partial windows at the start, so drawdown is defined from the first bar
+    padded = np.r_[np.full(n - 1, -np.inf), x]
+    return sliding_window_view(padded, n).max(axis=1)
+
+
+def _wilder(x: np.ndarray, n: int, prev: float) -> np.ndarray:
+    """
+    Wilder smoothing (alpha = 1/n), seeded with the mean of the first n values when ``prev`` is NaN.
+    """
+    out = np.full(len(x), np.nan)
+    if math.isnan(prev):
+        if len(x) < n:
+            return out
+        out[n - 1] = x[:n].mean()
+        out[n:] = ema_recursive(x[n:], 1.0 / n, out[n - 1])
+    else:
+        out[:] = ema_recursive(x, 1.0 / n, prev)
+    return out
+
+
+class IndicatorSet:
+    """
+    Indicator columns for one series, extended as the series grows.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = -1
+        self.values: Dict[str, np.ndarray] = {}
+        self.rows = 0
+
+    @property
+    def warmup(self) -> int:
+        # rows of history a windowed indicator needs before the first changed row
+        return max(max(SMA_PERIODS), BOLLINGER_PERIOD, DRAWDOWN_WINDOW, RSI_PERIOD, ATR_PERIOD)
+
+    def update(self, series: BarSeries) -> None:
+        """
+        Bring the indicators in line with ``series``, recomputing only the changed tail when possible.
+        """
+        with series.lock:
+            generation = series.generation
+            if generation == self.generation and len(series) == self.rows:
+                return
+            rows = len(series)
+            start = 0
+            if self.rows and generation == self.generation + 1:
+                start = min(series.changed_from, self.rows)
+            # NaN seeds would restart the recursions; fall back to a full pass
+            if start and (start < self.warmup or any(
+                    math.isnan(self.values[k][start - 1]) for k in ("_avg_gain", "_avg_loss", "atr"))):
+                start = 0
+            lo = max(0, start - self.warmup)
+            cols = {name: np.array(series.columns()[name][lo:]) for name in ("t", "h", "l", "c")}
+
+        tail = self._compute(cols, start - lo, start)
+        if start:
+            self.values = {k: np.r_[self.values[k][:start], tail[k]] for k in tail}
+        else:
+            self.values = tail
+        self.rows = rows
+        self.generation = generation
+
+    def _seed(self, key: str, start: int) -> float:
+        return float(self.values[key][start - 1]) if start else math.nan
+
+    def _compute(self, cols: Dict[str, np.ndarray], offset: int, start: int) -> Dict[str, np.ndarray]:
+        """
+        Indicators for cols[offset:], using cols[:offset] as lookback and the
+        stored values at row ``start - 1`` as seeds for the recursive ones.
+        """
+        t, high, low, close = cols["t"], cols["h"], cols["l"], cols["c"]
+        out: Dict[str, np.ndarray] = {"t": t[offset:]}
+
+        for n in SMA_PERIODS:
+            out[f"sma_{n}"] = rolling_mean(close, n)[offset:]
+        for n in EMA_PERIODS:
+            out[f"ema_{n}"] = ema_recursive(close[offset:], 2.0 / (n + 1), self._seed(f"ema_{n}", start))
+
+        mid = rolling_mean(close, BOLLINGER_PERIOD)[offset:]
+        width = BOLLINGER_STDDEV * rolling_std(close, BOLLINGER_PERIOD)[offset:]
+        out["bb_mid"], out["bb_upper"], out["bb_lower"] = mid, mid + width, mid - width
+
+        prev_close = np.r_[np.nan, close[:-1]]
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        out["atr"] = _wilder(true_range[offset:], ATR_PERIOD, self._seed("atr", start))
+
+        change = np.diff(close, prepend=np.nan)[offset:]
+        if not start:
+            # the first bar has no change; drop it from the seed window
+            change = change[1:]
+        gain = _wilder(np.clip(change, 0, None), RSI_PERIOD, self._seed("_avg_gain", start))
+        loss = _wilder(np.clip(-change, 0, None), RSI_PERIOD, self._seed("_avg_loss", start))
+        if not start:
+            gain, loss = np.r_[np.nan, gain], np.r_[np.nan, loss]
+        out["_avg_gain"], out["_avg_loss"] = gain, loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out["rsi"] = np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), 100 - 100 / (1 + gain / loss))
+        out["rsi"][np.isnan(gain)] = np.nan
+
+        peak = rolling_max(close, DRAWDOWN_WINDOW)[offset:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out["drawdown"] = np.where(peak > 0, (peak - close[offset:]) / peak * 100, np.nan)
+        return out
+
+
+def _json_column(values: np.ndarray) -> List[Optional[float]]:
+    return [None if math.isnan(v) else round(v, 6) for v in values.tolist()]
+
+
+class IndicatorEngine:
+    """
+    IndicatorSets by (conid, bar size), fed from the bar store.
+    """
+
+    def __init__(self, store: BarStore = bar_store):
+        self.store = store
+        self._sets: Dict[Tuple[str, str], IndicatorSet] = {}
+        self._lock = threading.Lock()
+
+    def _set(self, conid: str, bar: str) -> IndicatorSet:
+        key = (str(conid), bar)
+        with self._lock:
+            if key not in self._sets:
+                self._sets[key] = IndicatorSet()
+            return self._sets[key]
+
+    def compute(self, conid: str, period: str = '365d', bar: str = '1d',
+                last: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Indicators for a contract, refreshing its bars first.
+
+        Args:
+            conid: Contract id
+            period: Client Portal period the bar store should cover
+            bar: Client Portal bar size
+            last: Only return the last ``last`` rows
+
+        Returns:
+            Dict[str, Any]: conid, bar, the 'latest' value of every indicator and
+            one column per indicator (NaN during warm-up is returned as None)
+        """
+        series = self.store.refresh(conid, period, bar)
+        indicators = self._set(conid, bar)
+        with indicators.lock:
+            indicators.update(series)
+            values = {k: v for k, v in indicators.values.items() if not k.startswith("_")}
+
+        rows = slice(-last, None) if last else slice(None)
+        result = {"conid": str(conid), "bar": bar, "rows": len(values.get("t", ())), "latest": {}}
+        for key, column in values.items():
+            if key == "t":
+                result["t"] = column[rows].tolist()
+                continue
+            result[key] = _json_column(column[rows])
+            result["latest"][key] = result[key][-1] if result[key] else None
+        return result
+
+    def screen(self, conids: List[str], period: str = '365d', bar: str = '1d') -> Dict[str, Any]:
+        """
+        Latest indicator values for many contracts.
+
+        Returns:
+            Dict[str, Any]: conid -> latest values, or {'error': ...} for contracts that failed
+        """
+        def latest(conid):
+            try:
+                return self.compute(conid, period, bar, last=1)["latest"]
+            except Exception as e:
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SCREEN_WORKERS, len(conids)))) as pool:
+            return dict(zip(conids, pool.map(latest, conids)))
+
+
+indicator_engine = IndicatorEngine()
@@ -0,0 +1,129 @@
+"""
+Batched market data snapshots for pages that list many instruments.
+
+A page hands over all of its conids at once. Conids without a fresh cached
+quote are requested from ``/iserver/marketdata/snapshot`` in chunks, asking
+only for the fields the page shows. The gateway answers the first request
+for a conid with an empty "priming" row, so rows for conids that were never
+requested before are asked for again after a short pause. Conids that still
+have no data are cached as empty for ``SNAPSHOT_EMPTY_TTL`` seconds, so a
+watchlist with a delisted or unsubscribed instrument doesn't pay the pause on
+every view.
+"""
+
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+
+import metrics
+from gateway_client import GatewayClient, gateway
+from market_stream import parse_value
+from ttl_cache import TTLCache
+
+# Client Portal snapshot field ids -> names used in templates
+SNAPSHOT_FIELDS = {"31": "last", "84": "bid", "86": "ask", "82": "change", "83": "change_pct"}
+DEFAULT_FIELDS = ("last", "bid", "ask")
+SNAPSHOT_CHUNK_SIZE = int(os.getenv('SNAPSHOT_CHUNK_SIZE', '100'))
+SNAPSHOT_TTL = float(os.getenv('SNAPSHOT_TTL', '5'))
+# Pause before asking again for conids the first call only primed
+SNAPSHOT_PRIME_DELAY = float(os.getenv('SNAPSHOT_PRIME_DELAY', '0.5'))
+SNAPSHOT_PRIME_RETRIES = 2
+# How long the gateway keeps a requested conid primed, and how long a conid
+# without data is left out before it is asked for again
+SNAPSHOT_PRIMED_TTL = float(os.getenv('SNAPSHOT_PRIMED_TTL', '600'))
+SNAPSHOT_EMPTY_TTL = float(os.getenv('SNAPSHOT_EMPTY_TTL', '2'))
+SNAPSHOT_WORKERS = 4
+
+
+class SnapshotService:
+    """
+    Short-lived quote cache in front of the snapshot endpoint.
+    """
+
+    def __init__(self, client: GatewayClient = gateway, chunk_size: int = SNAPSHOT_CHUNK_SIZE,
+                 ttl: float = SNAPSHOT_TTL):
+        self.client = client
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=4096, default_ttl=ttl)
+        # conids already sent to the gateway, which needn't be waited on again
+        self.primed = TTLCache(maxsize=8192, default_ttl=SNAPSHOT_PRIMED_TTL)
+        self._field_ids = {name: field for field, name in SNAPSHOT_FIELDS.items()}
+
+    def _request(self, conids: List[str], field_ids: List[str]) -> List[Dict[str, Any]]:
+        r = self.client.get("/iserver/marketdata/snapshot",
+                            params={"conids": ",".join(conids), "fields": ",".join(field_ids)})
+        r.raise_for_status()
+        return r.json() if r.content else []
+
+    def _fetch_chunk(self, conids: List[str], field_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        quotes: Dict[str, Dict[str, Any]] = {}
+        pending = list(conids)
+        unprimed = {conid for conid in conids if self.primed.get(conid) is None}
+        for attempt in range(SNAPSHOT_PRIME_RETRIES + 1):
+            if attempt:
+                time.sleep(SNAPSHOT_PRIME_DELAY)
+            for row in self._request(pending, field_ids):
+                conid = str(row.get("conid", ""))
+                values = {SNAPSHOT_FIELDS[field]: parse_value(row[field]) for field in field_ids if field in row}
+                values = {name: value for name, value in values.items() if not math.isnan(value)}
+                if values:
+                    quotes[conid] = values
+            for conid in pending:
+                self.primed.set(conid, True)
+            # a primed conid that came back empty has no data to wait for
+            pending = [conid for conid in pending if conid not in quotes and conid in unprimed]
+            if not pending:
+                break
+        return quotes
+
+    def get(self, conids: Iterable[Any], fields: Iterable[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        """
+        Quotes for many conids with as few gateway calls as possible.
+
+        Args:
+            conids: Contract ids; duplicates are fetched once
+            fields: Names from SNAPSHOT_FIELDS, e.g. ('last', 'bid', 'ask')
+
+        Returns:
+            Dict[str, Dict[str, Any]]: conid -> {field name: value}; conids the
+            gateway had no data for are left out
+        """
+        fields = tuple(fields)
+        field_ids = [self._field_ids[name] for name in fields]
+        quotes: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for conid in dict.fromkeys(str(c) for c in conids if c):
+            cached = self.cache.get((conid, fields))
+            if cached:
+                quotes[conid] = cached
+            elif cached is None:
+                missing.append(conid)
+        if not missing:
+            return quotes
+
+        chunks = [missing[i:i + self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+
+        def fetch(chunk):
+            try:
+                return self._fetch_chunk(chunk, field_ids)
+            except Exception as e:
+                print(f"Error fetching market data snapshot: {e}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SNAPSHOT_WORKERS, len(chunks)))) as pool:
+            for chunk, fetched in zip(chunks, pool.map(fetch, chunks)):
+                for conid in chunk:
+                    quote = fetched.get(conid)
+                    if quote:
+                        self.cache.set((conid, fields), quote, self.ttl)
+                        quotes[conid] = quote
+                    else:
+                        self.cache.set((conid, fields), {}, SNAPSHOT_EMPTY_TTL)
+        return quotes
+
+
+snapshots = SnapshotService()
+metrics.register_cache("snapshots", snapshots.cache)
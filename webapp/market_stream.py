@@ -0,0 +1,356 @@
+"""
+Streaming market data and order updates from the Client Portal websocket.
+
+One background connection to ``/v1/api/ws`` subscribes to market data (``smd``)
+for every conid an open page is showing, plus live orders (``sor``), and
+unsubscribes (``umd``) once the last page showing a conid has gone. Ticks are
+written into fixed-size per-conid NumPy ring buffers and pushed to browsers as
+Server-Sent Events, so any number of open pages share a single upstream stream.
+``events`` serves a WSGI worker thread; ``async_events`` serves the ASGI app
+without holding a thread per open page.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import ssl
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import websocket
+
+from gateway_client import GATEWAY_PORT, GatewayClient, gateway
+
+MARKET_STREAM_URL = os.getenv('MARKET_STREAM_URL', f"wss://localhost:{GATEWAY_PORT}/v1/api/ws")
+TICK_RING_SIZE = int(os.getenv('TICK_RING_SIZE', '4096'))
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv('STREAM_HEARTBEAT_INTERVAL', '30'))
+STREAM_RECONNECT_INTERVAL = float(os.getenv('STREAM_RECONNECT_INTERVAL', '5'))
+# Events a slow browser may fall behind by before it starts missing ticks
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Seconds between SSE keep-alive comments
+SSE_KEEPALIVE = 15
+
+# Client Portal market data field ids -> tick columns
+FIELD_COLUMNS = {"31": "last", "84": "bid", "86": "ask", "88": "bid_size", "85": "ask_size", "7059": "size"}
+TICK_DTYPE = np.dtype([("t", "<i8")] + [(column, "<f8") for column in FIELD_COLUMNS.values()])
+SIZE_SUFFIXES = {"K": 1e3, "M": 1e6, "B": 1e9}
+
+
+def parse_value(value: Any) -> float:
+    """
+    Parse a Client Portal market data value such as '189.5', 'C189.5' (prior
+    close), '1,200' or '12.3K'. Returns NaN when there is no number.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(",", "").lstrip("CH")
+    scale = 1.0
+    if text and text[-1].upper() in SIZE_SUFFIXES:
+        scale = SIZE_SUFFIXES[text[-1].upper()]
+        text = text[:-1]
+    try:
+        return float(text) * scale
+    except ValueError:
+        return float("nan")
+
+
+class TickRing:
+    """
+    Fixed-size ring buffer of ticks for one conid; old ticks are overwritten.
+    """
+
+    def __init__(self, size: int = TICK_RING_SIZE):
+        self.buffer = np.zeros(size, dtype=TICK_DTYPE)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, tick: Dict[str, Any]) -> None:
+        with self._lock:
+            row = self.buffer[self.count % len(self.buffer)]
+            for name in TICK_DTYPE.names:
+                row[name] = tick.get(name, np.nan if name != "t" else 0)
+            self.count += 1
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Up to ``n`` most recent ticks, oldest first.
+        """
+        with self._lock:
+            size = len(self.buffer)
+            available = min(self.count, size)
+            n = available if n is None else min(n, available)
+            end = self.count % size
+            index = (np.arange(end - n, end)) % size
+            return self.buffer[index].copy()
+
+
+class MarketStream:
+    """
+    Owns the websocket connection, the ring buffers and the SSE subscribers.
+    """
+
+    def __init__(self, url: str = MARKET_STREAM_URL, ring_size: int = TICK_RING_SIZE,
+                 client: GatewayClient = gateway):
+        self.url = url
+        self.ring_size = ring_size
+        self.client = client
+
+        self._lock = threading.Lock()
+        # conid -> number of open subscribers; IB market data lines are limited
+        self._refs: Dict[str, int] = {}
+        self._quotes: Dict[str, Dict[str, Any]] = {}
+        self._rings: Dict[str, TickRing] = {}
+        self._subscribers: List[Dict[str, Any]] = []
+
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._connected = threading.Event()
+        self._stopping = False
+
+    # --- connection ------------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start the ingest thread if it isn't running yet. Returns immediately.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+            self._thread.start()
+            # a heartbeat left over from before a quick stop/start keeps serving the new connection
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="market-stream-heartbeat",
+                                                          daemon=True)
+                self._heartbeat_thread.start()
+
+    def stop(self) -> None:
+        self._stopping = True
+        if self._ws is not None:
+            self._ws.close()
+
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._ws = websocket.WebSocketApp(self.url, on_open=self._on_open, on_message=self._on_message,
+                                              on_error=self._on_error, on_close=self._on_close)
+            try:
+                # ping_timeout bounds the read loop's select, so stop() takes effect
+                # within a second instead of websocket-client's default 10
+                self._ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE}, ping_timeout=1)
+            except Exception as e:
+                print(f"Error in market data stream: {e}")
+            self._connected.clear()
+            if not self._stopping:
+                time.sleep(STREAM_RECONNECT_INTERVAL)
+
+    def _heartbeat(self) -> None:
+        while not self._stopping:
+            time.sleep(STREAM_HEARTBEAT_INTERVAL)
+            if self._connected.is_set():
+                self._send("tic")
+
+    def _send(self, message: str) -> None:
+        try:
+            self._ws.send(message)
+        except Exception as e:
+            print(f"Error sending '{message}' on market data stream: {e}")
+
+    def _on_open(self, ws) -> None:
+        try:
+            session = self.client.post("/tickle").json().get("session")
+            if session:
+                self._send(json.dumps({"session": session}))
+        except Exception as e:
+            print(f"Could not authenticate market data stream, relying on the gateway cookie: {e}")
+        self._connected.set()
+        with self._lock:
+            conids = list(self._refs)
+        for conid in conids:
+            self._send_subscription(conid)
+        self._send("sor+{}")
+
+    def _on_error(self, ws, error) -> None:
+        print(f"Market data stream error: {error}")
+
+    def _on_close(self, ws, status_code, message) -> None:
+        self._connected.clear()
+
+    def _send_subscription(self, conid: str) -> None:
+        self._send(f"smd+{conid}+" + json.dumps({"fields": list(FIELD_COLUMNS)}))
+
+    # --- ingest ----------------------------------------------------------------
+
+    def _on_message(self, ws, message) -> None:
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return
+        topic = str(data.get("topic", ""))
+        if topic.startswith("smd+"):
+            self._on_tick(topic[4:], data)
+        elif topic == "sor":
+            for order in data.get("args", []) or []:
+                self._publish("order", order, None)
+
+    def _on_tick(self, conid: str, data: Dict[str, Any]) -> None:
+        changed = {column: parse_value(data[field]) for field, column in FIELD_COLUMNS.items() if field in data}
+        if not changed:
+            return
+        with self._lock:
+            # updates only carry the fields that changed; carry the others forward
+            quote = self._quotes.setdefault(conid, {})
+            quote.update(changed)
+            quote["t"] = int(data.get("_updated") or time.time() * 1000)
+            tick = dict(quote, conid=conid)
+            ring = self._rings.get(conid)
+            if ring is None:
+                ring = self._rings[conid] = TickRing(self.ring_size)
+        ring.append(tick)
+        self._publish("tick", tick, conid)
+
+    def _publish(self, event: str, data: Dict[str, Any], conid: Optional[str]) -> None:
+        payload = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if conid is None and not subscriber["orders"]:
+                continue
+            if conid is not None and conid not in subscriber["conids"]:
+                continue
+            loop = subscriber.get("loop")
+            if loop is None:
+                _deliver(subscriber, payload)
+                continue
+            # asyncio queues may only be touched from their own loop
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriber, payload)
+            except RuntimeError:
+                # the loop closed under a subscriber that hasn't unregistered yet
+                pass
+
+    # --- reads -----------------------------------------------------------------
+
+    def subscribe(self, conids: Iterable[str]) -> None:
+        """
+        Make sure the stream carries market data for ``conids``. Every call must
+        be matched by an ``unsubscribe`` once the subscriber goes away.
+        """
+        self.start()
+        new = []
+        with self._lock:
+            for conid in conids:
+                conid = str(conid)
+                self._refs[conid] = self._refs.get(conid, 0) + 1
+                if self._refs[conid] == 1:
+                    new.append(conid)
+        if self._connected.is_set():
+            for conid in new:
+                self._send_subscription(conid)
+
+    def unsubscribe(self, conids: Iterable[str]) -> None:
+        """
+        Drop one subscriber's interest in ``conids``; the market data line of a
+        conid is released when its last subscriber leaves.
+        """
+        unused = []
+        with self._lock:
+            for conid in conids:
+                conid = str(conid)
+                count = self._refs.get(conid, 0) - 1
+                if count > 0:
+                    self._refs[conid] = count
+                elif conid in self._refs:
+                    del self._refs[conid]
+                    # the last quote goes stale without a subscription; the ring keeps the history
+                    self._quotes.pop(conid, None)
+                    unused.append(conid)
+        if self._connected.is_set():
+            for conid in unused:
+                self._send(f"umd+{conid}+{{}}")
+
+    def latest(self, conid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            quote = self._quotes.get(str(conid))
+            return dict(quote, conid=str(conid)) if quote else None
+
+    def ticks(self, conid: str, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Most recent ticks for a conid from its ring buffer, oldest first.
+        """
+        with self._lock:
+            ring = self._rings.get(str(conid))
+        if ring is None:
+            return []
+        rows = ring.last(n)
+        return [{name: (None if name != "t" and np.isnan(row[name]) else row[name].item())
+                 for name in TICK_DTYPE.names} for row in rows]
+
+    def events(self, conids: Iterable[str], orders: bool = False) -> Iterator[str]:
+        """
+        Server-Sent Events for a browser: the latest quote for each conid, then
+        every tick (and order update when ``orders``) as it arrives.
+        """
+        conids = {str(c) for c in conids}
+        self.subscribe(conids)
+        subscriber = {"queue": queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE), "conids": conids,
+                      "orders": orders, "dropped": 0}
+        with self._lock:
+            self._subscribers.append(subscriber)
+        try:
+            for conid in conids:
+                quote = self.latest(conid)
+                if quote:
+                    yield f"event: tick\ndata: {json.dumps(quote)}\n\n"
+            while True:
+                try:
+                    yield subscriber["queue"].get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+            self.unsubscribe(conids)
+
+    async def async_events(self, conids: Iterable[str], orders: bool = False) -> AsyncIterator[str]:
+        """
+        Same events as ``events``, awaited on the running event loop instead of
+        blocking a thread between ticks.
+        """
+        conids = {str(c) for c in conids}
+        self.subscribe(conids)
+        subscriber = {"queue": asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE), "loop": asyncio.get_running_loop(),
+                      "conids": conids, "orders": orders, "dropped": 0}
+        with self._lock:
+            self._subscribers.append(subscriber)
+        try:
+            for conid in conids:
+                quote = self.latest(conid)
+                if quote:
+                    yield f"event: tick\ndata: {json.dumps(quote)}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber["queue"].get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+            self.unsubscribe(conids)
+
+
+def _deliver(subscriber: Dict[str, Any], payload: str) -> None:
+    try:
+        subscriber["queue"].put_nowait(payload)
+    except (queue.Full, asyncio.QueueFull):
+        subscriber["dropped"] += 1
+
+
+market_stream = MarketStream()
@@ -0,0 +1,230 @@
+"""
+In-process metrics in the Prometheus text format, served at ``/metrics``.
+
+Latency histograms are kept per route and per upstream call: gateway endpoint
+(path template), ib_insync call and LLM call. There are error counters for each.
+Cache hit/miss counters and a few gauges are read from the objects that own them
+only when ``/metrics`` is scraped. Recording a sample costs a lock, a bisect and
+a few additions, so it stays on in production.
+
+The registry lives in process memory, so it only means something while the
+app runs as a single process, which is how ``start.sh`` serves it. With several
+worker processes each scrape would answer for whichever worker served it and
+counters would jump between unrelated values.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+
+from ttl_cache import TTLCache
+
+# Upper bounds in seconds, Prometheus client defaults plus a 30s bucket for slow gateway calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Path segments that are ids rather than part of the endpoint: numbers,
+# account ids such as U1234567 or DU123456, and long hex ids
+_ID_SEGMENT = re.compile(r"/(\d+|[A-Z]{1,3}\d{4,}|[0-9a-f]{16,})(?=/|$)")
+
+
+def path_template(path: str) -> str:
+    """
+    Collapse ids in a gateway path so every account or order shares one series,
+    e.g. '/portfolio/DU123456/positions/0' -> '/portfolio/{id}/positions/{id}'.
+    """
+    return _ID_SEGMENT.sub("/{id}", "/" + path.lstrip("/"))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from ``collect`` at scrape time: a dict of label tuple -> value.
+    """
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str],
+                 collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = sorted(self.collect().items())
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            values = []
+        lines += [f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values]
+        return lines
+
+
+REQUEST_LATENCY = Histogram("webapp_request_duration_seconds",
+                            "Time spent serving a request, by route template.", ("route", "method"))
+REQUEST_ERRORS = Counter("webapp_request_errors_total",
+                         "Requests that raised or answered with a 5xx status.", ("route", "method"))
+UPSTREAM_LATENCY = Histogram("webapp_upstream_duration_seconds",
+                             "Time spent waiting on an upstream call.", ("upstream", "endpoint"))
+UPSTREAM_ERRORS = Counter("webapp_upstream_errors_total",
+                          "Upstream calls that raised, were rate limited or answered with a 5xx status.",
+                          ("upstream", "endpoint"))
+
+_caches: Dict[str, TTLCache] = {}
+_gauges: List[Gauge] = []
+
+
+def register_cache(name: str, cache: TTLCache) -> None:
+    """
+    Report ``cache.hits``/``cache.misses`` as counters labelled ``cache=name``.
+    """
+    _caches[name] = cache
+
+
+def register_gauge(name: str, help: str, label_names: Sequence[str],
+                   collect: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+    _gauges.append(Gauge(name, help, label_names, collect))
+
+
+def observe_request(route: str, method: str, seconds: float, error: bool = False) -> None:
+    REQUEST_LATENCY.observe(seconds, route, method)
+    if error:
+        REQUEST_ERRORS.inc(route, method)
+
+
+def observe_upstream(upstream: str, endpoint: str, seconds: float, error: bool = False) -> None:
+    UPSTREAM_LATENCY.observe(seconds, upstream, endpoint)
+    if error:
+        UPSTREAM_ERRORS.inc(upstream, endpoint)
+
+
+@contextmanager
+def track_upstream(upstream: str, endpoint: str) -> Iterator[None]:
+    """
+    Time the block as one upstream call; an exception counts as an error.
+    """
+    start = time.perf_counter()
+    error = True
+    try:
+        yield
+        error = False
+    finally:
+        observe_upstream(upstream, endpoint, time.perf_counter() - start, error)
+
+
+def render() -> str:
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    lines: List[str] = []
+    for metric in (REQUEST_LATENCY, REQUEST_ERRORS, UPSTREAM_LATENCY, UPSTREAM_ERRORS):
+        lines += metric.render()
+
+    caches = sorted(_caches.items())
+    lines += ["# HELP webapp_cache_hits_total Cache lookups answered from the cache.",
+              "# TYPE webapp_cache_hits_total counter"]
+    lines += [f'webapp_cache_hits_total{{cache="{_escape(name)}"}} {cache.hits}' for name, cache in caches]
+    lines += ["# HELP webapp_cache_misses_total Cache lookups that missed or found an expired entry.",
+              "# TYPE webapp_cache_misses_total counter"]
+    lines += [f'webapp_cache_misses_total{{cache="{_escape(name)}"}} {cache.misses}' for name, cache in caches]
+
+    for gauge in _gauges:
+        lines += gauge.render()
+    return "\n".join(lines) + "\n"
+
+
+def instrument_flask(app: Flask) -> None:
+    """
+    Record latency and errors for every request served by a Flask app, labelled
+    with the matched route rule (e.g. '/contract/<contract_id>/<period>').
+    """
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(exc: Optional[BaseException]):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        # streamed responses finish here, after the last chunk was sent
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = g.pop("_metrics_status", 500)
+        observe_request(route, request.method, time.perf_counter() - start,
+                        error=exc is not None or status >= 500)
@@ -0,0 +1,132 @@
+"""
+Registry of submitted orders and their latest status.
+
+Order submission returns a handle immediately; statuses are filled in from
+ib_insync's ``statusEvent`` on the IB thread. The UI can poll a handle or
+long-poll it with ``wait`` until something changes.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from ib_insync import Trade
+
+DONE_STATUSES = {'Filled', 'Cancelled', 'ApiCancelled', 'Inactive'}
+MAX_HANDLES = 1000
+
+
+class OrderStatusRegistry:
+    """
+    Maps handle ids to the orders submitted under them.
+    """
+
+    def __init__(self, max_handles: int = MAX_HANDLES):
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._changed = threading.Condition()
+
+    def create(self, legs: List[str]) -> str:
+        """
+        Register a new submission with one entry per leg, all 'Queued'.
+
+        Returns:
+            str: Handle id
+        """
+        handle_id = uuid.uuid4().hex
+        with self._changed:
+            self._handles[handle_id] = {
+                "handle": handle_id,
+                "created_at": time.time(),
+                "version": 0,
+                "error": None,
+                "orders": [{"leg": leg, "order_id": None, "status": "Queued", "filled": 0.0,
+                            "remaining": None, "avg_fill_price": 0.0} for leg in legs],
+            }
+            while len(self._handles) > self.max_handles:
+                self._handles.popitem(last=False)
+        return handle_id
+
+    def track(self, handle_id: str, trades: List[Trade],
+              on_change: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """
+        Attach placed trades to a handle. Must be called on the IB thread right after placeOrder.
+        """
+        for index, trade in enumerate(trades):
+            self._update(handle_id, index, trade, on_change)
+            trade.statusEvent += lambda t, i=index: self._update(handle_id, i, t, on_change)
+
+    def fail(self, handle_id: str, error: str,
+             on_change: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """
+        Mark every leg of a handle as failed, e.g. when placeOrder raised.
+        """
+        with self._changed:
+            entry = self._handles.get(handle_id)
+            snapshot = None
+            if entry is not None:
+                entry["error"] = error
+                for order in entry["orders"]:
+                    order["status"] = "Error"
+                entry["version"] += 1
+                snapshot = self._snapshot(entry)
+            self._changed.notify_all()
+        if on_change is not None and snapshot is not None:
+            self._notify(on_change, snapshot)
+
+    def _update(self, handle_id: str, index: int, trade: Trade,
+                on_change: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        with self._changed:
+            entry = self._handles.get(handle_id)
+            if entry is None:
+                return
+            entry["orders"][index].update({
+                "order_id": trade.order.orderId,
+                "status": trade.orderStatus.status or "PendingSubmit",
+                "filled": trade.orderStatus.filled,
+                "remaining": trade.orderStatus.remaining,
+                "avg_fill_price": trade.orderStatus.avgFillPrice,
+            })
+            entry["version"] += 1
+            snapshot = self._snapshot(entry)
+            self._changed.notify_all()
+        if on_change is not None:
+            self._notify(on_change, snapshot)
+
+    @staticmethod
+    def _notify(on_change: Callable[[Dict[str, Any]], None], snapshot: Dict[str, Any]) -> None:
+        try:
+            on_change(snapshot)
+        except Exception as e:
+            print(f"Error in order status callback: {e}")
+
+    @staticmethod
+    def _snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(entry, orders=[dict(o) for o in entry["orders"]])
+        result["done"] = entry["error"] is not None or all(o["status"] in DONE_STATUSES for o in entry["orders"])
+        return result
+
+    def get(self, handle_id: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            entry = self._handles.get(handle_id)
+            return self._snapshot(entry) if entry is not None else None
+
+    def wait(self, handle_id: str, since_version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Block until the handle's version moves past ``since_version`` or ``timeout`` expires.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                entry = self._handles.get(handle_id)
+                if entry is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if entry["version"] > since_version or remaining <= 0:
+                    return self._snapshot(entry)
+                self._changed.wait(remaining)
+
+
+order_registry = OrderStatusRegistry()
@@ -0,0 +1,57 @@
+"""
+Page data shared by the Flask routes in ``app.py`` and their async counterparts
+in ``asgi.py``.
+
+Each route fetches with its own gateway client (``gateway`` or
+``async_gateway``) and hands the decoded responses to these helpers, so both
+serving modes build the same template context and treat empty or malformed
+gateway answers the same way.
+"""
+
+from typing import Any, Dict, List
+
+LOGIN_PROMPT = 'Make sure you authenticate first then visit this page. <a href="https://localhost:5055">Log in</a>'
+ORDERS_ERROR = "Failed to fetch orders. Please ensure you are logged in to IB Gateway"
+
+
+def primary_account_id(accounts: List[Dict[str, Any]]) -> str:
+    """
+    Id of the first account in a ``/portfolio/accounts`` answer. Raises when the
+    answer holds no account, which the dashboard treats like a lapsed session.
+    """
+    return accounts[0]["id"]
+
+
+def dashboard_context(accounts: List[Dict[str, Any]], summary: Any) -> Dict[str, Any]:
+    return {"account": accounts[0], "summary": summary}
+
+
+def parse_orders(response: Any) -> List[Dict[str, Any]]:
+    """
+    Live orders from a ``/iserver/account/orders`` response (``requests`` or ``httpx``).
+    """
+    # If there are no orders, IB Gateway returns an empty response
+    if not response.content:
+        return []
+    try:
+        data = response.json()
+    except ValueError:
+        return []
+    # IB Gateway might return an empty array for no orders,
+    # or an object with an orders key
+    if isinstance(data, list):
+        return data
+    return data.get("orders", []) if isinstance(data, dict) else []
+
+
+def watchlists_context(watchlist_data: Any) -> Dict[str, Any]:
+    data = watchlist_data.get("data", {}) if isinstance(watchlist_data, dict) else {}
+    return {"watchlists": data.get("user_lists", [])}
+
+
+def watchlist_conids(watchlist: Dict[str, Any]) -> List[Any]:
+    return [instrument.get('conid') for instrument in watchlist.get('instruments', [])]
+
+
+def watchlist_context(watchlist: Dict[str, Any], quotes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return {"watchlist": watchlist, "quotes": quotes}
@@ -0,0 +1,55 @@
+"""
+Server-side pagination for table pages.
+
+Routes slice their rows with ``paginate`` before rendering, so a template only
+ever iterates over one page, and ``templates/_pagination.html`` renders the
+page links.
+"""
+
+import math
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from flask import request
+
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = 1000
+
+
+def page_args(default_size: int = PAGE_SIZE) -> Tuple[int, int]:
+    """
+    The requested (page, per_page) from the query string, 1-based and clamped.
+    """
+    page = max(1, request.args.get("page", 1, type=int) or 1)
+    per_page = request.args.get("per_page", default_size, type=int) or default_size
+    return page, max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def page_info(total: int, page: int, per_page: int) -> Dict[str, Any]:
+    """
+    Page numbers for the pagination links; ``page`` is clamped to the last page.
+    """
+    pages = max(1, math.ceil(total / per_page))
+    page = min(page, pages)
+    return {
+        "page": page,
+        "pages": pages,
+        "per_page": per_page,
+        "total": total,
+        "offset": (page - 1) * per_page,
+        "has_prev": page > 1,
+        "has_next": page < pages,
+    }
+
+
+def paginate(items: Optional[Sequence[Any]], default_size: int = PAGE_SIZE) -> Tuple[Sequence[Any], Dict[str, Any]]:
+    """
+    Slice ``items`` to the page requested in the query string.
+
+    Returns:
+        Tuple[Sequence[Any], Dict[str, Any]]: (rows on this page, page_info)
+    """
+    items = items or []
+    page, per_page = page_args(default_size)
+    info = page_info(len(items), page, per_page)
+    return items[info["offset"]:info["offset"] + per_page], info
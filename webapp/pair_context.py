@@ -1,17 +1,125 @@
-import requests
-import json
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
 from broker_data import get_total_exposure_by_asset, get_drawdown
-from graph_loader import load_graph_data
+from graph_loader import get_graph, get_cached_graph
 from sentiment_agent import get_live_sentiment
 
 GRAPH_DIR = Path(__file__).resolve().parent.parent / "graph"
 
+# Per-source deadlines in seconds, measured from the moment the sources are fanned out
+SOURCE_DEADLINES = {
+    "graph": float(os.getenv('CONTEXT_GRAPH_DEADLINE', '1.0')),
+    "exposure": float(os.getenv('CONTEXT_EXPOSURE_DEADLINE', '3.0')),
+    "drawdown": float(os.getenv('CONTEXT_DRAWDOWN_DEADLINE', '3.0')),
+    "sentiment": float(os.getenv('CONTEXT_SENTIMENT_DEADLINE', '8.0')),
+}
+
+# Values used when a source misses its deadline and there is no earlier result
+SOURCE_DEFAULTS = {
+    "exposure": {},
+    "drawdown": 0.0,
+}
+
+# Each source gets its own pool so a hung sentiment call cannot starve the fast
+# sources. At most SOURCE_BACKLOG calls per source may be running or queued;
+# beyond that the source is skipped instead of piling up behind hung calls.
+SOURCE_WORKERS = int(os.getenv('CONTEXT_SOURCE_WORKERS', '4'))
+SOURCE_BACKLOG = int(os.getenv('CONTEXT_SOURCE_BACKLOG', '16'))
+_executors = {
+    name: ThreadPoolExecutor(max_workers=SOURCE_WORKERS, thread_name_prefix=f"pair-context-{name}")
+    for name in SOURCE_DEADLINES
+}
+_slots = {name: threading.BoundedSemaphore(SOURCE_BACKLOG) for name in SOURCE_DEADLINES}
+_last_good = {}
+_last_good_lock = threading.Lock()
+
+
+class _SourceBusy(Exception):
+    pass
+
+
+def _sentiment_fallback(pair):
+    return {
+        "sentiment": "Neutral",
+        "summary": "Sentiment unavailable",
+        "confidence": 0.0,
+        "source": "Unavailable",
+        "headlines": [],
+        "pair": pair.upper()
+    }
+
+
+def _gather_sources(pair):
+    """
+    Run every context source concurrently and wait for each one until its deadline.
+
+    Returns:
+        tuple: (results by source name, status by source name) where a status is
+        'ok', 'stale' (previous value reused), 'timeout', 'busy' (the source's backlog
+        is full) or 'error' (default used)
+    """
+    calls = {
+        "graph": (get_graph, (), pair),
+        "exposure": (get_total_exposure_by_asset, (), None),
+        "drawdown": (get_drawdown, (), None),
+        "sentiment": (get_live_sentiment, (pair,), pair.upper()),
+    }
+    started = time.monotonic()
+    futures = {}
+    for name, (fn, args, _) in calls.items():
+        slot = _slots[name]
+        if not slot.acquire(blocking=False):
+            futures[name] = None
+            continue
+        futures[name] = _executors[name].submit(fn, *args)
+        futures[name].add_done_callback(lambda _, slot=slot: slot.release())
+
+    results = {}
+    statuses = {}
+    for name, future in futures.items():
+        cache_key = (name, calls[name][2])
+        remaining = max(0.0, SOURCE_DEADLINES[name] - (time.monotonic() - started))
+        try:
+            if future is None:
+                raise _SourceBusy()
+            results[name] = future.result(timeout=remaining)
+            statuses[name] = "ok"
+            with _last_good_lock:
+                _last_good[cache_key] = results[name]
+            continue
+        except FutureTimeoutError:
+            statuses[name] = "timeout"
+        except _SourceBusy:
+            statuses[name] = "busy"
+        except Exception as e:
+            print(f"Error loading {name} for {pair}: {e}")
+            statuses[name] = "error"
+
+        with _last_good_lock:
+            previous = _last_good.get(cache_key)
+        if previous is not None:
+            results[name] = previous
+            statuses[name] = "stale"
+        elif name == "graph":
+            # never load from disk here; that would run outside the deadline
+            results[name] = get_cached_graph()
+        elif name == "sentiment":
+            results[name] = _sentiment_fallback(pair)
+        else:
+            results[name] = SOURCE_DEFAULTS[name]
+
+    return results, statuses
+
+
 def get_pair_context(pair):
     pair_lower = pair.lower()
-    graph = load_graph_data()
-    exposure = get_total_exposure_by_asset()
-    drawdown = get_drawdown()
+    sources, source_status = _gather_sources(pair)
+    graph = sources["graph"]
+    exposure = sources["exposure"]
+    drawdown = sources["drawdown"]
 
     # Load references
     context = {
@@ -21,25 +129,24 @@ def get_pair_context(pair):
         "hedge_only": False,
         "topdown_refs": [],
         "strategy_flags": [],
-        "assistant_tip": ""
+        "assistant_tip": "",
+        "source_status": source_status
     }
 
     # Get sentiment analysis
-    sentiment_data = get_live_sentiment(pair)
+    sentiment_data = sources["sentiment"]
     context.update(sentiment_data)
 
     # Search for hedge-only or bias-related flags
-    for concept in graph["concepts"]:
-        if "hedge-only" in concept["name"].lower() and pair_lower in concept["description"].lower():
-            context["hedge_only"] = True
-            context["strategy_flags"].append("⚠️ In hedge-only zone")
-        if "bias" in concept["name"].lower() and "structure" in concept["description"].lower():
-            context["strategy_flags"].append("🧠 Watch for structure break before confirming bias")
+    for concept in graph.find_concepts(name_token="hedge-only", description_token=pair_lower):
+        context["hedge_only"] = True
+        context["strategy_flags"].append("⚠️ In hedge-only zone")
+    for concept in graph.find_concepts(name_token="bias", description_token="structure"):
+        context["strategy_flags"].append("🧠 Watch for structure break before confirming bias")
 
     # Check for matching edges
-    for edge in graph["edges"]:
-        if pair.upper() in edge.get("to", "").upper():
-            context["topdown_refs"].append(edge["to"])
+    for target in graph.targets_matching(pair_lower):
+        context["topdown_refs"].extend([target] * len(graph.incoming[target]))
 
     # Final assistant tip
     if context["drawdown"] > 3.0:
@@ -49,4 +156,4 @@ def get_pair_context(pair):
     else:
         context["assistant_tip"] = "✅ No major risk flags. Continue monitoring structure + bias alignment."
 
-    return context 
\ No newline at end of file
+    return context
@@ -0,0 +1,94 @@
+"""
+Loads every page of an account's positions.
+
+``/portfolio/{accountId}/positions/{pageId}`` returns at most ``POSITIONS_PAGE_SIZE``
+rows per page. Page 0 is fetched first; if it is full, further pages are
+fetched in parallel batches until a short page shows the end was reached. The
+pages are merged into one compact table and cached in the gateway client's
+cache, so ``gateway.invalidate("/portfolio/")`` after an order clears it too.
+A page that fails fails the whole load, so a truncated table is never cached.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from gateway_client import GatewayClient, gateway
+
+POSITIONS_PAGE_SIZE = int(os.getenv('POSITIONS_PAGE_SIZE', '100'))
+POSITION_PAGE_WORKERS = int(os.getenv('POSITION_PAGE_WORKERS', '4'))
+POSITIONS_TTL = float(os.getenv('POSITIONS_TTL', '5'))
+# Safety stop for a gateway that keeps returning full pages
+MAX_POSITION_PAGES = 200
+
+# Fields kept from each gateway position row
+POSITION_FIELDS = ("conid", "name", "contractDesc", "ticker", "assetClass", "currency", "position",
+                   "avgCost", "avgPrice", "mktPrice", "mktValue", "unrealizedPnl", "realizedPnl")
+
+
+class PositionPageError(ValueError):
+    """
+    Raised when a positions page comes back as anything but a list of rows,
+    e.g. the gateway's ``{"error": ...}`` body for an expired session.
+    """
+
+
+def _compact(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: row.get(field) for field in POSITION_FIELDS}
+
+
+class PositionLoader:
+    """
+    All positions for an account, merged from every page.
+    """
+
+    def __init__(self, client: GatewayClient = gateway, page_size: int = POSITIONS_PAGE_SIZE,
+                 workers: int = POSITION_PAGE_WORKERS, ttl: float = POSITIONS_TTL):
+        self.client = client
+        self.page_size = page_size
+        self.workers = workers
+        self.ttl = ttl
+
+    def _page(self, account_id: str, page: int) -> List[Dict[str, Any]]:
+        rows = self.client.get_json(f"/portfolio/{account_id}/positions/{page}")
+        if not isinstance(rows, list):
+            # an error body or an empty answer is not the end of the positions
+            raise PositionPageError(f"Positions page {page} failed: {rows!r}"[:200])
+        return rows
+
+    def _load(self, account_id: str) -> List[Dict[str, Any]]:
+        pages = [self._page(account_id, 0)]
+        next_page = 1
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            # keep going while the last page we saw was full
+            while len(pages[-1]) >= self.page_size and next_page < MAX_POSITION_PAGES:
+                batch = range(next_page, min(next_page + self.workers, MAX_POSITION_PAGES))
+                for rows in pool.map(lambda page: self._page(account_id, page), batch):
+                    pages.append(rows)
+                    if len(rows) < self.page_size:
+                        break
+                next_page = batch.stop
+
+        positions: Dict[Any, Dict[str, Any]] = {}
+        for rows in pages:
+            for row in rows:
+                positions.setdefault(row.get("conid"), _compact(row))
+        return list(positions.values())
+
+    def load(self, account_id: str) -> List[Dict[str, Any]]:
+        """
+        Every position in the account, cached for ``ttl`` seconds.
+
+        Returns:
+            List[Dict[str, Any]]: One row per conid with the fields in POSITION_FIELDS
+
+        Raises:
+            PositionPageError: A page came back with an error instead of rows
+        """
+        key = ("GET", f"/portfolio/{account_id}/positions/all", "")
+        # concurrent misses share one walk over the pages
+        return self.client.cache.get_or_set(
+            key, lambda: self.client.in_flight.do(key, lambda: self._load(account_id)), self.ttl)
+
+
+position_loader = PositionLoader()
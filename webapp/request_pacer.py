@@ -0,0 +1,277 @@
+"""
+Pacing for requests to the Client Portal gateway.
+
+The gateway enforces a global request rate plus stricter limits on some
+endpoints, and answers with 429 (and eventually a temporary ban) when they are
+exceeded. Every request takes a token from the global bucket and, if its
+endpoint has its own limit, from that endpoint's bucket as well.
+
+Waiting requests are served by lane: order placement and cancels first, then
+session keepalive, then page reads, then bulk market data and scanner calls.
+Lanes other than orders also leave ``ORDER_RESERVED_TOKENS`` in the global bucket,
+so an order arriving right after a scanner refresh does not have to wait for it.
+A 429 blocks that endpoint class for the Retry-After time or an exponential
+backoff. Only a 429 on unclassified traffic, which the gateway counts against
+the global rate, blocks the global bucket and with it every lane.
+"""
+
+import itertools
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+import requests
+
+# Lanes in priority order
+LANES = ("orders", "session", "reads", "bulk")
+
+GLOBAL_RATE = float(os.getenv('PACING_GLOBAL_RATE', '10'))  # requests per second
+GLOBAL_BURST = float(os.getenv('PACING_GLOBAL_BURST', '10'))
+ORDER_RESERVED_TOKENS = float(os.getenv('PACING_ORDER_RESERVE', '2'))
+# Longest a request may queue before giving up with PacingTimeout
+MAX_WAIT = float(os.getenv('PACING_MAX_WAIT', '30'))
+# Backoff after a 429 without Retry-After: BACKOFF_BASE * 2**n, capped
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+_ORDER_METHODS = ("POST", "DELETE")
+
+# (name, methods or None for any, path pattern, rate per second or None,
+#  burst, max concurrent or None, lane). First match wins.
+ENDPOINT_LIMITS: List[Tuple[str, Optional[Tuple[str, ...]], Pattern, Optional[float], float, Optional[int], str]] = [
+    ("orders", _ORDER_METHODS, re.compile(r"^/iserver/account/[^/]+/orders?(/|$)"), None, 1, None, "orders"),
+    ("reply", ("POST",), re.compile(r"^/iserver/reply/"), None, 1, None, "orders"),
+    ("tickle", None, re.compile(r"^/tickle$"), 1, 1, None, "session"),
+    ("auth", None, re.compile(r"^/iserver/(auth/status|reauthenticate|accounts)$"), 1, 1, None, "session"),
+    ("live_orders", ("GET",), re.compile(r"^/iserver/account/orders$"), 1 / 5, 1, None, "reads"),
+    ("trades", ("GET",), re.compile(r"^/iserver/account/trades$"), 1 / 5, 1, None, "reads"),
+    ("pnl", ("GET",), re.compile(r"^/iserver/account/pnl/partitioned$"), 1 / 5, 1, None, "reads"),
+    ("accounts", ("GET",), re.compile(r"^/portfolio/(sub)?accounts$"), 1 / 5, 1, None, "reads"),
+    ("snapshot", ("GET",), re.compile(r"^/iserver/marketdata/snapshot$"), 10, 10, None, "bulk"),
+    ("history", ("GET",), re.compile(r"^/iserver/marketdata/history$"), None, 1, 5, "bulk"),
+    ("scanner_params", ("GET",), re.compile(r"^/iserver/scanner/params$"), 1 / 900, 1, None, "bulk"),
+    ("scanner", ("POST",), re.compile(r"^/iserver/scanner/run$"), 1, 1, None, "bulk"),
+    ("portfolio_analyst", None, re.compile(r"^/pa/"), 1 / 900, 1, None, "bulk"),
+]
+
+
+class PacingTimeout(requests.Timeout):
+    """
+    Raised when a request queued longer than ``MAX_WAIT`` seconds for its turn.
+    """
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second up to ``burst``. Not thread-safe on its own;
+    the pacer's lock guards every bucket.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until a token is available with ``reserve`` tokens left over.
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        reserve = min(reserve, self.burst - 1)
+        return max(0.0, (1 + reserve - self.tokens) / self.rate)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        # let a single probe through once the block ends
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 1
+        self.updated = self.blocked_until
+
+
+class EndpointClass:
+    """
+    One row of ``ENDPOINT_LIMITS`` with its bucket, 429 block and counters.
+    """
+
+    def __init__(self, name: str, lane: str, rate: Optional[float] = None, burst: float = 1,
+                 concurrency: Optional[int] = None):
+        self.name = name
+        self.lane = lane
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = concurrency
+        self.active = 0
+        self.strikes = 0
+        # set after a 429, also for classes limited only by concurrency
+        self.blocked_until = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def delay(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.concurrency is not None and self.active >= self.concurrency:
+            # woken up by release()
+            return float("inf")
+        return self.bucket.delay(now) if self.bucket else 0.0
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+        if self.bucket:
+            self.bucket.block(until)
+
+
+class RequestPacer:
+    """
+    Admits gateway requests within the rate limits, highest lane first.
+    """
+
+    def __init__(self, rate: float = GLOBAL_RATE, burst: float = GLOBAL_BURST,
+                 order_reserve: float = ORDER_RESERVED_TOKENS, max_wait: float = MAX_WAIT):
+        self.bucket = TokenBucket(rate, burst)
+        self.order_reserve = order_reserve
+        self.max_wait = max_wait
+        self.default = EndpointClass("default", "reads")
+        self.classes = [
+            (methods, pattern, EndpointClass(name, lane, rate, burst, concurrency))
+            for name, methods, pattern, rate, burst, concurrency, lane in ENDPOINT_LIMITS
+        ]
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # (lane rank, arrival order, endpoint class) for every queued request
+        self._waiting: List[Tuple[int, int, EndpointClass]] = []
+        self._lane_stats = {lane: {"queued": 0, "requests": 0, "wait_total": 0.0, "wait_max": 0.0}
+                            for lane in LANES}
+
+    def classify(self, method: str, path: str) -> EndpointClass:
+        path = "/" + path.lstrip("/")
+        for methods, pattern, endpoint in self.classes:
+            if (methods is None or method in methods) and pattern.match(path):
+                return endpoint
+        return self.default
+
+    def _ahead(self, entry: Tuple[int, int, EndpointClass], now: float) -> bool:
+        # an earlier request in the same or a higher lane that could go right now
+        return any(other[:2] < entry[:2] and other[2].delay(now) == 0 for other in self._waiting)
+
+    def acquire(self, method: str, path: str, max_wait: Optional[float] = None) -> EndpointClass:
+        """
+        Block until the request may be sent. Every call must be followed by ``release``.
+
+        Args:
+            max_wait: Overrides the pacer's ``max_wait``; 0 never blocks
+
+        Raises:
+            PacingTimeout: Waited longer than ``max_wait``
+        """
+        endpoint = self.classify(method, path)
+        lane = self._lane_stats[endpoint.lane]
+        reserve = 0.0 if endpoint.lane == "orders" else self.order_reserve
+        start = time.monotonic()
+        deadline = start + (self.max_wait if max_wait is None else max_wait)
+
+        with self._cond:
+            entry = (LANES.index(endpoint.lane), next(self._seq), endpoint)
+            self._waiting.append(entry)
+            lane["queued"] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = max(endpoint.delay(now), self.bucket.delay(now, reserve))
+                    if wait == 0 and not self._ahead(entry, now):
+                        break
+                    if now >= deadline:
+                        raise PacingTimeout(f"Waited {now - start:.1f}s for a {endpoint.name} slot on {method} {path}")
+                    # woken early whenever another request is admitted or released
+                    self._cond.wait(min(max(wait, 0.01), deadline - now))
+                self.bucket.take()
+                if endpoint.bucket:
+                    endpoint.bucket.take()
+                endpoint.active += 1
+            finally:
+                self._waiting.remove(entry)
+                lane["queued"] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            endpoint.requests += 1
+            if waited > 0.001:
+                endpoint.throttled += 1
+            lane["requests"] += 1
+            lane["wait_total"] += waited
+            lane["wait_max"] = max(lane["wait_max"], waited)
+        return endpoint
+
+    def release(self, endpoint: EndpointClass, response: Optional[requests.Response] = None) -> Optional[float]:
+        """
+        Finish a request admitted by ``acquire`` and apply any 429 backoff.
+
+        Returns:
+            Optional[float]: Seconds the endpoint is blocked for if the gateway
+            answered 429, otherwise None
+        """
+        with self._cond:
+            endpoint.active -= 1
+            backoff = None
+            if response is not None and response.status_code == 429:
+                endpoint.rate_limited += 1
+                backoff = self._retry_after(response) or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** endpoint.strikes)
+                endpoint.strikes += 1
+                until = time.monotonic() + backoff
+                endpoint.block(until)
+                if endpoint is self.default:
+                    # unclassified requests only hit the gateway's global limit
+                    self.bucket.block(until)
+            elif response is not None:
+                endpoint.strikes = 0
+            self._cond.notify_all()
+        return backoff
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        try:
+            return max(0.0, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and wait times per lane, plus per-endpoint counters.
+        """
+        with self._cond:
+            now = time.monotonic()
+            lanes = {}
+            for name, lane in self._lane_stats.items():
+                lanes[name] = dict(lane, wait_avg=lane["wait_total"] / lane["requests"] if lane["requests"] else 0.0)
+            endpoints = {}
+            for endpoint in [self.default] + [endpoint for _, _, endpoint in self.classes]:
+                endpoints[endpoint.name] = {
+                    "lane": endpoint.lane,
+                    "requests": endpoint.requests,
+                    "throttled": endpoint.throttled,
+                    "rate_limited": endpoint.rate_limited,
+                    "active": endpoint.active,
+                    "blocked_for": max(0.0, endpoint.blocked_until - now),
+                }
+            self.bucket._refill(now)
+            return {
+                "global": {"tokens": round(self.bucket.tokens, 2),
+                           "blocked_for": max(0.0, self.bucket.blocked_until - now)},
+                "lanes": lanes,
+                "endpoints": endpoints,
+            }
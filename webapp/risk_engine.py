@@ -0,0 +1,201 @@
+"""
+Vectorised portfolio risk checks for the /risk page.
+
+Positions are loaded into NumPy arrays once per request and every metric
+(gross/net exposure, per-currency exposure, concentration, limit breaches) is
+computed over the whole book in a handful of array operations. Market values
+are converted to the account's base currency first, so positions quoted in
+different currencies (e.g. EURUSD and USDJPY) are weighed on the same scale. Strategy
+concepts are matched through a token index built once per graph version.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+FX_LOT_SIZE = 100000  # Standard FX lot = 100,000 units
+
+
+def _env_limit(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return float(value)
+
+
+# Limits can be overridden with environment variables; None disables a check
+RISK_LIMITS = {
+    "max_lots_per_symbol": _env_limit('RISK_MAX_LOTS', 2.0),
+    "max_drawdown_pct": _env_limit('RISK_MAX_DRAWDOWN', 3.0),
+    "max_concentration": _env_limit('RISK_MAX_CONCENTRATION', 0.5),  # share of gross exposure
+    "max_gross_exposure": _env_limit('RISK_MAX_GROSS', None),
+    "max_currency_exposure": _env_limit('RISK_MAX_CURRENCY', None),
+}
+
+
+class PositionBook:
+    """
+    Column arrays for a list of positions.
+
+    ``fx_rates`` maps a currency to the value of one unit in the account's base
+    currency. Currencies without a rate are taken at 1.0, except the base
+    currency of an FX pair, which is valued through the pair's own price.
+    """
+
+    def __init__(self, positions: List[Dict[str, Any]], fx_rates: Optional[Dict[str, float]] = None):
+        fx_rates = fx_rates or {}
+        self.symbols = np.array([p['symbol'] for p in positions], dtype=object)
+        self.sec_types = np.array([p.get('sec_type', 'STK') for p in positions], dtype=object)
+        self.currencies = np.array([p.get('currency', 'USD') for p in positions], dtype=object)
+        self.quantity = np.array([p.get('quantity', 0.0) for p in positions], dtype=np.float64)
+        self.market_value = np.array([p.get('market_value') or 0.0 for p in positions], dtype=np.float64)
+
+        is_fx = self.sec_types == 'CASH'
+        self.is_fx = is_fx
+        self.lots = np.where(is_fx, np.abs(self.quantity) / FX_LOT_SIZE, np.abs(self.quantity))
+
+        # price in the quote currency, from the market value where the gateway gave none
+        price = np.array([p.get('market_price') or 0.0 for p in positions], dtype=np.float64)
+        derived = np.divide(self.market_value, self.quantity, out=np.zeros(len(positions)),
+                            where=self.quantity != 0)
+        self.price = np.where(price > 0, price, derived)
+
+        # quote currency -> base currency, and the same for an FX pair's base currency
+        self.fx_rate = np.array([fx_rates.get(c, 1.0) for c in self.currencies], dtype=np.float64)
+        self.pair_bases = np.array([s[:3] if fx else c for s, c, fx in zip(self.symbols, self.currencies, is_fx)],
+                                   dtype=object)
+        known = np.array([fx_rates.get(c, np.nan) for c in self.pair_bases], dtype=np.float64)
+        self.pair_base_rate = np.where(np.isnan(known), self.price * self.fx_rate, known)
+
+        self.base_value = self.market_value * self.fx_rate
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+class ConceptIndex:
+    """
+    Description token -> hedge-only concept ids, rebuilt only when the graph version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = object()
+        self._hedge_only: Dict[str, List[str]] = {}
+
+    def hedge_only(self, graph) -> Dict[str, List[str]]:
+        with self._lock:
+            if graph.version != self._version or graph.version is None:
+                hedge_ids = graph.name_tokens.get("hedge-only", set())
+                self._hedge_only = {token: sorted(ids & hedge_ids)
+                                    for token, ids in graph.description_tokens.items() if ids & hedge_ids}
+                self._version = graph.version
+            return self._hedge_only
+
+
+_concepts = ConceptIndex()
+
+
+def currency_exposure(book: PositionBook) -> Dict[str, float]:
+    """
+    Net exposure per currency, valued in the account's base currency. An FX pair
+    is long ``quantity`` units of its base currency and short ``quantity * price``
+    units of its quote currency; anything else counts its market value in its
+    own currency.
+    """
+    if not len(book):
+        return {}
+    fx = book.is_fx
+    legs = np.concatenate([book.pair_bases, book.currencies[fx]])
+    values = np.concatenate([
+        np.where(fx, book.quantity * book.pair_base_rate, book.base_value),
+        -book.quantity[fx] * book.price[fx] * book.fx_rate[fx],
+    ])
+    names, inverse = np.unique(legs.astype(str), return_inverse=True)
+    totals = np.bincount(inverse, weights=values, minlength=len(names))
+    return {str(name): round(float(total), 2) for name, total in zip(names, totals)}
+
+
+def assess(positions: List[Dict[str, Any]], drawdown: float, graph=None,
+           limits: Optional[Dict[str, Optional[float]]] = None,
+           fx_rates: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Run every risk check over the book.
+
+    Args:
+        positions: Position dicts with symbol, sec_type, currency, quantity,
+            market_value and optionally market_price, both in ``currency``
+        drawdown: Current drawdown percentage
+        graph: Optional KnowledgeGraph used for hedge-only zone flags
+        limits: Limits overriding RISK_LIMITS
+        fx_rates: Currency -> value of one unit in the account's base currency
+
+    Returns:
+        Dict[str, Any]: exposure (symbol -> lots), gross, net, currency_exposure,
+        concentration, hhi, breaches, alerts, flags and the limits used. Every
+        amount is in the account's base currency
+    """
+    limits = dict(RISK_LIMITS, **(limits or {}))
+    book = PositionBook(positions, fx_rates)
+
+    abs_value = np.abs(book.base_value)
+    gross = float(abs_value.sum())
+    net = float(book.base_value.sum())
+    shares = abs_value / gross if gross > 0 else np.zeros(len(book))
+    by_currency = currency_exposure(book)
+
+    breaches = []
+    if limits["max_lots_per_symbol"] is not None:
+        for i in np.flatnonzero(book.lots > limits["max_lots_per_symbol"]):
+            breaches.append({"kind": "lots", "symbol": book.symbols[i], "value": round(float(book.lots[i]), 2),
+                             "limit": limits["max_lots_per_symbol"]})
+    if limits["max_concentration"] is not None and len(book) > 1:
+        for i in np.flatnonzero(shares > limits["max_concentration"]):
+            breaches.append({"kind": "concentration", "symbol": book.symbols[i], "value": round(float(shares[i]), 3),
+                             "limit": limits["max_concentration"]})
+    if limits["max_gross_exposure"] is not None and gross > limits["max_gross_exposure"]:
+        breaches.append({"kind": "gross", "symbol": None, "value": round(gross, 2),
+                         "limit": limits["max_gross_exposure"]})
+    if limits["max_currency_exposure"] is not None:
+        for currency, value in by_currency.items():
+            if abs(value) > limits["max_currency_exposure"]:
+                breaches.append({"kind": "currency", "symbol": currency, "value": value,
+                                 "limit": limits["max_currency_exposure"]})
+    drawdown_breached = limits["max_drawdown_pct"] is not None and drawdown > limits["max_drawdown_pct"]
+
+    alerts = []
+    for breach in breaches:
+        if breach["kind"] == "lots":
+            alerts.append(f"⚠️ High exposure on {breach['symbol']}: {breach['value']} lots")
+        elif breach["kind"] == "concentration":
+            alerts.append(f"⚠️ {breach['symbol']} is {breach['value']:.0%} of gross exposure")
+        elif breach["kind"] == "gross":
+            alerts.append(f"⚠️ Gross exposure {breach['value']:,.0f} above limit {breach['limit']:,.0f}")
+        else:
+            alerts.append(f"⚠️ Net {breach['symbol']} exposure {breach['value']:,.0f} above limit")
+
+    flags = []
+    if graph is not None and len(book):
+        hedge_only = _concepts.hedge_only(graph)
+        lower = np.array([s.lower() for s in book.symbols], dtype=object)
+        in_zone = np.isin(lower, np.array(list(hedge_only), dtype=object))
+        flags.extend(f"🔒 {symbol} is in a hedge-only zone — review your open trade." for symbol in book.symbols[in_zone])
+    if drawdown_breached:
+        flags.extend(f"🚨 Portfolio drawdown at {drawdown}% — check if {symbol} position needs DCT adjustment"
+                     for symbol in book.symbols)
+
+    return {
+        "exposure": {str(s): round(float(l), 2) for s, l in zip(book.symbols, book.lots)},
+        "gross": round(gross, 2),
+        "net": round(net, 2),
+        "currency_exposure": by_currency,
+        "concentration": {str(s): round(float(x), 3) for s, x in zip(book.symbols, shares)},
+        "hhi": round(float(np.square(shares).sum()), 3),
+        "breaches": breaches,
+        "drawdown_breached": drawdown_breached,
+        "alerts": alerts,
+        "flags": flags,
+        "limits": limits,
+    }
@@ -0,0 +1,254 @@
+"""
+Single-pass matcher for checking trade plans against the strategy rulebook.
+
+Rules and concepts from the graph files, plus the built-in plan checks, are
+compiled into one word trie. Matching walks the plan's words once, so the cost
+depends on the length of the text rather than the number of rules. Terms only
+match whole words, so "sl" no longer fires inside "slow". The compiled matcher
+is cached and rebuilt only when the graph files change.
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from graph_loader import get_graph
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+SUFFIXES = ("ations", "ation", "ing", "ed", "es", "s", "e")
+STOPWORDS = {
+    "a", "about", "above", "accordingly", "after", "all", "also", "an", "and", "any", "are", "as", "at",
+    "be", "before", "being", "below", "between", "but", "by", "can", "do", "does", "during", "each",
+    "early", "for", "from", "has", "have", "if", "in", "into", "is", "it", "its", "like", "level", "more",
+    "most", "new", "no", "not", "of", "often", "on", "only", "or", "other", "over", "should", "so",
+    "some", "such", "than", "that", "the", "their", "then", "there", "these", "they", "this", "to",
+    "trade", "trades", "trading", "under", "up", "using", "when", "where", "which", "while", "with",
+    "within",
+}
+# Distinct keywords a rule or concept needs before it matches on keywords alone
+MIN_KEYWORD_HITS = 2
+
+# Checks that used to be hard-coded in check_plan; terms here match on their own
+BUILTIN_CONCEPTS = [
+    {"id": "builtin:risk-management", "name": "Risk Management",
+     "description": "Proper position sizing and stop loss placement",
+     "terms": ["risk", "stop", "sl"]},
+    {"id": "builtin:technical-analysis", "name": "Technical Analysis",
+     "description": "Using price levels and market structure",
+     "terms": ["trend", "support", "resistance", "level"]},
+]
+BUILTIN_RULES = [
+    {"id": "builtin:position-size", "rule": "Position size should not exceed 2% of portfolio value",
+     "terms": ["risk"]},
+    {"id": "builtin:stop-loss", "rule": "Always set a stop loss before entering a trade",
+     "terms": ["stop", "sl"]},
+    {"id": "builtin:take-profit", "rule": "Define take profit levels based on market structure",
+     "terms": ["target", "tp"]},
+]
+# Feedback fires when any of ``terms`` is present (or no terms are given)
+# and none of ``absent`` is
+FEEDBACK = [
+    {"message": "⚠️ No mention of structure. Are you entering before the break?",
+     "absent": ["structure"]},
+    {"message": "💡 Bias mentioned — consider waiting for confirmation.",
+     "terms": ["bias"], "absent": ["confirmation"]},
+    {"message": "✅ Hedge logic detected — check confluence or invalidation levels.",
+     "terms": ["hedge"]},
+    {"message": "✅ DCT logic mentioned — ensure it aligns with portfolio risk.",
+     "terms": ["damage control", "dct"]},
+]
+
+
+def stem(word: str) -> str:
+    """
+    Strip one common English suffix so 'confirming' and 'confirmation' compare equal.
+    """
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def words(text: str) -> List[str]:
+    """
+    Lowercase, stemmed words of ``text``; hyphenated words are split into parts.
+    """
+    return [stem(w) for w in WORD_RE.findall(str(text).lower())]
+
+
+def keywords(text: str) -> Set[str]:
+    """
+    Distinctive stemmed words of ``text``, without stopwords and very short words.
+    """
+    return {stem(w) for w in WORD_RE.findall(str(text).lower()) if w not in STOPWORDS and len(w) > 2}
+
+
+def acronym(name: str) -> Optional[str]:
+    """
+    Initials of a multi-word name, e.g. 'Damage Control Trading' -> 'dct'.
+    """
+    parts = WORD_RE.findall(str(name).lower())
+    return "".join(p[0] for p in parts) if len(parts) >= 3 else None
+
+
+class RuleMatcher:
+    """
+    Word trie over every term in the rulebook. Each term maps to the targets it
+    supports, either strongly (the term alone is enough) or as one keyword.
+    """
+
+    def __init__(self, concepts: Iterable[Dict[str, Any]] = (), rules: Iterable[Dict[str, Any]] = (),
+                 feedback: Iterable[Dict[str, Any]] = FEEDBACK, version: Any = None):
+        self.version = version
+        self.concepts: List[Dict[str, Any]] = []
+        self.rules: List[Dict[str, Any]] = []
+        self.feedback = list(feedback)
+
+        self._trie: Dict[str, Any] = {}
+        self._max_depth = 0
+        # term -> [(kind, index, strong)]
+        self._targets: Dict[Tuple[str, ...], List[Tuple[str, int, bool]]] = {}
+        self._needs: Dict[Tuple[str, int], int] = {}
+        # rule index -> concept index it applies to
+        self._applies_to: Dict[int, int] = {}
+
+        concept_index = {}
+        for concept in concepts:
+            i = len(self.concepts)
+            self.concepts.append({"name": concept.get("name", ""), "description": concept.get("description", "")})
+            concept_index[concept.get("id", concept.get("name"))] = i
+            self._add_entry("concept", i, concept)
+
+        for rule in rules:
+            i = len(self.rules)
+            self.rules.append({"rule": rule.get("rule", "")})
+            if rule.get("applies_to") in concept_index:
+                self._applies_to[i] = concept_index[rule["applies_to"]]
+            self._add_entry("rule", i, rule)
+
+        # (message, any-of terms, none-of terms)
+        self._feedback = []
+        for item in self.feedback:
+            terms = {tuple(words(t)) for t in item.get("terms", ())}
+            absent = {tuple(words(t)) for t in item.get("absent", ())}
+            for term in item.get("terms", []) + item.get("absent", []):
+                self._add_term(term)
+            self._feedback.append((item["message"], terms, absent))
+
+    def _add_entry(self, kind: str, index: int, item: Dict[str, Any]) -> None:
+        if "terms" in item:
+            # built-in entries list their own trigger terms
+            for term in item["terms"]:
+                self._add_term(term, (kind, index, True))
+            return
+
+        text = item.get("name", "") if kind == "concept" else item.get("rule", "")
+        if kind == "concept":
+            self._add_term(text, (kind, index, True))
+            initials = acronym(text)
+            if initials:
+                self._add_term(initials, (kind, index, True))
+        found = keywords(text)
+        for word in found:
+            self._add_term(word, (kind, index, False))
+        self._needs[(kind, index)] = min(MIN_KEYWORD_HITS, len(found))
+
+    def _add_term(self, term: str, target: Optional[Tuple[str, int, bool]] = None) -> None:
+        key = tuple(words(term))
+        if not key:
+            return
+        if key not in self._targets:
+            node = self._trie
+            for word in key:
+                node = node.setdefault(word, {})
+            node[None] = key
+            self._max_depth = max(self._max_depth, len(key))
+            self._targets[key] = []
+        if target is not None:
+            self._targets[key].append(target)
+
+    def scan(self, text: str) -> Set[Tuple[str, ...]]:
+        """
+        Every rulebook term present in ``text``, found in one pass over its words.
+        """
+        seq = words(text)
+        found = set()
+        for start in range(len(seq)):
+            node = self._trie
+            for word in seq[start:start + self._max_depth]:
+                node = node.get(word)
+                if node is None:
+                    break
+                if None in node:
+                    found.add(node[None])
+        return found
+
+    def match(self, text: str) -> Dict[str, Any]:
+        """
+        Check a plan or journal entry against the rulebook.
+
+        Args:
+            text: Free text to check
+
+        Returns:
+            Dict[str, Any]: Matched 'rules' and 'concepts', 'feedback' messages
+            and the 'terms' that were found
+        """
+        found = self.scan(text)
+
+        strong = set()
+        keyword_hits = defaultdict(set)
+        for term in found:
+            for kind, index, is_strong in self._targets[term]:
+                if is_strong:
+                    strong.add((kind, index))
+                else:
+                    keyword_hits[(kind, index)].add(term)
+        for target, hits in keyword_hits.items():
+            if len(hits) >= self._needs[target]:
+                strong.add(target)
+
+        concepts = sorted(i for kind, i in strong if kind == "concept")
+        matched_concepts = set(concepts)
+        rules = sorted({i for kind, i in strong if kind == "rule"} |
+                       {r for r, c in self._applies_to.items() if c in matched_concepts})
+
+        feedback = [message for message, terms, absent in self._feedback
+                    if (not terms or terms & found) and not absent & found]
+
+        return {
+            "rules": [self.rules[i] for i in rules],
+            "concepts": [self.concepts[i] for i in concepts],
+            "feedback": feedback,
+            "terms": sorted(" ".join(t) for t in found),
+        }
+
+
+_matcher_lock = threading.Lock()
+_cached_matcher: Optional[RuleMatcher] = None
+
+
+def get_matcher() -> RuleMatcher:
+    """
+    Return the compiled matcher, rebuilding it only when the graph has changed.
+    A graph that failed to load leaves only the built-in checks.
+    """
+    global _cached_matcher
+    graph = get_graph()
+    matcher = _cached_matcher
+    if matcher is not None and matcher.version == graph.version and graph.version is not None:
+        return matcher
+
+    with _matcher_lock:
+        matcher = _cached_matcher
+        if matcher is not None and matcher.version == graph.version and graph.version is not None:
+            return matcher
+        matcher = RuleMatcher(
+            concepts=BUILTIN_CONCEPTS + graph.concepts,
+            rules=BUILTIN_RULES + graph.rules,
+            version=graph.version
+        )
+        if not graph.error:
+            _cached_matcher = matcher
+        return matcher
@@ -0,0 +1,166 @@
+"""
+Cached scanner parameters for the /scanner page.
+
+``/iserver/scanner/params`` is a very large document that rarely changes, so it is
+downloaded once, indexed into the maps the scanner template needs, kept in memory
+with a long TTL and refreshed in the background before it expires. The raw
+document is also saved to disk so a restart does not have to download it again.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from gateway_client import GatewayClient, gateway
+
+SCANNER_PARAMS_TTL = float(os.getenv('SCANNER_PARAMS_TTL', str(6 * 3600)))  # seconds
+# Start a background refresh once this fraction of the TTL has passed
+SCANNER_REFRESH_AHEAD = 0.8
+# Set SCANNER_PARAMS_CACHE_FILE to an empty string to disable the disk copy
+SCANNER_PARAMS_CACHE_FILE = os.getenv(
+    'SCANNER_PARAMS_CACHE_FILE', str(Path(__file__).resolve().parent / "scanner_params.json")
+)
+
+
+class ScannerIndex:
+    """
+    Scanner params plus the lookup maps derived from them.
+    """
+
+    def __init__(self, params: Dict[str, Any], fetched_at: float):
+        self.params = params
+        self.fetched_at = fetched_at
+        self.scanner_map: Dict[str, Dict] = {}
+        self.filter_map: Dict[str, Dict] = {}
+
+        for item in params.get('instrument_list', []):
+            self.scanner_map[item['type']] = {
+                "display_name": item['display_name'],
+                "filters": item['filters'],
+                "sorts": []
+            }
+
+        for item in params.get('filter_list', []):
+            self.filter_map[item['group']] = {
+                "display_name": item['display_name'],
+                "type": item['type'],
+                "code": item['code']
+            }
+
+        for item in params.get('scan_type_list', []):
+            for instrument in item['instruments']:
+                if instrument in self.scanner_map:
+                    self.scanner_map[instrument]['sorts'].append({
+                        "name": item['display_name'],
+                        "code": item['code']
+                    })
+
+        for item in params.get('location_tree', []):
+            if item['type'] in self.scanner_map:
+                self.scanner_map[item['type']]['locations'] = item['locations']
+
+        # The template embeds both maps as JS objects; serialise them once here
+        self.scanner_map_json = json.dumps(self.scanner_map)
+        self.filter_map_json = json.dumps(self.filter_map)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class ScannerParamsCache:
+    """
+    Holds the current ``ScannerIndex`` and keeps it fresh.
+    """
+
+    def __init__(self, client: GatewayClient = gateway, ttl: float = SCANNER_PARAMS_TTL,
+                 cache_file: Optional[str] = SCANNER_PARAMS_CACHE_FILE):
+        self.client = client
+        self.ttl = ttl
+        self.cache_file = Path(cache_file) if cache_file else None
+        self._index: Optional[ScannerIndex] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._loaded_from_disk = False
+
+    def _load_from_disk(self) -> Optional[ScannerIndex]:
+        if self.cache_file is None or not self.cache_file.exists():
+            return None
+        try:
+            with open(self.cache_file, 'r') as f:
+                stored = json.load(f)
+            return ScannerIndex(stored['params'], float(stored['fetched_at']))
+        except Exception as e:
+            print(f"Error reading scanner params cache {self.cache_file}: {e}")
+            return None
+
+    def _save_to_disk(self, index: ScannerIndex) -> None:
+        if self.cache_file is None:
+            return
+        try:
+            tmp_path = self.cache_file.with_suffix(self.cache_file.suffix + ".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({"fetched_at": index.fetched_at, "params": index.params}, f)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"Error saving scanner params cache {self.cache_file}: {e}")
+
+    def _fetch(self) -> ScannerIndex:
+        params = self.client.get_json("/iserver/scanner/params", default={})
+        if not isinstance(params, dict) or 'error' in params or not params:
+            error = params.get('error') if isinstance(params, dict) else None
+            raise RuntimeError(error or "empty scanner params response")
+        index = ScannerIndex(params, time.time())
+        self._save_to_disk(index)
+        return index
+
+    def _refresh_in_background(self) -> None:
+        try:
+            index = self._fetch()
+            with self._lock:
+                self._index = index
+        except Exception as e:
+            print(f"Background scanner params refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self) -> ScannerIndex:
+        """
+        Return the current index, downloading it only when nothing fresh is cached.
+        Data close to expiry is served while a background refresh runs, and expired
+        data is still served if the gateway cannot provide a new copy.
+
+        Raises:
+            RuntimeError: If the params cannot be fetched and nothing is cached
+        """
+        with self._lock:
+            if self._index is None and not self._loaded_from_disk:
+                self._loaded_from_disk = True
+                self._index = self._load_from_disk()
+            index = self._index
+            if index is not None and index.age < self.ttl:
+                if index.age >= self.ttl * SCANNER_REFRESH_AHEAD and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return index
+
+        try:
+            fresh = self._fetch()
+        except Exception:
+            if index is None:
+                raise
+            return index
+        with self._lock:
+            self._index = fresh
+        return fresh
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+
+
+scanner_params = ScannerParamsCache()
@@ -1,4 +1,15 @@
+import hashlib
+import json
+import os
+import re
+import time
 import openai
+import metrics
+from singleflight import SingleFlight
+from ttl_cache import TTLCache
+
+SENTIMENT_TTL = float(os.getenv('SENTIMENT_TTL', '900'))  # seconds
+SENTIMENT_CACHE_SIZE = int(os.getenv('SENTIMENT_CACHE_SIZE', '256'))
 
 # Replace this with real headlines from an API in future
 def get_mock_headlines(pair):
@@ -8,6 +19,15 @@ def get_mock_headlines(pair):
         f"{pair}: Traders await Powell speech on rate outlook"
     ]
 
+_openai_client = None
+
+def _chat_completion(**kwargs):
+    # the client reads OPENAI_API_KEY when created, so create it on first use
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.OpenAI()
+    return _openai_client.chat.completions.create(**kwargs)
+
 def analyze_sentiment_with_gpt(headlines):
     joined = "\n".join(headlines)
     prompt = (
@@ -18,7 +38,7 @@ def analyze_sentiment_with_gpt(headlines):
     )
 
     try:
-        response = openai.ChatCompletion.create(
+        response = _chat_completion(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=100,
@@ -33,16 +53,198 @@ def analyze_sentiment_with_gpt(headlines):
             "source": "Mock GPT Analysis"
         }
     except Exception as e:
+        return _error_result(e)
+
+def analyze_sentiment_batch_with_gpt(headlines_by_pair):
+    """
+    Score several pairs with a single model call.
+
+    Args:
+        headlines_by_pair: Dictionary mapping pair -> list of headlines
+
+    Returns:
+        dict: pair -> sentiment result, in the same shape as analyze_sentiment_with_gpt
+    """
+    sections = []
+    for pair, headlines in headlines_by_pair.items():
+        sections.append(f"[{pair}]\n" + "\n".join(headlines))
+    prompt = (
+        "For each currency pair below, is the sentiment of its headlines bullish, "
+        "bearish, or neutral for the quote currency?\n\n"
+        + "\n\n".join(sections) +
+        "\n\nRespond only with a JSON object mapping each pair to "
+        '{"sentiment": "Bullish" | "Bearish" | "Neutral", "summary": "<one-line justification>"}.'
+    )
+
+    try:
+        response = _chat_completion(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=60 * len(headlines_by_pair) + 40,
+            temperature=0.5
+        )
+        content = response.choices[0].message.content.strip()
+        parsed = json.loads(content[content.index("{"):content.rindex("}") + 1])
+        results = {}
+        for pair in headlines_by_pair:
+            item = parsed.get(pair) or parsed.get(pair.upper()) or {}
+            if not item:
+                results[pair] = _error_result(f"no result for {pair} in batch response")
+                continue
+            results[pair] = {
+                "sentiment": str(item.get("sentiment", "Neutral")).strip(),
+                "summary": str(item.get("summary", "")).strip(),
+                "confidence": 0.85,
+                "source": "Mock GPT Analysis"
+            }
+        return results
+    except Exception as e:
+        return {pair: _error_result(e) for pair in headlines_by_pair}
+
+def _error_result(e):
+    return {
+        "sentiment": "Neutral",
+        "summary": f"Error analyzing sentiment: {e}",
+        "confidence": 0.0,
+        "source": "Error"
+    }
+
+
+class OpenAIBackend:
+    """
+    Scores headlines with the OpenAI chat API.
+    """
+    name = "openai"
+
+    def score(self, headlines):
+        return analyze_sentiment_with_gpt(headlines)
+
+    def score_batch(self, headlines_by_pair):
+        return analyze_sentiment_batch_with_gpt(headlines_by_pair)
+
+
+class LocalBackend:
+    """
+    Offline stand-in for the LLM: a keyword lexicon score with an optional
+    artificial delay, so caching and batching can be exercised and benchmarked
+    without network access or API spend.
+    """
+    name = "local"
+
+    BULLISH = {"stronger", "strong", "beats", "rally", "hawkish", "rises", "gains", "surge", "higher"}
+    BEARISH = {"softens", "weaker", "weak", "misses", "cautious", "dovish", "falls", "slump", "lower"}
+
+    def __init__(self, latency=None):
+        if latency is None:
+            latency = float(os.getenv('SENTIMENT_LOCAL_LATENCY', '0'))
+        self.latency = latency
+        self.calls = 0
+
+    def _score_one(self, headlines):
+        words = re.findall(r"[a-z]+", " ".join(headlines).lower())
+        score = sum(w in self.BULLISH for w in words) - sum(w in self.BEARISH for w in words)
+        sentiment = "Bullish" if score > 0 else "Bearish" if score < 0 else "Neutral"
         return {
-            "sentiment": "Neutral",
-            "summary": f"Error analyzing sentiment: {e}",
-            "confidence": 0.0,
-            "source": "Error"
+            "sentiment": sentiment,
+            "summary": f"Keyword score {score:+d} across {len(headlines)} headlines.",
+            "confidence": min(1.0, 0.5 + 0.1 * abs(score)),
+            "source": "Local Lexicon"
         }
 
-def get_live_sentiment(pair):
-    headlines = get_mock_headlines(pair)
-    sentiment_data = analyze_sentiment_with_gpt(headlines)
+    def score(self, headlines):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._score_one(headlines)
+
+    def score_batch(self, headlines_by_pair):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {pair: self._score_one(h) for pair, h in headlines_by_pair.items()}
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+_backend = BACKENDS.get(os.getenv('SENTIMENT_BACKEND', 'openai'), OpenAIBackend)()
+_cache = TTLCache(maxsize=SENTIMENT_CACHE_SIZE, default_ttl=SENTIMENT_TTL)
+_in_flight = SingleFlight()
+metrics.register_cache("sentiment", _cache)
+
+def set_backend(backend):
+    """
+    Swap the scoring backend (anything with score/score_batch) and drop cached results.
+    """
+    global _backend
+    _backend = backend
+    _cache.clear()
+
+def get_backend():
+    return _backend
+
+def _cache_key(pair, headlines):
+    digest = hashlib.sha1("\n".join(headlines).encode("utf-8")).hexdigest()
+    return (pair.upper(), digest)
+
+def _finish(pair, headlines, result):
+    sentiment_data = dict(result)
     sentiment_data["headlines"] = headlines
     sentiment_data["pair"] = pair.upper()
-    return sentiment_data 
\ No newline at end of file
+    return sentiment_data
+
+def _score_and_cache(key, headlines):
+    start = time.perf_counter()
+    result = _backend.score(headlines)
+    # backends report failures as an "Error" result instead of raising
+    metrics.observe_upstream("llm", f"{_backend.name}.score", time.perf_counter() - start,
+                             error=result.get("source") == "Error")
+    # errors are not cached so the next view retries
+    if result.get("source") != "Error":
+        _cache.set(key, result)
+    return result
+
+def get_live_sentiment(pair):
+    # same normalisation as the batch path so both share cache entries
+    pair = pair.upper()
+    headlines = get_mock_headlines(pair)
+    key = _cache_key(pair, headlines)
+    result = _cache.get(key)
+    if result is None:
+        # concurrent views of the same pair share one backend call
+        result = _in_flight.do(key, lambda: _score_and_cache(key, headlines))
+    return _finish(pair, headlines, result)
+
+def get_live_sentiment_batch(pairs):
+    """
+    Sentiment for many pairs. Cached pairs are answered from memory and the rest
+    are scored together in a single backend call.
+
+    Returns:
+        dict: pair (upper case) -> sentiment data as returned by get_live_sentiment
+    """
+    headlines_by_pair = {}
+    results = {}
+    for pair in pairs:
+        pair = pair.upper()
+        headlines = get_mock_headlines(pair)
+        cached = _cache.get(_cache_key(pair, headlines))
+        if cached is None:
+            headlines_by_pair[pair] = headlines
+        else:
+            results[pair] = _finish(pair, headlines, cached)
+
+    if headlines_by_pair:
+        start = time.perf_counter()
+        scored = _backend.score_batch(headlines_by_pair)
+        metrics.observe_upstream("llm", f"{_backend.name}.score_batch", time.perf_counter() - start,
+                                 error=any(r.get("source") == "Error" for r in scored.values()) or not scored)
+        for pair, headlines in headlines_by_pair.items():
+            result = scored.get(pair) or _error_result(f"no result for {pair}")
+            if result.get("source") != "Error":
+                _cache.set(_cache_key(pair, headlines), result)
+            results[pair] = _finish(pair, headlines, result)
+
+    return {pair.upper(): results[pair.upper()] for pair in pairs}
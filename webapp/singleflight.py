@@ -0,0 +1,71 @@
+"""
+Single-flight call coalescing: concurrent callers asking for the same key share
+one in-flight call and its result instead of each doing the work.
+"""
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key. Results are not cached: once the
+    in-flight call finishes, the next caller starts a fresh one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared = 0  # calls answered by another caller's in-flight request
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run ``fn`` unless a call for ``key`` is already running, in which case wait
+        for it and return (or raise) its outcome.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def coalesced(flight: SingleFlight) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator: concurrent calls with the same arguments share one call through ``flight``.
+    Arguments must be hashable. Callers receive the same result object, so don't mutate it.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            return flight.do(key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
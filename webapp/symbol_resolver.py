@@ -0,0 +1,204 @@
+"""
+Symbol -> conid resolution against the Client Portal gateway.
+
+Exact symbol matches are remembered in a small JSON file next to the webapp so
+that later lookups (watchlist creation, contract building in broker_data) skip
+the gateway entirely. Looser matches are only kept in memory for a while.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from gateway_client import GatewayClient, gateway
+from ttl_cache import TTLCache
+
+SYMBOL_CACHE_FILE = Path(os.getenv(
+    'SYMBOL_CACHE_FILE', Path(__file__).resolve().parent / "symbol_cache.json"
+))
+RESOLVER_WORKERS = int(os.getenv('SYMBOL_RESOLVER_WORKERS', '8'))
+# Seconds a conid picked without an exact symbol match is reused; never persisted
+FALLBACK_TTL = float(os.getenv('SYMBOL_FALLBACK_TTL', '3600'))
+
+
+class SymbolCache:
+    """
+    Persistent symbol -> conid mapping keyed by symbol and security type.
+    The file is read once and rewritten atomically whenever a new mapping is added.
+    """
+
+    def __init__(self, path: Path = SYMBOL_CACHE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def _key(symbol: str, sec_type: str) -> str:
+        return f"{symbol.strip().upper()}:{sec_type.upper()}"
+
+    def _load(self) -> Dict[str, int]:
+        if self._data is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._data = {k: int(v) for k, v in json.load(f).items()}
+            except FileNotFoundError:
+                self._data = {}
+            except Exception as e:
+                print(f"Error reading symbol cache {self.path}: {e}")
+                self._data = {}
+        return self._data
+
+    def get(self, symbol: str, sec_type: str = "STK") -> Optional[int]:
+        with self._lock:
+            return self._load().get(self._key(symbol, sec_type))
+
+    def set_many(self, mappings: Dict[Tuple[str, str], int]) -> None:
+        """
+        Store several (symbol, sec_type) -> conid mappings with a single file write.
+        """
+        with self._lock:
+            data = self._load()
+            changed = False
+            for (symbol, sec_type), conid in mappings.items():
+                key = self._key(symbol, sec_type)
+                if data.get(key) != int(conid):
+                    data[key] = int(conid)
+                    changed = True
+            if not changed:
+                return
+            try:
+                tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Error saving symbol cache {self.path}: {e}")
+
+    def set(self, symbol: str, sec_type: str, conid: int) -> None:
+        self.set_many({(symbol, sec_type): conid})
+
+
+class SymbolResolver:
+    """
+    Resolves symbols to conids with a bounded pool of concurrent
+    ``/iserver/secdef/search`` calls, consulting the persistent cache first.
+    """
+
+    def __init__(self, client: GatewayClient = gateway, cache: Optional[SymbolCache] = None,
+                 max_workers: int = RESOLVER_WORKERS):
+        self.client = client
+        self.cache = cache or SymbolCache()
+        self.max_workers = max_workers
+        # (symbol, sec_type) -> conid for lookups that fell back to the first hit
+        self.fallbacks = TTLCache(maxsize=1024, default_ttl=FALLBACK_TTL)
+
+    @staticmethod
+    def _pick_conid(symbol: str, results: List[Dict], exact_only: bool = False) -> Optional[int]:
+        # Prefer an exact symbol match, otherwise take the gateway's first hit
+        for item in results:
+            if str(item.get('symbol', '')).upper() == symbol.upper() and item.get('conid'):
+                return int(item['conid'])
+        if exact_only:
+            return None
+        for item in results:
+            if item.get('conid'):
+                return int(item['conid'])
+        return None
+
+    def search(self, symbol: str, sec_type: Optional[str] = None) -> List[Dict]:
+        """
+        Run a secdef search and remember the best matching conid.
+
+        Args:
+            symbol: Symbol or company name to search for
+            sec_type: Optional security type filter (e.g. 'STK')
+
+        Returns:
+            List[Dict]: Raw search results from the gateway
+        """
+        params = {"symbol": symbol, "name": "true"}
+        if sec_type:
+            params["secType"] = sec_type
+        results = self.client.get_json("/iserver/secdef/search", default=[], params=params)
+        if not isinstance(results, list):
+            return []
+        # Name searches can match loosely, so only remember exact symbol hits
+        conid = self._pick_conid(symbol, results, exact_only=True)
+        if conid is not None:
+            self.cache.set(symbol, sec_type or "STK", conid)
+        return results
+
+    def _lookup(self, symbol: str, sec_type: str) -> Tuple[int, bool]:
+        # returns (conid, whether it is an exact symbol match)
+        params = {"symbol": symbol, "name": "true", "secType": sec_type}
+        results = self.client.get_json("/iserver/secdef/search", default=[], params=params)
+        if isinstance(results, dict) and 'error' in results:
+            raise LookupError(results['error'])
+        results = results if isinstance(results, list) else []
+        conid = self._pick_conid(symbol, results, exact_only=True)
+        if conid is not None:
+            return conid, True
+        conid = self._pick_conid(symbol, results)
+        if conid is None:
+            raise LookupError("no matching contract")
+        return conid, False
+
+    def resolve(self, symbols: Iterable[str], sec_type: str = "STK") -> Tuple[Dict[str, int], Dict[str, str]]:
+        """
+        Resolve many symbols at once.
+
+        Args:
+            symbols: Symbols to resolve; blanks and duplicates are ignored
+            sec_type: Security type used for the search and the cache key
+
+        Returns:
+            Tuple[Dict[str, int], Dict[str, str]]: (symbol -> conid in input order,
+            symbol -> error message for every symbol that could not be resolved)
+        """
+        ordered = []
+        for symbol in symbols:
+            symbol = symbol.strip().upper()
+            if symbol and symbol not in ordered:
+                ordered.append(symbol)
+
+        found: Dict[str, int] = {}
+        missing = []
+        for symbol in ordered:
+            conid = self.cache.get(symbol, sec_type)
+            if conid is None:
+                conid = self.fallbacks.get((symbol, sec_type))
+            if conid is not None:
+                found[symbol] = conid
+            else:
+                missing.append(symbol)
+
+        failures: Dict[str, str] = {}
+        if missing:
+            workers = max(1, min(self.max_workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {symbol: pool.submit(self._lookup, symbol, sec_type) for symbol in missing}
+            exact = {}
+            for symbol, future in futures.items():
+                try:
+                    conid, is_exact = future.result()
+                except Exception as e:
+                    failures[symbol] = str(e)
+                    continue
+                found[symbol] = conid
+                if is_exact:
+                    exact[(symbol, sec_type)] = conid
+                else:
+                    # the first hit may be the wrong contract; don't make it permanent
+                    self.fallbacks.set((symbol, sec_type), conid)
+            if exact:
+                self.cache.set_many(exact)
+
+        resolved = {symbol: found[symbol] for symbol in ordered if symbol in found}
+        return resolved, failures
+
+
+symbol_cache = SymbolCache()
+resolver = SymbolResolver(cache=symbol_cache)
@@ -0,0 +1,226 @@
+"""
+Append-only trade journal stored as JSON Lines.
+
+Every trade is written once as a ``trade`` record and later changes (IB order
+details, errors, status changes) are written as ``update`` records for the same
+id, so logging a trade costs one small append regardless of how long the
+journal is. ``compact`` folds updates back into their trades and ``export``
+writes the legacy ``trade_log.json`` array format.
+
+Usage:
+    python trade_journal.py compact
+    python trade_journal.py export trade_log.json
+    python trade_journal.py import trade_log.json
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+TRADE_JOURNAL_FILE = Path(os.getenv(
+    'TRADE_JOURNAL_FILE', Path(__file__).resolve().parent / "trade_journal.jsonl"
+))
+# 'always' fsyncs every record, 'interval' at most once per TRADE_JOURNAL_FSYNC_INTERVAL
+# seconds (records written in between are synced by a timer once the interval
+# has passed), 'never' leaves flushing to the OS
+TRADE_JOURNAL_FSYNC = os.getenv('TRADE_JOURNAL_FSYNC', 'interval')
+TRADE_JOURNAL_FSYNC_INTERVAL = float(os.getenv('TRADE_JOURNAL_FSYNC_INTERVAL', '1.0'))
+
+
+class TradeJournal:
+    """
+    JSON Lines trade journal. Each record is appended with a single ``write`` on
+    an ``O_APPEND`` descriptor, so concurrent writers never interleave or
+    overwrite each other's records.
+    """
+
+    def __init__(self, path: Path = TRADE_JOURNAL_FILE, fsync_policy: str = TRADE_JOURNAL_FSYNC,
+                 fsync_interval: float = TRADE_JOURNAL_FSYNC_INTERVAL):
+        if fsync_policy not in ('always', 'interval', 'never'):
+            raise ValueError(f"Invalid fsync policy: {fsync_policy}. Must be 'always', 'interval' or 'never'")
+        self.path = Path(path)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._last_fsync = 0.0
+        # records written since the last fsync, and the timer that will sync them
+        self._unsynced = False
+        self._sync_timer: Optional[threading.Timer] = None
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            fd = self._open()
+            os.write(fd, line)
+            now = time.monotonic()
+            if self.fsync_policy == 'always' or (
+                    self.fsync_policy == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(fd)
+                self._last_fsync = now
+                self._unsynced = False
+            elif self.fsync_policy == 'interval':
+                self._unsynced = True
+                if self._sync_timer is None:
+                    self._sync_timer = threading.Timer(self._last_fsync + self.fsync_interval - now,
+                                                       self._sync_pending)
+                    self._sync_timer.daemon = True
+                    self._sync_timer.start()
+
+    def _sync_pending(self) -> None:
+        # fsync records left behind by the interval policy once no later write did
+        with self._lock:
+            self._sync_timer = None
+            self._fsync_unsynced()
+
+    def _fsync_unsynced(self) -> None:
+        # called with the lock held
+        if self._unsynced and self._fd is not None:
+            os.fsync(self._fd)
+            self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def log_trade(self, trade_data: Dict[str, Any]) -> str:
+        """
+        Append a new trade.
+
+        Returns:
+            str: Journal id used to attach later updates to this trade
+        """
+        trade_id = uuid.uuid4().hex
+        self._append({"op": "trade", "id": trade_id, "ts": datetime.now().isoformat(), "data": trade_data})
+        return trade_id
+
+    def update(self, trade_id: str, **fields: Any) -> None:
+        """
+        Append fields that supersede the matching keys of an earlier trade.
+        """
+        self._append({"op": "update", "id": trade_id, "ts": datetime.now().isoformat(), "fields": fields})
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield raw journal records in write order, skipping a torn final line.
+        """
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping unreadable trade journal line: {line[:80]}")
+
+    def trades(self) -> List[Dict[str, Any]]:
+        """
+        Fold updates into their trades.
+
+        Returns:
+            List[Dict[str, Any]]: Trades in the order they were logged, each
+            with a ``journal_id`` key
+        """
+        trades: Dict[str, Dict[str, Any]] = {}
+        for record in self.records():
+            if record.get("op") == "trade":
+                trades[record["id"]] = dict(record.get("data", {}), journal_id=record["id"])
+            elif record.get("op") == "update" and record.get("id") in trades:
+                trades[record["id"]].update(record.get("fields", {}))
+        return list(trades.values())
+
+    def get(self, trade_id: str) -> Optional[Dict[str, Any]]:
+        return next((t for t in self.trades() if t["journal_id"] == trade_id), None)
+
+    def compact(self) -> int:
+        """
+        Rewrite the journal with one ``trade`` record per trade. The new file is
+        written beside the journal and swapped in atomically. Appends from other
+        processes made during compaction are lost, so stop the webapp first.
+
+        Returns:
+            int: Number of trades written
+        """
+        with self._lock:
+            trades = self.trades()
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for trade in trades:
+                    data = dict(trade)
+                    trade_id = data.pop("journal_id")
+                    f.write(json.dumps({"op": "trade", "id": trade_id, "ts": data.get("timestamp"),
+                                        "data": data}, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._unsynced = False
+            return len(trades)
+
+    def export_json(self, out_path: str) -> int:
+        """
+        Write all trades as a JSON array (the old trade_log.json format).
+
+        Returns:
+            int: Number of trades written
+        """
+        trades = self.trades()
+        for trade in trades:
+            trade.pop("journal_id", None)
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(trades, f, indent=2, default=str)
+        return len(trades)
+
+    def import_json(self, in_path: str) -> int:
+        """
+        Append every entry of a legacy trade_log.json array as a trade.
+
+        Returns:
+            int: Number of trades imported
+        """
+        with open(in_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        for entry in entries:
+            self.log_trade(entry)
+        return len(entries)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            self._fsync_unsynced()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+journal = TradeJournal()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('compact', 'export', 'import'):
+        print(__doc__)
+        sys.exit(1)
+    command = sys.argv[1]
+    if command == 'compact':
+        print(f"Compacted {journal.compact()} trades into {journal.path}")
+    elif command == 'export':
+        out = sys.argv[2] if len(sys.argv) > 2 else "trade_log.json"
+        print(f"Exported {journal.export_json(out)} trades to {out}")
+    else:
+        src = sys.argv[2] if len(sys.argv) > 2 else "trade_log.json"
+        print(f"Imported {journal.import_json(src)} trades from {src}")